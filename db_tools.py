@@ -0,0 +1,364 @@
+#!/usr/bin/python
+# coding=utf-8
+import argparse
+import logging
+
+import numpy as np
+from sqlalchemy import inspect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import select, and_, bindparam, Executable, ClauseElement
+
+from ml import NGramCodec, Dataset
+from model import DB
+from model.DB import DBError
+from model.objects.Base import Base
+from model.objects.FeatureValue import FeatureValue
+from model.objects.NGramVector import NGramVector
+from model.objects.VersionFeatureVector import VersionFeatureVector, FeatureVectorColumn, encode_feature_vector
+from utils import Config
+from utils.Config import ConfigError
+
+
+def main():
+    cli_args = parse_arguments()
+    try:
+        Config.read_config(cli_args.config_file)
+    except ConfigError:
+        die("Config File %s could not be read correctly! " % cli_args.config_file)
+    logging.basicConfig(level=Config.logging_level.upper(), format=Config.logging_format,
+                        datefmt=Config.logging_date_format)
+    logging.info("Initializing Database")
+    try:
+        DB.init_db()
+    except DBError:
+        die("DB Model could not be created!")
+    cli_args.command(cli_args)
+    logging.info("All done.")
+
+
+def migrate_ngram_vectors(cli_args):
+    """ Converts the text encoded ngram vectors into the compact binary encoding.
+
+    Only vectors without a blob are converted, so the migration can be interrupted and continued at any time.
+    If the ngram_blob column does not exist yet, it is added to the table.
+    """
+    engine = DB.get_engine()
+    add_missing_column(engine, NGramVector.__table__.c.ngram_blob)
+
+    session = DB.create_session()
+    table = NGramVector.__table__
+    query = select([table.c.version_id, table.c.ngram_size, table.c.ngram_level, table.c.ngram_values]). \
+        where(and_(table.c.ngram_blob == None, table.c.ngram_values != None)). \
+        limit(cli_args.batch_size)
+    new_values = {'ngram_blob': bindparam('b_ngram_blob')}
+    if cli_args.drop_text:
+        new_values['ngram_values'] = None
+    update = table.update(). \
+        where(and_(table.c.version_id == bindparam('b_version_id'),
+                   table.c.ngram_size == bindparam('b_ngram_size'),
+                   table.c.ngram_level == bindparam('b_ngram_level'))). \
+        values(**new_values)
+
+    converted_count = 0
+    text_bytes, blob_bytes = 0, 0
+    while True:
+        rows = session.execute(query).fetchall()
+        if not rows:
+            break
+        parameters = []
+        for version_id, ngram_size, ngram_level, ngram_values in rows:
+            ngram_blob = NGramCodec.encode_blob(NGramCodec.decode_text(ngram_values))
+            text_bytes += len(ngram_values)
+            blob_bytes += len(ngram_blob)
+            parameters.append({
+                'b_version_id': version_id,
+                'b_ngram_size': ngram_size,
+                'b_ngram_level': ngram_level,
+                'b_ngram_blob': ngram_blob,
+            })
+        session.execute(update, parameters)
+        session.commit()
+        converted_count += len(rows)
+        logging.info("%i ngram vectors converted." % converted_count)
+
+    if converted_count > 0:
+        logging.info("Ngram vectors shrunk from %i to %i bytes (%.1f%%)." % (
+            text_bytes, blob_bytes, blob_bytes / text_bytes * 100))
+    session.close()
+
+
+def refresh_feature_vectors(cli_args):
+    """ Packs the feature values of each version into one row of the version_feature_vector table.
+
+    Features which are not in the dictionary of the packed vectors yet are appended to it. Only versions without a
+    packed vector and versions with values of newly appended features are packed, so the table can be refreshed
+    incrementally after new versions were analyzed. If the values of already packed versions changed, use --rebuild.
+    """
+    with DB.session_scope() as session:
+        feature_positions, new_feature_ids = update_feature_vector_columns(session)
+        session.commit()
+        if not feature_positions:
+            logging.info("No feature values found.")
+            return
+        if cli_args.rebuild:
+            session.execute(VersionFeatureVector.__table__.delete())
+            session.commit()
+        version_ids = get_outdated_feature_vector_versions(session, new_feature_ids)
+        logging.info("%i feature vectors have to be packed." % len(version_ids))
+
+        for i in range(0, len(version_ids), cli_args.batch_size):
+            batch_version_ids = version_ids[i:i + cli_args.batch_size]
+            pack_feature_vectors(session, batch_version_ids, feature_positions)
+            session.commit()
+            logging.info("%i feature vectors packed." % (i + len(batch_version_ids)))
+
+
+def update_feature_vector_columns(session):
+    """ Appends the features which have values, but are not in the feature vector dictionary yet, to it.
+
+    Args:
+        session (Session): The DB-Session to use.
+
+    Returns:
+        tuple(dict, list[str]): The position of each feature in the dictionary by feature ID, and the IDs of the
+            appended features.
+    """
+    feature_positions = {feature_id: position for feature_id, position in session.execute(
+        select([FeatureVectorColumn.feature_id, FeatureVectorColumn.position]))}
+    feature_ids = [row[0] for row in session.execute(select([FeatureValue.feature_id]).distinct())]
+    new_feature_ids = sorted(feature_id for feature_id in feature_ids if feature_id not in feature_positions)
+    if new_feature_ids:
+        next_position = max(feature_positions.values()) + 1 if feature_positions else 0
+        new_positions = {feature_id: next_position + i for i, feature_id in enumerate(new_feature_ids)}
+        session.execute(FeatureVectorColumn.__table__.insert(),
+                        [{'feature_id': feature_id, 'position': position} for feature_id, position in
+                         new_positions.items()])
+        feature_positions.update(new_positions)
+        logging.info("Added %i features to the feature vector dictionary: %s" % (
+            len(new_feature_ids), ", ".join(new_feature_ids)))
+    return feature_positions, new_feature_ids
+
+
+def get_outdated_feature_vector_versions(session, new_feature_ids):
+    """ Returns the IDs of the versions whose feature values have to be packed.
+
+    These are the versions with feature values, but without a packed feature vector, and the versions with a packed
+    feature vector, but values of features which were just appended to the dictionary.
+
+    Args:
+        session (Session): The DB-Session to use.
+        new_feature_ids (list[str]): The features appended to the dictionary.
+
+    Returns:
+        list[str]: The version IDs, sorted.
+    """
+    vector_table = VersionFeatureVector.__table__
+    query = select([FeatureValue.version_id]). \
+        select_from(FeatureValue.__table__.outerjoin(vector_table,
+                                                     vector_table.c.version_id == FeatureValue.version_id)). \
+        where(vector_table.c.version_id == None). \
+        distinct()
+    version_ids = set(row[0] for row in session.execute(query))
+    if new_feature_ids:
+        query = select([FeatureValue.version_id]). \
+            select_from(FeatureValue.__table__.join(vector_table,
+                                                    vector_table.c.version_id == FeatureValue.version_id)). \
+            where(FeatureValue.feature_id.in_(new_feature_ids)). \
+            distinct()
+        version_ids.update(row[0] for row in session.execute(query))
+    return sorted(version_ids)
+
+
+def pack_feature_vectors(session, version_ids, feature_positions):
+    """ Packs the feature values of versions and replaces their packed feature vectors.
+
+    Args:
+        session (Session): The DB-Session to use.
+        version_ids (list[str]): The IDs of the versions to pack.
+        feature_positions (dict): The position of each feature in the vectors, by feature ID.
+    """
+    vector_size = max(feature_positions.values()) + 1
+    feature_vectors = {version_id: np.full(vector_size, np.nan) for version_id in version_ids}
+    query = select([FeatureValue.version_id, FeatureValue.feature_id, FeatureValue.value]). \
+        where(FeatureValue.version_id.in_(version_ids))
+    for version_id, feature_id, value in session.execute(query):
+        if value is not None:
+            feature_vectors[version_id][feature_positions[feature_id]] = value
+
+    vector_table = VersionFeatureVector.__table__
+    session.execute(vector_table.delete().where(vector_table.c.version_id.in_(version_ids)))
+    session.execute(vector_table.insert(), [
+        {'version_id': version_id, 'feature_vector': encode_feature_vector(feature_vector)}
+        for version_id, feature_vector in feature_vectors.items()])
+
+
+def create_indexes(cli_args):
+    """ Creates the indexes declared on the ORM tables which don't exist in the DB yet.
+
+    create_all() only creates the indexes of new tables, so DBs created earlier have to be updated by this command.
+    The query plans of the dataset loader queries are logged before and after, so the effect can be checked.
+    """
+    engine = DB.get_engine()
+    session = DB.create_session()
+    repository = Dataset.get_repository_by_name(session, Config.repository_name)
+    if repository is None:
+        die("Repository %s could not be found!" % Config.repository_name)
+    loader_queries = get_loader_queries(repository, Config.dataset_train_start, Config.dataset_train_end,
+                                        Config.dataset_features, Config.dataset_ngram_sizes,
+                                        Config.dataset_ngram_levels, Dataset.has_ngram_blob_column(engine))
+    session.close()
+
+    log_query_plans(engine, loader_queries, "before")
+    missing_indexes = get_missing_indexes(engine)
+    if not missing_indexes:
+        logging.info("All indexes exist already.")
+        return
+    for index in missing_indexes:
+        logging.info("%s index %s on table %s" % (
+            "Missing" if cli_args.dry_run else "Creating", index.name, index.table.name))
+        if not cli_args.dry_run:
+            index.create(engine)
+    if not cli_args.dry_run:
+        log_query_plans(engine, loader_queries, "after")
+
+
+def get_missing_indexes(engine):
+    """ Returns the indexes declared on the ORM tables which don't exist in the DB.
+
+    Args:
+        engine (Engine): The DB engine.
+
+    Returns:
+        list[Index]: The missing indexes.
+    """
+    inspector = inspect(engine)
+    missing_indexes = []
+    for table in Base().base.metadata.sorted_tables:
+        if not table.indexes or not engine.has_table(table.name):
+            continue
+        existing_names = [index['name'] for index in inspector.get_indexes(table.name)]
+        missing_indexes += [index for index in table.indexes if index.name not in existing_names]
+    return missing_indexes
+
+
+def get_loader_queries(repository, start, end, feature_list, ngram_sizes=None, ngram_levels=None, ngram_blob=True):
+    """ Returns the queries with which the dataset loader reads a range, by name. """
+    queries = [
+        ("versions", Dataset.get_version_targets_query(repository, start, end)),
+        ("feature values", Dataset.get_feature_values_query(repository, start, end, feature_list)),
+        ("feature vectors", Dataset.get_feature_vectors_query(repository, start, end)),
+    ]
+    if ngram_sizes and ngram_levels:
+        queries.append(("ngram vectors", Dataset.get_ngram_vectors_query(repository, start, end, ngram_sizes,
+                                                                         ngram_levels, ngram_blob)))
+    return queries
+
+
+def log_query_plans(engine, queries, label):
+    """ Logs the EXPLAIN output of a list of named queries. """
+    for name, query in queries:
+        plan = engine.execute(Explain(query)).fetchall()
+        logging.info("Query plan of the %s query %s creating the indexes:\n%s" % (
+            name, label, "\n".join(" | ".join(str(value) for value in row) for row in plan)))
+
+
+class Explain(Executable, ClauseElement):
+    """ An EXPLAIN statement for a query, which is rendered for the dialect of the DB. """
+
+    def __init__(self, query):
+        self.query = query
+
+
+@compiles(Explain)
+def _compile_explain(explain, compiler, **kwargs):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == 'sqlite' else "EXPLAIN "
+    return prefix + compiler.process(explain.query, **kwargs)
+
+
+def add_missing_column(engine, column):
+    """ Adds a column of an ORM table to the DB, if it doesn't exist yet. create_all() only creates missing tables.
+
+    Args:
+        engine (Engine): The DB engine.
+        column (Column): The column to add.
+    """
+    table_name = column.table.name
+    existing_columns = [existing_column['name'] for existing_column in inspect(engine).get_columns(table_name)]
+    if column.name in existing_columns:
+        return
+    logging.info("Adding column %s to table %s" % (column.name, table_name))
+    preparer = engine.dialect.identifier_preparer
+    engine.execute("ALTER TABLE %s ADD COLUMN %s %s" % (
+        preparer.quote(table_name), preparer.quote(column.name), column.type.compile(dialect=engine.dialect)))
+
+
+def die(message=None):
+    if message:
+        logging.critical(message)
+    logging.critical("Something went horribly wrong. Exiting DB Tools")
+    exit()
+
+
+def parse_arguments():
+    """ Parses the provided command line arguments.
+
+    Returns:
+        A collection of argument values.
+    """
+    parser = argparse.ArgumentParser(description='ML-Pipeline DB Tools')
+    parser.add_argument(
+        '-c',
+        action="store",
+        required=False,
+        dest="config_file",
+        default="ml_pipeline.config",
+        help="The path to the config file.")
+    subparsers = parser.add_subparsers()
+
+    migrate_parser = subparsers.add_parser(
+        'migrate-ngrams',
+        help="Convert the text encoded ngram vectors into the compact binary encoding.")
+    migrate_parser.add_argument(
+        '--batch-size',
+        action="store",
+        type=int,
+        default=1000,
+        help="The amount of ngram vectors converted per transaction.")
+    migrate_parser.add_argument(
+        '--drop-text',
+        action="store_true",
+        help="Remove the text encoded vectors after conversion to free space.")
+    migrate_parser.set_defaults(command=migrate_ngram_vectors)
+
+    index_parser = subparsers.add_parser(
+        'create-indexes',
+        help="Create the missing indexes and compare the query plans of the dataset loader before and after.")
+    index_parser.add_argument(
+        '--dry-run',
+        action="store_true",
+        help="Only list the missing indexes and the current query plans.")
+    index_parser.set_defaults(command=create_indexes)
+
+    refresh_parser = subparsers.add_parser(
+        'refresh-feature-vectors',
+        help="Pack the feature values of new versions into the version_feature_vector table.")
+    refresh_parser.add_argument(
+        '--batch-size',
+        action="store",
+        type=int,
+        default=1000,
+        help="The amount of versions packed per transaction.")
+    refresh_parser.add_argument(
+        '--rebuild',
+        action="store_true",
+        help="Pack the feature vectors of all versions again, e.g. after feature values were changed.")
+    refresh_parser.set_defaults(command=refresh_feature_vectors)
+
+    cli_args = parser.parse_args()
+    if not hasattr(cli_args, 'command'):
+        parser.error("No command provided.")
+    return cli_args
+
+
+if __name__ == '__main__':
+    main()
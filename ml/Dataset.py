@@ -1,33 +1,73 @@
 #!/usr/bin/python
 # coding=utf-8
-import hashlib
+import copy
+import json
 import logging
+import multiprocessing
 import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import numpy as np
-from scipy.sparse.construct import hstack
-from scipy.sparse.coo import coo_matrix
+from scipy.sparse import issparse
+from scipy.sparse.construct import vstack
 from scipy.sparse.csr import csr_matrix
-from scipy.sparse.dok import dok_matrix
-from sklearn.externals import joblib
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql.expression import text
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
+from sqlalchemy.sql.expression import select, and_, func
 
+from ml import NGramCodec
+from ml.DatasetCache import DatasetCache
+from ml.MatrixBuilder import MatrixBuilder
 from model import DB
 from model.objects.Commit import Commit
+from model.objects.FeatureValue import FeatureValue
+from model.objects.File import File
+from model.objects.NGramVector import NGramVector
 from model.objects.Repository import Repository
+from model.objects.UpcomingBugsForVersion import UpcomingBugsForVersion, get_target_column, TARGETS
+from model.objects.Version import Version
+from model.objects.VersionFeatureVector import VersionFeatureVector, FeatureVectorColumn, decode_feature_vector
+from utils import Config
+
+BULK_LOAD_BATCH_SIZE = 10000
+FETCH_QUEUE_SIZE = 4  # Batches fetched ahead of the decoding
+STREAM_CHUNK_SIZE = 1000
+LOAD_STRATEGY_SELECTIN = 'SELECTIN'  # One batched IN query per relationship
+LOAD_STRATEGY_JOINED = 'JOINED'  # A single query joining all relationships
+TIMESTAMP_DTYPE = 'datetime64[s]'
+DATA_DTYPE = np.float64  # Default dtype of the data and targets. float32 halves the memory and cache size
+NGRAM_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)  # Fibonacci hashing, spreads consecutive positions evenly
+
+CACHE_FORMAT_VERSION = 4
+CACHE_METADATA_FILE = 'metadata.json'
+CACHE_MMAP_MODE = 'c'  # Copy-on-write
 
 
 class Dataset:
     def __init__(self, total_feature_count, version_count, feature_list, target_id, start, end,
-                 ngram_sizes=None, ngram_levels=None, label="", sparse=False, dok=False):
+                 ngram_sizes=None, ngram_levels=None, label="", sparse=False, dtype=DATA_DTYPE, ngram_hash_size=None):
         """" Initialize an empty dataset.
 
         A dataset consists of two components:
         - The data attribute is a matrix containing all input data. It's size is version_count x feature_count.
             Each row of the data matrix represents the feature vector of one version.
         - The target attribute is a vector containing the ground truth. It's size is version_count.
+        - The targets attribute is a matrix containing the ground truth for all targets, in the order of TARGETS. It's
+            size is version_count x len(TARGETS). The target attribute is the column of target_id, see select_target.
+        - The timestamps attribute contains the commit timestamp of each version. It's size is version_count.
+        The columns of the data matrix are the features in the order of feature_list, followed by the ngram vectors
+        ordered by ngram size first, level second. The ngram_vector_sizes attribute lists the ngram size, level and
+        vector size of each of these ngram vectors.
+        If ngram_hash_size is set, all ngram vectors are folded into one block of ngram_hash_size columns instead, see
+        hash_ngram_positions.
+        If the dataset was pruned, see prune_columns, the column_mask attribute marks which of these columns are kept
+        in the data matrix. Otherwise it is None.
+        If duplicate rows were collapsed, see collapse_duplicates, the sample_weight attribute holds the amount of
+        versions each row stands for. Otherwise it is None.
 
         Args:
             total_feature_count (int): Amount of versions (and ngrams). Equals the rows of the data and target matrix.
@@ -39,7 +79,9 @@ class Dataset:
             ngram_levels (list[int]): Optional. The ngram-levels in this dataset.
             label (str): An arbitrary label, e.g. "Test", for this dataset. Useful when caching!
             sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
-            dok (bool): If a dok-type sparse matrix should be used. Dok is faster to update. Can be converted to CSR.
+                A sparse data matrix is always in CSR format. Use a MatrixBuilder to construct it.
+            dtype: Optional. The float dtype of the data and target matrices, e.g. 'float32'.
+            ngram_hash_size (int): Optional. If set, the amount of columns all ngram vectors are hashed into.
         """
         ngram_count = 0
         if ngram_sizes and ngram_levels:
@@ -47,47 +89,304 @@ class Dataset:
         logging.debug("Initializing Dataset with  %i versions, %i features and %i ngram vectors." % (
             version_count, total_feature_count, ngram_count))
 
-        dimension = (version_count, total_feature_count + ngram_count)
+        self.dtype = get_dtype(dtype)
+        dimension = (version_count, total_feature_count)
         if sparse:
-            if dok:
-                self.data = dok_matrix(dimension, dtype=np.float64)
-            else:
-                self.data = csr_matrix(dimension, dtype=np.float64)
+            self.data = csr_matrix(dimension, dtype=self.dtype)
         else:
-            self.data = np.zeros(dimension)
-        self.target = np.zeros(version_count)
+            self.data = np.zeros(dimension, dtype=self.dtype)
+        self.target = np.zeros(version_count, dtype=self.dtype)
+        self.targets = np.zeros((version_count, len(TARGETS)), dtype=self.dtype)
+        self.timestamps = np.zeros(version_count, dtype=TIMESTAMP_DTYPE)
         self.feature_list = feature_list
         self.target_id = target_id
         self.start = start
         self.end = end
         self.ngram_sizes = ngram_sizes
         self.ngram_levels = ngram_levels
+        self.ngram_vector_sizes = []
+        self.ngram_hash_size = ngram_hash_size
         self.label = label
         self.sparse = sparse
+        self.column_mask = None
+        self.sample_weight = None
 
     def has_ngrams(self):
         """ True if this dataset contains ngrams. Must have at least one ngram size and level."""
         return self.ngram_sizes and self.ngram_levels
 
     def to_csr(self):
-        """ Converts the sparse data matrix to CSR. This is more efficient to calculate with. """
+        """ Converts the sparse data matrix to CSR. This is the format all models and scalers expect. """
         if self.sparse and type(self.data) != csr_matrix and hasattr(self.data, 'tocsr'):
             logging.debug("Converting data matrix to CSR Matrix")
-            self.data.tocsr()
+            self.data = self.data.tocsr()
+
+    def append(self, dataset):
+        """ Appends the rows of another dataset with the same columns, e.g. of the following date range.
+
+        Args:
+            dataset (Dataset): The dataset to append. Its range must start where the range of this dataset ends.
+        """
+        if self.data.shape[1] != dataset.data.shape[1]:
+            raise ValueError("Can't append a dataset with %i columns to a dataset with %i columns." % (
+                dataset.data.shape[1], self.data.shape[1]))
+        if self.sparse:
+            self.data = vstack([self.data, dataset.data], format='csr')
+        else:
+            self.data = np.concatenate((self.data, dataset.data))
+        self.target = np.concatenate((self.target, dataset.target))
+        self.targets = np.concatenate((self.targets, dataset.targets))
+        self.timestamps = np.concatenate((self.timestamps, dataset.timestamps))
+        if self.sample_weight is not None or dataset.sample_weight is not None:
+            self.sample_weight = np.concatenate((get_sample_weight(self), get_sample_weight(dataset)))
+        self.end = dataset.end
+
+    def select_target(self, target_id):
+        """ Returns a dataset with another target. The data and targets are shared with this dataset.
+
+        Args:
+            target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+
+        Returns:
+            Dataset: The dataset with the selected target.
+        """
+        dataset = copy.copy(self)
+        dataset.target_id = target_id
+        dataset.target = self.targets[:, get_target_index(target_id)]
+        return dataset
 
-    def to_dok(self):
-        """ Converts the sparse data matrix to DOK. This is more efficient to update or construct. """
-        if self.sparse  and type(self.data) != csr_matrix and hasattr(self.data, 'todok'):
-            logging.debug("Converting data matrix to DOK Matrix")
-            self.data.todok()
+    def get_column_indices(self, feature_list, ngram_sizes=None, ngram_levels=None):
+        """ Looks up the data columns of some of the features and ngram vectors of this dataset.
+
+        Args:
+            feature_list (list[str]): The feature-IDs.
+            ngram_sizes (list[int]): Optional. The ngram-sizes.
+            ngram_levels (list[int]): Optional. The ngram-levels.
+
+        Returns:
+            ndarray: The column indices, in the column order a dataset with only these features and ngrams would have.
+        """
+        feature_index = {feature_id: j for j, feature_id in enumerate(self.feature_list)}
+        missing_features = [feature_id for feature_id in feature_list if feature_id not in feature_index]
+        if missing_features:
+            raise ValueError("The dataset doesn't contain the features %s." % str(missing_features))
+        columns = [np.array([feature_index[feature_id] for feature_id in feature_list], dtype=np.int64)]
+        if ngram_sizes and ngram_levels and self.ngram_hash_size:
+            if set(ngram_sizes) != set(self.ngram_sizes) or set(ngram_levels) != set(self.ngram_levels):
+                raise ValueError("Hashed ngram vectors can only be selected all at once.")
+            offset = len(self.feature_list)
+            columns.append(np.arange(offset, offset + self.ngram_hash_size, dtype=np.int64))
+        elif ngram_sizes and ngram_levels:
+            offset = len(self.feature_list)
+            for ngram_size, ngram_level, vector_size in self.ngram_vector_sizes:
+                if ngram_size in ngram_sizes and ngram_level in ngram_levels:
+                    columns.append(np.arange(offset, offset + vector_size, dtype=np.int64))
+                offset += vector_size
+        return np.concatenate(columns)
+
+    def select_columns(self, feature_list, ngram_sizes=None, ngram_levels=None):
+        """ Returns a dataset containing only some of the features and ngram vectors of this dataset.
+
+        The targets and timestamps are shared with this dataset. If the columns form a contiguous range of a dense
+        matrix, the data is a view as well. Otherwise the selected columns are copied.
+
+        Args:
+            feature_list (list[str]): The feature-IDs to select.
+            ngram_sizes (list[int]): Optional. The ngram-sizes to select.
+            ngram_levels (list[int]): Optional. The ngram-levels to select.
+
+        Returns:
+            Dataset: The dataset with the selected columns.
+        """
+        columns = self.get_column_indices(feature_list, ngram_sizes, ngram_levels)
+        column_mask = None
+        if self.column_mask is not None:
+            # Map the selected columns to their position in the pruned data matrix
+            column_mask = self.column_mask[columns]
+            columns = (np.cumsum(self.column_mask) - 1)[columns[column_mask]]
+        column_count = len(columns)
+        if column_count and np.array_equal(columns, np.arange(columns[0], columns[0] + column_count)):
+            if column_count == self.data.shape[1]:
+                data = self.data
+            else:
+                data = self.data[:, columns[0]:columns[0] + column_count]
+        else:
+            data = self.data[:, columns]
+
+        dataset = Dataset(column_count, 0, feature_list, self.target_id, self.start, self.end, ngram_sizes,
+                          ngram_levels, self.label, sparse=self.sparse, dtype=self.dtype,
+                          ngram_hash_size=self.ngram_hash_size if ngram_sizes and ngram_levels else None)
+        dataset.data = data
+        dataset.target = self.target
+        dataset.targets = self.targets
+        dataset.timestamps = self.timestamps
+        dataset.column_mask = column_mask
+        dataset.sample_weight = self.sample_weight
+        if ngram_sizes and ngram_levels:
+            dataset.ngram_vector_sizes = [
+                (ngram_size, ngram_level, vector_size)
+                for ngram_size, ngram_level, vector_size in self.ngram_vector_sizes
+                if ngram_size in ngram_sizes and ngram_level in ngram_levels]
+        return dataset
+
+    def slice_range(self, start, end):
+        """ Returns a dataset containing only the versions with a commit timestamp in [start, end).
+
+        The rows must be ordered by timestamp. For dense data, the sliced matrices are views, not copies.
+
+        Args:
+            start (datetime): The start of the range.
+            end (datetime): The end of the range.
+
+        Returns:
+            Dataset: The sliced dataset.
+        """
+        first, last = np.searchsorted(self.timestamps, np.array([start, end], dtype=TIMESTAMP_DTYPE))
+        dataset = Dataset(self.data.shape[1], 0, self.feature_list, self.target_id, start, end, self.ngram_sizes,
+                          self.ngram_levels, self.label, sparse=self.sparse, dtype=self.dtype,
+                          ngram_hash_size=self.ngram_hash_size)
+        dataset.ngram_vector_sizes = self.ngram_vector_sizes
+        dataset.column_mask = self.column_mask
+        dataset.data = self.data[first:last]
+        dataset.target = self.target[first:last]
+        dataset.targets = self.targets[first:last]
+        dataset.timestamps = self.timestamps[first:last]
+        if self.sample_weight is not None:
+            dataset.sample_weight = self.sample_weight[first:last]
+        return dataset
+
+    def get_column_names(self):
+        """ Returns a name for each column of the data matrix: The feature ID, or the ngram size, level and position
+        within its ngram vector for ngram columns. Pruned columns are left out.
+        """
+        column_names = list(self.feature_list)
+        if self.ngram_hash_size and self.has_ngrams():
+            column_names.extend("ngram hash #%i" % i for i in range(self.ngram_hash_size))
+        for ngram_size, ngram_level, vector_size in [] if self.ngram_hash_size else self.ngram_vector_sizes:
+            column_names.extend("%i-gram L%i #%i" % (ngram_size, ngram_level, i) for i in range(vector_size))
+        if self.column_mask is not None:
+            column_names = [name for name, kept in zip(column_names, self.column_mask) if kept]
+        return column_names
+
+    def prune_columns(self, min_nonzero=1):
+        """ Returns a dataset without the dead columns of this dataset.
+
+        A column is dead if it is constant, e.g. an ngram which doesn't occur in the range, or if it has less than
+        min_nonzero nonzero values. Dead columns only add to the matrix width and the cost of scaling and fitting.
+        The column_mask of the returned dataset marks the kept columns. Use apply_column_mask to project other datasets,
+        e.g. the test dataset, onto the same columns.
+
+        Args:
+            min_nonzero (int): Optional. The minimum amount of nonzero values of a kept column.
+
+        Returns:
+            Dataset: The pruned dataset. The targets and timestamps are shared with this dataset.
+        """
+        nonzero_counts, constant = get_column_statistics(self.data)
+        kept = ~constant & (nonzero_counts >= min_nonzero)
+        if self.column_mask is not None:
+            column_mask = self.column_mask.copy()
+            column_mask[self.column_mask] = kept
+        else:
+            column_mask = kept
+        logging.info("Pruning %i of %i columns of dataset %s." % (
+            len(kept) - np.count_nonzero(kept), len(kept), self.label))
+        return self.apply_column_mask(column_mask)
+
+    def apply_column_mask(self, column_mask):
+        """ Returns a dataset containing only the columns marked in a column mask, e.g. the one of a pruned dataset.
+
+        Args:
+            column_mask (ndarray): A boolean mask over all columns of an unpruned dataset with the same features and
+                ngram vectors. If this dataset is pruned, it may only mark columns which are kept in this dataset.
+
+        Returns:
+            Dataset: The dataset with the masked columns. The targets and timestamps are shared with this dataset.
+        """
+        column_mask = np.asarray(column_mask, dtype=bool)
+        kept = column_mask
+        if self.column_mask is not None:
+            if len(column_mask) != len(self.column_mask) or np.any(column_mask & ~self.column_mask):
+                raise ValueError("The column mask contains columns which were pruned from the dataset.")
+            kept = column_mask[self.column_mask]
+        elif len(column_mask) != self.data.shape[1]:
+            raise ValueError("The column mask has %i columns, but the dataset has %i columns." % (
+                len(column_mask), self.data.shape[1]))
+
+        dataset = copy.copy(self)
+        dataset.data = self.data[:, np.flatnonzero(kept)]
+        dataset.column_mask = column_mask
+        return dataset
+
+    def collapse_duplicates(self):
+        """ Returns a dataset in which all rows with the same data and targets are collapsed into one row.
+
+        Many versions share their feature vector and targets, e.g. if a file was changed without changing its metrics.
+        Each group of identical rows is replaced by its first row, and the sample_weight attribute of the returned
+        dataset holds the size of each group. Fit the estimator with these weights, see Model.train_model.
+
+        Returns:
+            Dataset: The collapsed dataset. The rows keep their order, so they are still ordered by timestamp.
+        """
+        first_rows, groups = get_duplicate_row_groups(self.data, self.targets)
+        dataset = copy.copy(self)
+        dataset.data = self.data[first_rows]
+        dataset.target = self.target[first_rows]
+        dataset.targets = self.targets[first_rows]
+        dataset.timestamps = self.timestamps[first_rows]
+        dataset.sample_weight = np.bincount(groups, weights=get_sample_weight(self), minlength=len(first_rows))
+        logging.info("Collapsed %i rows of dataset %s into %i rows." % (len(groups), self.label, len(first_rows)))
+        return dataset
+
+    def subsample_zero_targets(self, sample_rate, seed=None):
+        """ Returns a dataset with all rows with a nonzero target and a random sample of the rows with a zero target.
+
+        Most versions have no upcoming bugs, so the zero rows dominate the training time. The sampled zero rows are
+        weighted with the inverse of the actual sample rate in the sample_weight attribute, so the weighted loss is
+        an unbiased estimate of the loss on all rows.
+
+        Args:
+            sample_rate (float): The fraction of the zero rows to keep. Must be in (0, 1].
+            seed (int): Optional. The seed of the random sample. Record it to reproduce the sample.
+
+        Returns:
+            Dataset: The sampled dataset. The rows keep their order. Sparse data stays sparse.
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("The sample rate must be between 0 and 1, got %s." % sample_rate)
+        zero_rows = np.flatnonzero(self.target == 0)
+        sample_size = max(int(round(len(zero_rows) * sample_rate)), 1) if len(zero_rows) else 0
+        sampled_zero_rows = np.random.RandomState(seed).choice(zero_rows, sample_size, replace=False)
+        rows = np.union1d(np.flatnonzero(self.target != 0), sampled_zero_rows)
+
+        sample_weight = np.array(get_sample_weight(self), dtype=np.float64)
+        if sample_size:
+            sample_weight[sampled_zero_rows] *= len(zero_rows) / sample_size
+        dataset = copy.copy(self)
+        dataset.data = self.data[rows]
+        dataset.target = self.target[rows]
+        dataset.targets = self.targets[rows]
+        dataset.timestamps = self.timestamps[rows]
+        dataset.sample_weight = sample_weight[rows]
+        logging.info("Sampled %i of %i rows with a zero target of dataset %s." % (
+            sample_size, len(zero_rows), self.label))
+        return dataset
 
 
 def get_dataset(repository, start, end, feature_list, target_id, ngram_sizes=None, ngram_levels=None, label="",
-                cache=False, cache_directory=None, eager_load=False, sparse=False):
+                cache=False, cache_directory=None, cache_size_budget=None, eager_load=False, sparse=False,
+                bulk_load=False, chunk_size=None, tile_months=None, processes=None, load_strategy=None, dtype=None,
+                ngram_hash_size=None):
     """ Reads a dataset from a repository in a specific time range.
 
-    If cache=True, the dataset will be read from a file, if one exists. If not, after reading from the DB, it will
-    be saved to a *.dataset file.
+    If cache=True, the dataset will be read from the dataset cache, if it is cached. If a dataset with the same start
+    but an earlier end is cached, only the missing range is read from the DB and appended to it. Otherwise, after
+    reading from the DB, it will be saved to the cache.
+    The cache holds the superset of all features and ngram vectors requested for a range so far. Any subset of them
+    is served by selecting its columns from the cached dataset, so changing the feature list doesn't need the DB.
+    Likewise, all targets are cached, so switching the target doesn't need the DB either.
+    If tile_months is set as well, the cache is organized in tiles of that many months instead, see
+    get_dataset_from_tiles.
     For NGrams to be loaded into the dataset, there must be at least one ngram size and level specified.
 
     Args:
@@ -100,32 +399,203 @@ def get_dataset(repository, start, end, feature_list, target_id, ngram_sizes=Non
         ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
         label (str): The label to be assigned to the dataset.
         cache (bool): If True, caching will be used.
-        cache_directory (bool): Optional. The directory path for the cache files. If None, the working dir will be used.
+        cache_directory (str): Optional. The directory path for the cache files. If None, the working dir will be used.
+        cache_size_budget (int): Optional. The maximum size of the cache directory in bytes. If None, it is unlimited.
         eager_load (bool): If true, all data will be loaded eagerly. This reduces database calls, but uses a lot of RAM.
         sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        bulk_load (bool): If true, the data is read with plain SQL selects instead of ORM objects. Much faster.
+        chunk_size (int): Optional. If set, versions are streamed from the DB in chunks of this size to bound memory.
+        tile_months (int): Optional. If set, the cache is partitioned into tiles of this many months.
+        processes (int): Optional. If higher than 1, the range is split and read by this many worker processes.
+        load_strategy (str): Optional. How related ORM objects are loaded. Use a LOAD_STRATEGY_X constant.
+        dtype: Optional. The float dtype of the data and target matrices. Defaults to DATA_DTYPE.
+        ngram_hash_size (int): Optional. If set, all ngram vectors are hashed into this many columns, which bounds the
+            width of the data matrix. See hash_ngram_positions.
 
     Returns:
         Dataset: The populated dataset.
     """
+    if ngram_sizes and type(ngram_sizes) != list:
+        ngram_sizes = [ngram_sizes]
+    if ngram_levels and type(ngram_levels) != list:
+        ngram_levels = [ngram_levels]
+    if not (ngram_sizes and ngram_levels):
+        ngram_hash_size = None
     if cache and not cache_directory:
         cache_directory = os.getcwd()
+    if cache and tile_months:
+        return get_dataset_from_tiles(repository, start, end, feature_list, target_id, ngram_sizes, ngram_levels,
+                                      label=label, cache_directory=cache_directory,
+                                      cache_size_budget=cache_size_budget, tile_months=tile_months,
+                                      eager_load=eager_load, sparse=sparse, bulk_load=bulk_load, chunk_size=chunk_size,
+                                      processes=processes, load_strategy=load_strategy, dtype=dtype,
+                                      ngram_hash_size=ngram_hash_size)
     if cache:
-        dataset = load_dataset_file(cache_directory, label, feature_list, target_id, start, end, ngram_sizes,
-                                    ngram_levels, sparse=sparse)
+        dataset_cache = DatasetCache(cache_directory, cache_size_budget)
+        dataset = load_dataset_file(dataset_cache, label, feature_list, target_id, start, end, ngram_sizes,
+                                    ngram_levels, sparse=sparse, dtype=dtype, ngram_hash_size=ngram_hash_size)
+        if dataset is not None:
+            return dataset
+        dataset = refresh_cached_dataset(dataset_cache, repository, start, end, feature_list, target_id, ngram_sizes,
+                                         ngram_levels, label=label, eager_load=eager_load, sparse=sparse,
+                                         bulk_load=bulk_load, chunk_size=chunk_size, processes=processes,
+                                         load_strategy=load_strategy, dtype=dtype, ngram_hash_size=ngram_hash_size)
         if dataset is not None:
             return dataset
 
-    dataset = get_dataset_from_db(repository, start, end, feature_list, target_id, ngram_sizes, ngram_levels,
-                                  label=label, eager_load=eager_load, sparse=sparse)
-
+    db_feature_list, db_ngram_sizes, db_ngram_levels = feature_list, ngram_sizes, ngram_levels
+    if cache:
+        cached_columns = dataset_cache.get_info(generate_cache_key(label, start, end, sparse, dtype=dtype,
+                                                                   ngram_hash_size=ngram_hash_size))
+        if cached_columns is not None:
+            db_feature_list, db_ngram_sizes, db_ngram_levels = merge_columns(cached_columns, feature_list,
+                                                                             ngram_sizes, ngram_levels)
+    dataset = get_dataset_from_db(repository, start, end, db_feature_list, target_id, db_ngram_sizes,
+                                  db_ngram_levels, label=label, eager_load=eager_load, sparse=sparse,
+                                  bulk_load=bulk_load, chunk_size=chunk_size, processes=processes,
+                                  load_strategy=load_strategy, dtype=dtype, ngram_hash_size=ngram_hash_size)
+
+    if dataset is not None:
+        dataset.to_csr()
     if dataset is not None and cache:
-        save_dataset_file(dataset, cache_directory)
+        save_dataset_file(dataset, dataset_cache)
+    if dataset is not None and dataset.feature_list is not feature_list:
+        dataset = dataset.select_columns(feature_list, ngram_sizes, ngram_levels)
+
+    return dataset
+
+
+def get_datasets_async(dataset_args, max_workers=None):
+    """ Reads multiple datasets concurrently, e.g. the training and test dataset.
+
+    Every dataset is read by get_dataset on a worker thread. Each thread uses its own DB session, as the sessions are
+    thread-local, and releases it after its dataset is loaded. The DB queries and the numpy matrix construction release
+    the GIL, so the total time is about the time of the slowest dataset instead of the sum of all.
+
+    Args:
+        dataset_args (list[dict]): The keyword arguments of get_dataset for each dataset.
+        max_workers (int): Optional. The maximum amount of worker threads. If None, all datasets are read at once.
+
+    Returns:
+        list[Future]: The futures of the datasets, in the order of dataset_args. Their result is the Dataset, or None
+            if it could not be created. Exceptions of get_dataset are raised when the result is retrieved.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers or max(len(dataset_args), 1))
+    futures = [executor.submit(get_dataset, **kwargs) for kwargs in dataset_args]
+    executor.shutdown(wait=False)
+    return futures
+
+
+def get_dataset_from_tiles(repository, start, end, feature_list, target_id, ngram_sizes=None, ngram_levels=None,
+                           label="", cache_directory=None, cache_size_budget=None, tile_months=1, **kwargs):
+    """ Reads a dataset from cached, time-partitioned tiles.
+
+    The time line is partitioned into tiles of tile_months months each. The tiles covering the requested range are
+    read from the cache, or from the DB if they are not cached yet, stacked and trimmed to the range using the commit
+    timestamps of the rows. The tiles don't depend on the label or range of a request, so every tile is read from the
+    DB only once and shared by all overlapping datasets, e.g. training, test and backtest sets.
+    Tiles which end in the future only cover the range until the requested end. They are extended once a later end
+    is requested.
+
+    Args:
+        repository (Repository): The repository to query. Can also be its name as a string
+        start (datetime): The start range for the dataset
+        end (datetime): The end range for the dataset
+        feature_list (list[str]): A list of the feature-IDs to be read into the dataset.
+        target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+        ngram_sizes (list[int]): Optional. The ngram-sizes to be loaded in the set (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
+        label (str): The label to be assigned to the dataset.
+        cache_directory (str): Optional. The directory path for the cache files. If None, the working dir will be used.
+        cache_size_budget (int): Optional. The maximum size of the cache directory in bytes. If None, it is unlimited.
+        tile_months (int): Optional. The amount of months per tile.
+        **kwargs: Further arguments for get_dataset_from_db.
+
+    Returns:
+        Dataset: The populated dataset.
+    """
+    start = _to_datetime(start)
+    end = _to_datetime(end)
+    repository_name = repository if type(repository) is str else repository.name
+    tile_label = "Tile-%s-%i" % (repository_name, tile_months)
+    now = datetime.now()
+
+    tiles = []
+    for tile_start, tile_end in get_tile_ranges(start, end, tile_months):
+        if tile_end > now:
+            tile_end = end
+        tile = get_dataset(repository, tile_start, tile_end, feature_list, target_id, ngram_sizes, ngram_levels,
+                           label=tile_label, cache=True, cache_directory=cache_directory,
+                           cache_size_budget=cache_size_budget, **kwargs)
+        if tile is None:
+            logging.debug("Tile from %s to %s contains no versions." % (tile_start, tile_end))
+            continue
+        tiles.append(tile.slice_range(max(start, tile_start), min(end, tile_end)))
+
+    if not tiles:
+        logging.error("No Versions found!")
+        return None
+    dataset = stack_datasets(tiles)
+    dataset.label = label
+    dataset.start = start
+    dataset.end = end
+    return dataset
+
+
+def get_tile_ranges(start, end, tile_months):
+    """ Computes the ranges of the tiles which cover a range. Tiles start at the first of a month.
+
+    Args:
+        start (datetime): The start of the range.
+        end (datetime): The end of the range.
+        tile_months (int): The amount of months per tile.
+
+    Returns:
+        list[tuple(datetime, datetime)]: The start and end of each tile.
+    """
+    month_index = (start.year * 12 + start.month - 1) // tile_months * tile_months
+    tile_start = datetime(month_index // 12, month_index % 12 + 1, 1)
+    ranges = []
+    while tile_start < end:
+        month_index += tile_months
+        tile_end = datetime(month_index // 12, month_index % 12 + 1, 1)
+        ranges.append((tile_start, tile_end))
+        tile_start = tile_end
+    return ranges
+
 
+def stack_datasets(datasets):
+    """ Stacks the rows of datasets with the same columns into one dataset.
+
+    Args:
+        datasets (list[Dataset]): The datasets, ordered by their ranges.
+
+    Returns:
+        Dataset: The stacked dataset. Its other attributes are taken from the first dataset.
+    """
+    first = datasets[0]
+    if len(datasets) == 1:
+        return first
+    dataset = Dataset(first.data.shape[1], 0, first.feature_list, first.target_id, first.start, datasets[-1].end,
+                      first.ngram_sizes, first.ngram_levels, first.label, sparse=first.sparse, dtype=first.dtype,
+                      ngram_hash_size=first.ngram_hash_size)
+    dataset.ngram_vector_sizes = first.ngram_vector_sizes
+    dataset.column_mask = first.column_mask
+    if first.sparse:
+        dataset.data = vstack([d.data for d in datasets], format='csr')
+    else:
+        dataset.data = np.concatenate([d.data for d in datasets])
+    dataset.target = np.concatenate([d.target for d in datasets])
+    dataset.targets = np.concatenate([d.targets for d in datasets])
+    dataset.timestamps = np.concatenate([d.timestamps for d in datasets])
+    if any(d.sample_weight is not None for d in datasets):
+        dataset.sample_weight = np.concatenate([get_sample_weight(d) for d in datasets])
     return dataset
 
 
 def get_dataset_from_db(repository, start, end, feature_list, target_id, ngram_sizes=None, ngram_levels=None, label="",
-                        eager_load=False, sparse=False):
+                        eager_load=False, sparse=False, bulk_load=False, chunk_size=None, processes=None,
+                        load_strategy=None, dtype=None, ngram_hash_size=None):
     """ Reads a dataset from a repository in a specific time range
 
     Args:
@@ -138,7 +608,15 @@ def get_dataset_from_db(repository, start, end, feature_list, target_id, ngram_s
         ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
         label (str): The label to be assigned to the dataset.
         eager_load (bool): If true, all data will be loaded eagerly. This reduces database calls, but uses a lot of RAM.
+            Has no effect when bulk_load is used.
         sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        bulk_load (bool): If true, the data is read with plain SQL selects instead of ORM objects. Much faster.
+        chunk_size (int): Optional. If set, versions are streamed from the DB in chunks of this size to bound memory.
+        processes (int): Optional. If higher than 1, the range is split and read by this many worker processes.
+        load_strategy (str): Optional. How related ORM objects are loaded. Use a LOAD_STRATEGY_X constant.
+            Defaults to LOAD_STRATEGY_SELECTIN. Has no effect when bulk_load is used.
+        dtype: Optional. The float dtype of the data and target matrices. Defaults to DATA_DTYPE.
+        ngram_hash_size (int): Optional. If set, all ngram vectors are hashed into this many columns.
 
     Returns:
         Dataset: The populated dataset.
@@ -146,81 +624,816 @@ def get_dataset_from_db(repository, start, end, feature_list, target_id, ngram_s
     if ngram_sizes and type(ngram_sizes) != list:
         ngram_sizes = [ngram_sizes]
     if ngram_levels and type(ngram_levels) != list:
-        ngram_sizes = [ngram_levels]
+        ngram_levels = [ngram_levels]
     use_ngrams = True if ngram_sizes and ngram_levels else False
+    if not use_ngrams:
+        ngram_hash_size = None
+
+    with DB.session_scope() as session:
+        if type(repository) is str:
+            repository_name = repository
+            with _stage(label, "repository lookup"):
+                repository = get_repository_by_name(session, repository_name)
+            if repository is None:
+                logging.error("Repository with name %s not found! Returning no Dataset" % repository_name)
+                return None
+
+        if processes and processes > 1:
+            return get_dataset_from_db_parallel(session, repository, start, end, feature_list, target_id,
+                                                ngram_sizes, ngram_levels, label=label, processes=processes,
+                                                eager_load=eager_load, sparse=sparse, bulk_load=bulk_load,
+                                                chunk_size=chunk_size, load_strategy=load_strategy, dtype=dtype,
+                                                ngram_hash_size=ngram_hash_size)
+
+        if bulk_load:
+            return get_dataset_from_db_bulk(session, repository, start, end, feature_list, target_id, ngram_sizes,
+                                            ngram_levels, label=label, sparse=sparse, dtype=dtype,
+                                            ngram_hash_size=ngram_hash_size)
+
+        if chunk_size:
+            with _stage(label, "chunked loading"):
+                return get_dataset_from_db_chunked(session, repository, start, end, feature_list, target_id,
+                                                   ngram_sizes, ngram_levels, label=label, eager_load=eager_load,
+                                                   sparse=sparse, chunk_size=chunk_size, load_strategy=load_strategy,
+                                                   dtype=dtype, ngram_hash_size=ngram_hash_size)
+
+        with _stage(label, "version query"):
+            versions = get_versions_in_range(session, repository, start, end, eager_load_features=eager_load,
+                                             eager_load_ngrams=use_ngrams, load_strategy=load_strategy)
+        if versions is None:
+            logging.error("Could not retrieve versions! Returning no Dataset")
+            return None
 
-    session = DB.create_session()
-
-    if type(repository) is str:
-        repository_name = repository
-        repository = get_repository_by_name(session, repository_name)
-        if repository is None:
-            logging.error("Repository with name %s not found! Returning no Dataset" % repository_name)
+        if len(versions) == 0:
+            logging.error("No Versions found!")
             return None
+        logging.debug("%i versions found." % len(versions))
+
+        feature_count = len(feature_list)
+        logging.debug("%i features found." % feature_count)
+
+        ngram_count = 0
+        if use_ngrams:
+            ngrams = get_ngram_vector_list(versions[0], ngram_sizes, ngram_levels)
+            ngram_count = sum([ngram.vector_size for ngram in ngrams])
+            logging.debug("Ngram sizes %s and levels %s amount to %i total ngrams." % (
+                str(ngram_sizes), str(ngram_levels), ngram_count))
+
+        dataset = Dataset(feature_count + (ngram_hash_size or ngram_count), len(versions), feature_list, target_id,
+                          start, end, ngram_sizes, ngram_levels, label, sparse=sparse, dtype=dtype,
+                          ngram_hash_size=ngram_hash_size)
+        if use_ngrams:
+            dataset.ngram_vector_sizes = get_ngram_vector_sizes(ngrams)
+        builder = MatrixBuilder(dataset.data.shape, dtype=dataset.dtype)
+        feature_index = get_feature_index(feature_list)
+        with _stage(label, "matrix building"):  # Relationships which are not loaded eagerly are lazy loaded here
+            for i, version in enumerate(versions):
+                _add_version_to_dataset(dataset, builder, i, version, feature_index, target_id, ngram_sizes,
+                                        ngram_levels, ngram_hash_size)
+
+                if i % 100 == 0:
+                    logging.info("{0:.2f}% of versions processed.".format(i / len(versions) * 100))
+        dataset.data = builder.to_matrix(sparse)
+        logging.info("All versions processed.")
+        return dataset
 
-    commits = get_commits_in_range(session, repository, start, end,
-                                   eager_load_ngrams=use_ngrams and eager_load,
-                                   eager_load_features=eager_load)
-    if commits is None:
-        logging.error("Could not retrieve commits! Returning no Dataset")
+
+def get_dataset_from_db_parallel(session, repository, start, end, feature_list, target_id, ngram_sizes=None,
+                                 ngram_levels=None, label="", processes=2, **kwargs):
+    """ Reads a dataset from a repository in a specific time range with multiple worker processes.
+
+    The range is split into sub-ranges with about the same amount of versions. Each sub-range is read and decoded by
+    get_dataset_from_db in a worker process with its own DB engine, so decoding uses multiple cores. The partial
+    datasets are stacked in timestamp order. The workers are spawned instead of forked, so they don't inherit the
+    connections, locks and threads of this process.
+
+    Args:
+        session (Session): The DB-Session to use for splitting the range.
+        repository (Repository): The repository to query.
+        start (datetime): The start range
+        end (datetime): The end range
+        feature_list (list[str]): A list of the feature-IDs to be read into the dataset.
+        target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+        ngram_sizes (list[int]): Optional. The ngram-sizes to be loaded in the set (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
+        label (str): The label to be assigned to the dataset.
+        processes (int): Optional. The amount of worker processes and sub-ranges.
+        **kwargs: Further arguments for get_dataset_from_db.
+
+    Returns:
+        Dataset: The populated dataset.
+    """
+    partitions = get_range_partitions(session, repository, start, end, processes)
+    if not partitions:
+        logging.error("No Versions found!")
         return None
-    logging.debug("Commits received.")
+    logging.debug("Reading %i sub-ranges with %i processes." % (len(partitions), processes))
 
-    if len(commits) == 0:
-        logging.error("No Commits found!")
+    # Return the connection to the pool while the workers run. They create engines of their own.
+    session.close()
+    database_config = {name: getattr(Config, name) for name in dir(Config) if name.startswith('database_')}
+    # A spawn context pool instead of ProcessPoolExecutor, whose mp_context argument needs Python 3.7
+    with multiprocessing.get_context('spawn').Pool(min(processes, len(partitions))) as pool:
+        results = [pool.apply_async(_get_dataset_partition, (database_config, repository.name, partition_start,
+                                                             partition_end, feature_list, target_id, ngram_sizes,
+                                                             ngram_levels, label, kwargs))
+                   for partition_start, partition_end in partitions]
+        datasets = [result.get() for result in results]
+
+    datasets = [dataset for dataset in datasets if dataset is not None]
+    if not datasets:
+        logging.error("No Versions found!")
         return None
+    dataset = stack_datasets(datasets)
+    dataset.start = start
+    dataset.end = end
+    return dataset
+
+
+_worker_pid = None
+
+
+def _get_dataset_partition(database_config, repository_name, start, end, feature_list, target_id, ngram_sizes,
+                           ngram_levels, label, kwargs):
+    """ Reads one sub-range in a worker process of get_dataset_from_db_parallel. """
+    global _worker_pid
+    if _worker_pid != os.getpid():
+        # Spawned workers don't know the config and ORM objects. The tables exist already, so no DDL is run.
+        for name, value in database_config.items():
+            setattr(Config, name, value)
+        DB.reset()
+        DB.register_objects()
+        _worker_pid = os.getpid()
+    return get_dataset_from_db(repository_name, start, end, feature_list, target_id, ngram_sizes, ngram_levels,
+                               label=label, **kwargs)
+
+
+def get_range_partitions(session, repository, start, end, count):
+    """ Splits a range into up to count sub-ranges by commit timestamp, with about the same amount of versions each.
+
+    The boundaries are the timestamps of every n-th version, which are selected one by one in the DB, so the
+    timestamps of the whole range are never transferred.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository of the versions.
+        start (datetime): The start of the range.
+        end (datetime): The end of the range.
+        count (int): The amount of sub-ranges.
+
+    Returns:
+        list[tuple(datetime, datetime)]: The start and end of each sub-range. Empty if the range contains no versions.
+    """
+    version_count = count_versions_in_range(session, repository, start, end)
+    if version_count == 0:
+        return []
+    query = select([Commit.timestamp]). \
+        select_from(_join_versions_in_range(Version.__table__)). \
+        where(and_(*_get_version_range_filter(repository, start, end))). \
+        order_by(Commit.timestamp). \
+        limit(1)
+    boundaries = [start] + [session.execute(query.offset(version_count * i // count)).scalar()
+                            for i in range(1, count)] + [end]
+    return [(partition_start, partition_end) for partition_start, partition_end in zip(boundaries, boundaries[1:])
+            if partition_start < partition_end]
+
+
+def _add_version_to_dataset(dataset, builder, i, version, feature_index, target_id, ngram_sizes, ngram_levels,
+                            ngram_hash_size=None):
+    """ Writes the targets and timestamp of a version into row i of the dataset and adds its features to the builder.
+
+    The feature_index, see get_feature_index, maps each feature ID to its column.
+    """
+    if len(version.upcoming_bugs) == 0:
+        raise Exception("Version %s has no upcoming_bugs entry. Can't retrieve target!" % version.id)
+    dataset.targets[i] = [version.upcoming_bugs[0].get_target(target) for target in TARGETS]
+    dataset.target[i] = dataset.targets[i, get_target_index(target_id)]
+    dataset.timestamps[i] = version.commit.timestamp
+
+    # The feature values of a version are unordered and some may be missing, so each is placed by its feature ID
+    columns, values = [], []
+    for feature_value in version.feature_values:
+        j = feature_index.get(feature_value.feature_id)
+        if j is not None and feature_value.value:
+            columns.append(j)
+            values.append(feature_value.value)
+    builder.add_row(i, columns, values)
+    j = len(feature_index)
+    if ngram_sizes and ngram_levels:
+        ngram_vectors = get_ngram_vector_list(version, ngram_sizes, ngram_levels)
+        vector_indices, positions, ngram_values = NGramCodec.decode_batch_nonzero(
+            [ngram_vector.ngram_values for ngram_vector in ngram_vectors],
+            [_get_loaded_ngram_blob(ngram_vector) for ngram_vector in ngram_vectors])
+        if ngram_hash_size:
+            ngram_keys = np.array([(vector.ngram_size, vector.ngram_level) for vector in ngram_vectors],
+                                  dtype=np.int64).reshape((-1, 2))[vector_indices]
+            columns = j + hash_ngram_positions(ngram_keys[:, 0], ngram_keys[:, 1], positions, ngram_hash_size)
+        else:
+            vector_offsets = j + np.cumsum([0] + [ngram_vector.vector_size for ngram_vector in ngram_vectors[:-1]])
+            columns = vector_offsets[vector_indices] + positions
+        builder.add_row(i, columns, ngram_values)
+
 
-    versions = []
-    for commit in commits:
-        versions += commit.versions
-    logging.debug("%i commits with %i versions found." % (len(commits), len(versions)))
+def get_dataset_from_db_chunked(session, repository, start, end, feature_list, target_id, ngram_sizes=None,
+                                ngram_levels=None, label="", eager_load=False, sparse=False,
+                                chunk_size=STREAM_CHUNK_SIZE, load_strategy=None, dtype=None, ngram_hash_size=None):
+    """ Reads a dataset from a repository in a specific time range, streaming the versions in chunks.
+
+    Only one chunk of versions is held in the session at a time. Each chunk is written into the dataset and then
+    removed from the session, so the memory used by ORM objects depends on the chunk size, not on the range.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository to query.
+        start (datetime): The start range
+        end (datetime): The end range
+        feature_list (list[str]): A list of the feature-IDs to be read into the dataset.
+        target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+        ngram_sizes (list[int]): Optional. The ngram-sizes to be loaded in the set (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
+        label (str): The label to be assigned to the dataset.
+        eager_load (bool): If true, the feature values of each chunk will be loaded eagerly. The ngram vectors of a
+            chunk are always loaded eagerly, if they are used.
+        sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        chunk_size (int): Optional. The amount of versions per chunk.
+        load_strategy (str): Optional. How related ORM objects are loaded. Use a LOAD_STRATEGY_X constant.
+        dtype: Optional. The float dtype of the data and target matrices.
+        ngram_hash_size (int): Optional. If set, all ngram vectors are hashed into this many columns.
+
+    Returns:
+        Dataset: The populated dataset.
+    """
+    use_ngrams = True if ngram_sizes and ngram_levels else False
+    version_count = count_versions_in_range(session, repository, start, end)
+    if version_count == 0:
+        logging.error("No Versions found!")
+        return None
+    logging.debug("%i versions found." % version_count)
+
+    feature_index = get_feature_index(feature_list)
+    dataset = None
+    builder = None
+    i = 0
+    for versions in get_versions_in_range_chunked(session, repository, start, end, chunk_size,
+                                                  eager_load_features=eager_load,
+                                                  eager_load_ngrams=use_ngrams,
+                                                  load_strategy=load_strategy):
+        if dataset is None:
+            ngram_count = 0
+            if use_ngrams:
+                ngrams = get_ngram_vector_list(versions[0], ngram_sizes, ngram_levels)
+                ngram_count = sum([ngram.vector_size for ngram in ngrams])
+                logging.debug("Ngram sizes %s and levels %s amount to %i total ngrams." % (
+                    str(ngram_sizes), str(ngram_levels), ngram_count))
+            dataset = Dataset(len(feature_list) + (ngram_hash_size or ngram_count), version_count, feature_list,
+                              target_id, start, end, ngram_sizes, ngram_levels, label, sparse=sparse, dtype=dtype,
+                              ngram_hash_size=ngram_hash_size)
+            if use_ngrams:
+                dataset.ngram_vector_sizes = get_ngram_vector_sizes(ngrams)
+            builder = MatrixBuilder(dataset.data.shape, dtype=dataset.dtype)
+
+        for version in versions:
+            _add_version_to_dataset(dataset, builder, i, version, feature_index, target_id, ngram_sizes, ngram_levels,
+                                    ngram_hash_size)
+            i += 1
+        logging.info("{0:.2f}% of versions processed.".format(i / version_count * 100))
+    dataset.data = builder.to_matrix(sparse)
+    logging.info("All versions processed.")
+    return dataset
+
+
+def get_dataset_from_db_bulk(session, repository, start, end, feature_list, target_id, ngram_sizes=None,
+                             ngram_levels=None, label="", sparse=False, batch_size=BULK_LOAD_BATCH_SIZE, dtype=None,
+                             ngram_hash_size=None):
+    """ Reads a dataset from a repository in a specific time range without creating any ORM objects.
+
+    The versions, feature values and ngram vectors are read with SQLAlchemy Core selects. The result rows are plain
+    tuples which are fetched in batches and turned into row index, column index and value arrays directly.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository to query.
+        start (datetime): The start range
+        end (datetime): The end range
+        feature_list (list[str]): A list of the feature-IDs to be read into the dataset.
+        target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+        ngram_sizes (list[int]): Optional. The ngram-sizes to be loaded in the set (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
+        label (str): The label to be assigned to the dataset.
+        sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        batch_size (int): Optional. The amount of result rows fetched from the DB at once.
+        dtype: Optional. The float dtype of the data and target matrices.
+        ngram_hash_size (int): Optional. If set, all ngram vectors are hashed into this many columns.
+
+    Returns:
+        Dataset: The populated dataset.
+    """
+    assert start < end, "The range start must be before the range end!"
+    use_ngrams = True if ngram_sizes and ngram_levels else False
+    target_index = get_target_index(target_id)
+
+    with _stage(label, "version query"):
+        version_ids, targets, timestamps = get_version_targets_bulk(session, repository, start, end)
+    if len(version_ids) == 0:
+        logging.error("No Versions found!")
+        return None
+    version_index = {version_id: i for i, version_id in enumerate(version_ids)}
+    logging.debug("%i versions found." % len(version_ids))
 
     feature_count = len(feature_list)
-    logging.debug("%i features found." % feature_count)
 
     ngram_count = 0
+    ngram_offsets = {}
+    ngram_vector_sizes = []
     if use_ngrams:
-        ngrams = get_ngram_vector_list(versions[0], ngram_sizes, ngram_levels)
-        ngram_count = sum([ngram.vector_size for ngram in ngrams])
+        with _stage(label, "ngram vector sizes"):
+            ngram_vector_sizes = [tuple(row) for row in get_ngram_vector_sizes_bulk(session, version_ids[0],
+                                                                                    ngram_sizes, ngram_levels)]
+        for ngram_size, ngram_level, vector_size in ngram_vector_sizes:
+            ngram_offsets[(ngram_size, ngram_level)] = feature_count + ngram_count
+            ngram_count += vector_size
         logging.debug("Ngram sizes %s and levels %s amount to %i total ngrams." % (
             str(ngram_sizes), str(ngram_levels), ngram_count))
 
-    dataset = Dataset(feature_count + ngram_count, len(versions), feature_list, target_id, start, end, ngram_sizes,
-                      ngram_levels, label, sparse=sparse, dok=True)
-    i = 0
-    for version in versions:
-        if len(version.upcoming_bugs) == 0:
-            raise Exception("Version %s has no upcoming_bugs entry. Can't retrieve target!" % version.id)
-        target = version.upcoming_bugs[0].get_target(target_id)
-        if target is None:
-            raise Exception("Upcoming_bugs entry of Version %s has no target %s!" % (version.id, target))
-        dataset.target[i] = target
-
-        j = 0
-        for feature_value in version.feature_values:
-            if feature_value.feature_id in feature_list:
-                if not sparse or feature_value.value != 0:
-                    dataset.data[i, j] = feature_value.value
-                j += 1
-        if use_ngrams:
-            for ngram_vector in get_ngram_vector_list(version, ngram_sizes, ngram_levels):
-                for ngram_value in ngram_vector.ngram_values.split(','):
-                    ngram_value = int(ngram_value)
-                    if not sparse or ngram_value != 0:
-                        dataset.data[i, j] = ngram_value
-                    j += 1
+    dataset = Dataset(feature_count + (ngram_hash_size or ngram_count), len(version_ids), feature_list, target_id,
+                      start, end, ngram_sizes, ngram_levels, label, sparse=sparse, dtype=dtype,
+                      ngram_hash_size=ngram_hash_size)
+    dataset.ngram_vector_sizes = ngram_vector_sizes
+    dataset.targets = np.array(targets, dtype=dataset.dtype).reshape((len(version_ids), len(TARGETS)))
+    dataset.target = dataset.targets[:, target_index]
+    dataset.timestamps = np.array(timestamps, dtype=TIMESTAMP_DTYPE)
+    builder = MatrixBuilder(dataset.data.shape, dtype=dataset.dtype)
+
+    with _stage(label, "feature values"):
+        add_feature_values_bulk(session, builder, repository, start, end, feature_list, version_index, batch_size)
+    logging.debug("Feature values received.")
 
-        if i % 100 == 0:
-            logging.info("{0:.2f}% of versions processed.".format(i / len(versions) * 100))
+    if use_ngrams:
+        ngram_blob = has_ngram_blob_column(session.get_bind())
+        ngram_query = get_ngram_vectors_query(repository, start, end, ngram_sizes, ngram_levels, ngram_blob)
+        for batch in _fetch_batches(session, ngram_query, batch_size,
+                                    stage_name=_get_stage_name(label, "ngram vectors")):
+            batch = _skip_unknown_versions(batch, version_index)
+            if not batch:
+                continue
+            vector_indices, positions, ngram_values = NGramCodec.decode_batch_nonzero(
+                [row[3] for row in batch], [row[4] for row in batch] if ngram_blob else None)
+            rows = np.array([version_index[row[0]] for row in batch], dtype=np.int64)
+            if ngram_hash_size:
+                ngram_keys = np.array([(row[1], row[2]) for row in batch], dtype=np.int64)[vector_indices]
+                columns = feature_count + hash_ngram_positions(ngram_keys[:, 0], ngram_keys[:, 1], positions,
+                                                               ngram_hash_size)
+            else:
+                column_offsets = np.array([ngram_offsets[(row[1], row[2])] for row in batch], dtype=np.int64)
+                columns = column_offsets[vector_indices] + positions
+            builder.add_entries(rows[vector_indices], columns, ngram_values)
+        logging.debug("Ngram vectors received.")
 
-        i += 1
+    dataset.data = builder.to_matrix(sparse)
     logging.info("All versions processed.")
+    return dataset
 
-    if sparse:
-        dataset.to_csr()
 
-    session.close()
-    return dataset
+def add_feature_values_bulk(session, builder, repository, start, end, feature_list, version_index,
+                            batch_size=BULK_LOAD_BATCH_SIZE):
+    """ Reads the feature values of all versions in a range into a matrix builder.
+
+    The packed feature vectors of the version_feature_vector table are read first, which needs one row per version.
+    The feature values of versions without a packed vector and of features which are not in the vector dictionary
+    yet are read from the feature_value table, with one row per version and feature. So are the values missing from a
+    packed vector, since they may have been added after it was packed.
+
+    Args:
+        session (Session): The DB-Session to use.
+        builder (MatrixBuilder): The builder of the dataset matrix. Feature j is written to column j.
+        repository (Repository): The repository to query.
+        start (datetime): The start range
+        end (datetime): The end range
+        feature_list (list[str]): The feature-IDs to read.
+        version_index (dict): The row of each version ID in the dataset matrix.
+        batch_size (int): Optional. The amount of result rows fetched from the DB at once.
+    """
+    feature_index = get_feature_index(feature_list)
+    vector_positions = get_feature_vector_positions(session, feature_list)
+    packed_features = [feature_id for feature_id in feature_list if feature_id in vector_positions]
+    packed_version_ids = set()
+    missing_columns = {}  # The columns of packed features which are missing from the packed vector, by version ID
+    if packed_features:
+        positions = np.array([vector_positions[feature_id] for feature_id in packed_features], dtype=np.int64)
+        columns = np.array([feature_index[feature_id] for feature_id in packed_features], dtype=np.int64)
+        for batch in _fetch_batches(session, get_feature_vectors_query(repository, start, end), batch_size):
+            rows, batch_columns, values = [], [], []
+            for version_id, feature_vector in _skip_unknown_versions(batch, version_index):
+                feature_vector = decode_feature_vector(feature_vector)
+                available = positions < len(feature_vector)
+                vector_values = feature_vector[positions[available]]
+                present = ~np.isnan(vector_values)
+                rows.append(np.full(np.count_nonzero(present), version_index[version_id], dtype=np.int64))
+                batch_columns.append(columns[available][present])
+                values.append(vector_values[present])
+                packed_version_ids.add(version_id)
+                if not present.all() or not available.all():
+                    missing_columns[version_id] = set(columns[~available]) | set(columns[available][~present])
+            if rows:
+                builder.add_entries(np.concatenate(rows), np.concatenate(batch_columns), np.concatenate(values))
+        logging.debug("%i packed feature vectors received." % len(packed_version_ids))
+
+    feature_queries = []
+    unpacked_features = [feature_id for feature_id in feature_list if feature_id not in vector_positions]
+    if unpacked_features:
+        feature_queries.append(get_feature_values_query(repository, start, end, unpacked_features))
+    if packed_features and len(packed_version_ids) < len(version_index):
+        if not packed_version_ids:
+            feature_queries.append(get_feature_values_query(repository, start, end, packed_features))
+        else:
+            unpacked_version_ids = [version_id for version_id in version_index if version_id not in packed_version_ids]
+            logging.debug("%i versions have no packed feature vector." % len(unpacked_version_ids))
+            for i in range(0, len(unpacked_version_ids), STREAM_CHUNK_SIZE):
+                feature_queries.append(get_feature_values_query(repository, start, end, packed_features,
+                                                                unpacked_version_ids[i:i + STREAM_CHUNK_SIZE]))
+    for feature_query in feature_queries:
+        for batch in _fetch_batches(session, feature_query, batch_size):
+            # NULL values are left at 0, like in the ORM loader
+            batch = [row for row in _skip_unknown_versions(batch, version_index) if row[2] is not None]
+            builder.add_entries([version_index[row[0]] for row in batch],
+                                [feature_index[row[1]] for row in batch],
+                                [row[2] for row in batch])
+
+    if missing_columns:
+        _add_missing_packed_feature_values(session, builder, repository, start, end, packed_features, feature_index,
+                                           version_index, missing_columns, batch_size)
+
+
+def _add_missing_packed_feature_values(session, builder, repository, start, end, packed_features, feature_index,
+                                       version_index, missing_columns, batch_size):
+    """ Reads the values of packed features which are missing from the packed vectors from the feature_value table.
+
+    Most of them are just missing, but values added after the vectors were packed would be lost otherwise. Only the
+    missing columns of each version are added, since the builder sums up duplicate entries.
+    """
+    missing_version_ids = sorted(missing_columns)
+    logging.debug("%i packed feature vectors miss feature values." % len(missing_version_ids))
+    stale_count = 0
+    for i in range(0, len(missing_version_ids), STREAM_CHUNK_SIZE):
+        feature_query = get_feature_values_query(repository, start, end, packed_features,
+                                                 missing_version_ids[i:i + STREAM_CHUNK_SIZE])
+        for batch in _fetch_batches(session, feature_query, batch_size):
+            batch = [row for row in batch if feature_index[row[1]] in missing_columns[row[0]] and row[2] is not None]
+            builder.add_entries([version_index[row[0]] for row in batch],
+                                [feature_index[row[1]] for row in batch],
+                                [row[2] for row in batch])
+            stale_count += len(batch)
+    if stale_count:
+        logging.warning("%i feature values are missing from the packed feature vectors. Run db_tools.py "
+                        "refresh-feature-vectors --rebuild to pack them." % stale_count)
+
+
+def get_feature_index(feature_list):
+    """ Returns the column of each feature in the data matrix of a dataset, by feature ID. """
+    return {feature_id: j for j, feature_id in enumerate(feature_list)}
+
+
+def get_feature_vector_positions(session, feature_list):
+    """ Returns the position of each feature in the packed feature vectors. Features which are not packed are missing.
+
+    Args:
+        session (Session): The DB-Session to use.
+        feature_list (list[str]): The feature-IDs to look up.
+
+    Returns:
+        dict: The positions by feature ID.
+    """
+    query = select([FeatureVectorColumn.feature_id, FeatureVectorColumn.position]). \
+        where(FeatureVectorColumn.feature_id.in_(feature_list))
+    return {feature_id: position for feature_id, position in session.execute(query)}
+
+
+def hash_ngram_positions(ngram_sizes, ngram_levels, positions, ngram_hash_size):
+    """ Maps positions within ngram vectors to one of ngram_hash_size columns (the hashing trick).
+
+    The ngram size, level and position are combined into one key, which is hashed by multiplication. The column only
+    depends on these, so all datasets with the same hash size share their columns, no matter how large the vectors
+    are. Values of ngrams which are hashed into the same column of a row are summed up.
+
+    Args:
+        ngram_sizes (ndarray): The ngram size of each entry.
+        ngram_levels (ndarray): The ngram level of each entry.
+        positions (ndarray): The position of each entry within its ngram vector.
+        ngram_hash_size (int): The amount of columns.
+
+    Returns:
+        ndarray: The column of each entry, between 0 and ngram_hash_size - 1.
+    """
+    keys = (np.asarray(ngram_sizes, dtype=np.uint64) << np.uint64(48)) | \
+           (np.asarray(ngram_levels, dtype=np.uint64) << np.uint64(32)) | np.asarray(positions, dtype=np.uint64)
+    # The multiplication wraps. Its upper 32 bits depend on all bits of the key and are scaled to the column range.
+    hashes = (keys * NGRAM_HASH_MULTIPLIER) >> np.uint64(32)
+    return ((hashes * np.uint64(ngram_hash_size)) >> np.uint64(32)).astype(np.int64)
+
+
+def get_duplicate_row_groups(data, targets):
+    """ Groups the identical rows of a data matrix and its targets.
+
+    The rows are hashed by their raw bytes, so only exact duplicates are grouped.
+
+    Args:
+        data (ndarray|csr_matrix): The data matrix.
+        targets (ndarray): The targets matrix, or the target vector.
+
+    Returns:
+        tuple(ndarray, ndarray): The first row of each group, in row order, and the group index of each row.
+    """
+    if issparse(data):
+        # The rows are compared by their column indices and values, which must be sorted and without explicit zeros
+        data = data.tocsr(copy=True)
+        data.sum_duplicates()
+        data.eliminate_zeros()
+        row_keys = (data.indices[row_start:row_end].tobytes() + data.data[row_start:row_end].tobytes()
+                    for row_start, row_end in zip(data.indptr[:-1], data.indptr[1:]))
+    else:
+        row_keys = (row.tobytes() for row in np.ascontiguousarray(data))
+    targets = np.ascontiguousarray(targets)
+
+    group_index = {}
+    groups = np.empty(len(targets), dtype=np.int64)
+    for i, (row_key, target_row) in enumerate(zip(row_keys, targets)):
+        groups[i] = group_index.setdefault(row_key + target_row.tobytes(), len(group_index))
+    first_rows = np.unique(groups, return_index=True)[1]
+    return first_rows, groups
+
+
+def get_sample_weight(dataset):
+    """ Returns the sample weights of a dataset. Rows of datasets which were not collapsed have a weight of 1. """
+    if dataset.sample_weight is None:
+        return np.ones(dataset.data.shape[0])
+    return dataset.sample_weight
+
+
+def get_column_statistics(data):
+    """ Counts the nonzero values of each column of a data matrix and checks which columns are constant.
+
+    For CSR matrices only the stored values are visited, once.
+
+    Args:
+        data (ndarray|csr_matrix): The data matrix.
+
+    Returns:
+        tuple(ndarray, ndarray): The amount of nonzero values of each column and a boolean mask of the constant columns.
+    """
+    row_count, column_count = data.shape
+    if not issparse(data):
+        nonzero_counts = np.count_nonzero(data, axis=0)
+        return nonzero_counts, np.all(data == data[:1], axis=0)
+
+    data = data.tocsr()
+    if not data.has_canonical_format:
+        data = data.copy()
+        data.sum_duplicates()
+    nonzero = data.data != 0
+    columns = data.indices[nonzero]
+    values = data.data[nonzero]
+    nonzero_counts = np.bincount(columns, minlength=column_count)
+    column_min = np.full(column_count, np.inf)
+    column_max = np.full(column_count, -np.inf)
+    np.minimum.at(column_min, columns, values)
+    np.maximum.at(column_max, columns, values)
+    # Columns with implicit zeros are only constant if they have no nonzero values at all
+    constant = (nonzero_counts == 0) | ((nonzero_counts == row_count) & (column_min == column_max))
+    return nonzero_counts, constant
+
+
+def get_dtype(dtype):
+    """ Returns the numpy dtype for the dtype of a dataset. Raises a ValueError for dtypes which are no float types.
+
+    Args:
+        dtype: The dtype or its name, e.g. 'float32'. If None, DATA_DTYPE is used.
+
+    Returns:
+        numpy.dtype: The dtype.
+    """
+    dtype = np.dtype(dtype or DATA_DTYPE)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError("%s is not a valid dataset dtype! Only float dtypes are supported." % dtype)
+    return dtype
+
+
+def get_target_index(target_id):
+    """ Returns the column of a target in the targets matrix of a dataset. Raises a ValueError for unknown targets. """
+    target_id = target_id.upper()
+    if target_id not in TARGETS:
+        raise ValueError("%s is not a valid target!" % target_id)
+    return TARGETS.index(target_id)
+
+
+def get_version_targets_bulk(session, repository, start, end):
+    """ Retrieves the IDs, targets and timestamps of all versions in a range, ordered by commit timestamp.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository from which to retrieve the versions.
+        start (datetime): The earliest commit to retrieve.
+        end (datetime): The latest commit to retrieve.
+
+    Returns:
+        tuple(list[str], list[tuple], list[datetime]): The version IDs, their targets in the order of TARGETS and
+            commit timestamps.
+    """
+    version_ids, targets, timestamps = [], [], []
+    for row in session.execute(get_version_targets_query(repository, start, end)):
+        if row[2] is None:
+            raise Exception("Version %s has no upcoming_bugs entry. Can't retrieve target!" % row[0])
+        version_ids.append(row[0])
+        timestamps.append(row[1])
+        targets.append(tuple(row[2:]))
+    return version_ids, targets, timestamps
+
+
+def get_version_targets_query(repository, start, end):
+    """ Returns the select of the IDs, commit timestamps and targets of all versions in a range. """
+    target_columns = [get_target_column(target) for target in TARGETS]
+    return select([Version.id, Commit.timestamp] + target_columns). \
+        select_from(_join_versions_in_range(Version.__table__).outerjoin(
+            UpcomingBugsForVersion.__table__, UpcomingBugsForVersion.version_id == Version.id)). \
+        where(and_(*_get_version_range_filter(repository, start, end))). \
+        order_by(Commit.timestamp, Version.id)
+
+
+def get_feature_values_query(repository, start, end, feature_list, version_ids=None):
+    """ Returns the select of the version ID, feature ID and value of the feature values of all versions in a range.
+
+    If version_ids is given, only the feature values of these versions are selected.
+    """
+    query = select([FeatureValue.version_id, FeatureValue.feature_id, FeatureValue.value]). \
+        select_from(_join_versions_in_range(FeatureValue.__table__.join(Version.__table__))). \
+        where(and_(FeatureValue.feature_id.in_(feature_list), *_get_version_range_filter(repository, start, end)))
+    if version_ids is not None:
+        query = query.where(FeatureValue.version_id.in_(version_ids))
+    return query
+
+
+def get_feature_vectors_query(repository, start, end):
+    """ Returns the select of the version ID and packed feature vector of all versions in a range. """
+    return select([VersionFeatureVector.version_id, VersionFeatureVector.feature_vector]). \
+        select_from(_join_versions_in_range(VersionFeatureVector.__table__.join(Version.__table__))). \
+        where(and_(*_get_version_range_filter(repository, start, end)))
+
+
+def get_ngram_vectors_query(repository, start, end, ngram_sizes, ngram_levels, ngram_blob=True):
+    """ Returns the select of the keys and encoded values of the ngram vectors of all versions in a range.
+
+    The binary encoded values are only selected if ngram_blob is set, since the column doesn't exist in DBs whose
+    ngram vectors were not migrated yet, see has_ngram_blob_column.
+    """
+    columns = [NGramVector.version_id, NGramVector.ngram_size, NGramVector.ngram_level, NGramVector.ngram_values]
+    if ngram_blob:
+        columns.append(NGramVector.ngram_blob)
+    return select(columns). \
+        select_from(_join_versions_in_range(NGramVector.__table__.join(Version.__table__))). \
+        where(and_(NGramVector.ngram_size.in_(ngram_sizes), NGramVector.ngram_level.in_(ngram_levels),
+                   *_get_version_range_filter(repository, start, end)))
+
+
+def has_ngram_blob_column(bind):
+    """ Checks if the ngram_vector table has the ngram_blob column. It is added by db_tools.py migrate-ngrams.
+
+    Args:
+        bind (Engine|Connection): The DB engine or connection to inspect.
+
+    Returns:
+        bool: True, if the binary encoded ngram vectors can be read.
+    """
+    columns = inspect(bind).get_columns(NGramVector.__tablename__)
+    return any(column['name'] == NGramVector.ngram_blob.key for column in columns)
+
+
+def _get_loaded_ngram_blob(ngram_vector):
+    # The deferred blob is only used if it was loaded with the vector. Accessing it would load it on its own.
+    return ngram_vector.__dict__.get(NGramVector.ngram_blob.key)
+
+
+def get_ngram_vector_sizes_bulk(session, version_id, ngram_sizes, ngram_levels):
+    """ Retrieves the vector sizes of the ngram vectors of one version, ordered by ngram size first, levels second.
+
+    Args:
+        session (Session): The DB-Session to use.
+        version_id (str): The ID of the version.
+        ngram_sizes (list[int]): The ngram sizes which should be retrieved.
+        ngram_levels (list[int]): The ngram levels which should be retrieved.
+
+    Returns:
+        list[tuple(int, int, int)]: Tuples of ngram size, ngram level and vector size.
+    """
+    query = select([NGramVector.ngram_size, NGramVector.ngram_level, NGramVector.vector_size]). \
+        where(and_(NGramVector.version_id == version_id,
+                   NGramVector.ngram_size.in_(ngram_sizes),
+                   NGramVector.ngram_level.in_(ngram_levels))). \
+        order_by(NGramVector.ngram_size, NGramVector.ngram_level)
+    return session.execute(query).fetchall()
+
+
+def _join_versions_in_range(selectable):
+    """ Joins commit and file to a selectable containing the version table, so it can be filtered by range. """
+    return selectable.join(Commit.__table__).join(File.__table__)
+
+
+def _get_version_range_filter(repository, start, end):
+    return [
+        File.language == 'JAVA',
+        Version.deleted == False,
+        Commit.repository_id == repository.id,
+        Commit.timestamp >= start,
+        Commit.timestamp < end,
+    ]
+
+
+def _skip_unknown_versions(batch, version_index):
+    """ Removes the rows of versions which are not in the dataset from a batch fetched by _fetch_batches.
+
+    The batches are fetched on a separate connection, outside of the transaction which read the versions of the
+    dataset. So they may contain versions which were added in the meantime.
+    """
+    unknown_count = sum(1 for row in batch if row[0] not in version_index)
+    if not unknown_count:
+        return batch
+    logging.debug("Skipping %i rows of versions which were added after the dataset was read." % unknown_count)
+    return [row for row in batch if row[0] in version_index]
+
+
+def _fetch_batches(session, query, batch_size, queue_size=FETCH_QUEUE_SIZE, stage_name=None):
+    """ Executes a query and yields the result rows in batches of plain tuples.
+
+    The query runs on a separate connection in a background thread, which fetches the next batches while the caller
+    decodes the current one. This hides the DB latency behind the decoding. The batches are passed through a queue of
+    at most queue_size batches, so the fetching blocks when the decoding falls behind.
+
+    Args:
+        session (Session): The DB-Session whose engine is used.
+        query: The query to execute.
+        batch_size (int): The amount of rows per batch.
+        queue_size (int): Optional. The maximum amount of batches fetched ahead.
+        stage_name (str): Optional. The pipeline stage the query is assigned to. Defaults to the stage of the caller.
+
+    Returns:
+        Iterator[list[tuple]]: The batches of result rows.
+    """
+    logging.debug("Running query %s" % str(query))
+    engine = session.get_bind()
+    batches = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+    end_of_result = object()
+    stage_name = stage_name or DB.get_stage()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch():
+        try:
+            with DB.stage(stage_name):
+                fetch_rows()
+            put(end_of_result)
+        except Exception as e:
+            put(e)
+
+    def fetch_rows():
+        connection = engine.connect()
+        try:
+            result = connection.execute(query)
+            while True:
+                batch = result.fetchmany(batch_size)
+                if not batch or not put(batch):
+                    break
+            result.close()
+        finally:
+            connection.close()
+
+    fetch_thread = threading.Thread(target=fetch, name="fetch_batches", daemon=True)
+    fetch_thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is end_of_result:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        stopped.set()
+        fetch_thread.join()
+
+
+def _stage(label, name):
+    """ Returns a context manager assigning the DB statements of the current thread to a stage of a dataset. """
+    return DB.stage(_get_stage_name(label, name))
+
+
+def _get_stage_name(label, name):
+    return "%s: %s" % (label, name) if label else name
 
 
 def get_repository_by_name(session, name):
@@ -243,40 +1456,37 @@ def get_repository_by_name(session, name):
     return repository
 
 
-def get_commits_in_range(session, repository, start, end, eager_load_features=False, eager_load_ngrams=False):
-    """ Retrieves Commits with eagerly loaded versions, feature_values and upcoming_bugs.
+def get_versions_in_range(session, repository, start, end, eager_load_features=False, eager_load_ngrams=False,
+                          load_strategy=None):
+    """ Retrieves the versions in a range with their commit and upcoming_bugs, ordered by commit timestamp.
+
+    With LOAD_STRATEGY_SELECTIN, each relationship is loaded with its own query, which selects the related objects of
+    all versions with batched IN clauses. The amount of rows grows linearly with the related objects. With
+    LOAD_STRATEGY_JOINED, all relationships are joined into a single query, whose rows are the cartesian product of
+    the feature values and ngram vectors of each version.
 
     Args:
         session (Session): The DB-Session to use.
-        repository (Repository): The repository from which to retrieve the commits.
+        repository (Repository): The repository from which to retrieve the versions.
         start (datetime): The earliest commit to retrieve.
         end (datetime): The latest commit to retrieve.
-        eager_load_features (bool): If feature values should be joined eagerly. Might use a lot of memory
-        eager_load_ngrams (bool): If ngram values should be joined eagerly. Might use a lot of memory
+        eager_load_features (bool): If feature values should be loaded eagerly. Might use a lot of memory
+        eager_load_ngrams (bool): If ngram values should be loaded eagerly. Might use a lot of memory
+        load_strategy (str): Optional. How the relationships are loaded. Use a LOAD_STRATEGY_X constant.
+            Defaults to LOAD_STRATEGY_SELECTIN.
 
     Returns:
-        List[Commit] A list of commits. None, if something went wrong.
+        List[Version] A list of versions. None, if something went wrong.
     """
     assert start < end, "The range start must be before the range end!"
-    logging.debug("Querying for Commits in repository with id %s and between %s and %s" % (repository.id, start, end))
+    logging.debug("Querying for Versions in repository with id %s and between %s and %s" % (repository.id, start, end))
+    query = session.query(Version).join(Version.commit).join(Version.file). \
+        options(contains_eager(Version.commit)). \
+        filter(*_get_version_range_filter(repository, start, end)). \
+        order_by(Commit.timestamp, Version.id)
+    query = _add_version_loader_options(query, load_strategy, eager_load_features, eager_load_ngrams,
+                                        eager_load_ngrams and has_ngram_blob_column(session.get_bind()))
     try:
-        query = session.query(Commit). \
-            options(joinedload(Commit.versions)). \
-            options(joinedload('versions.file')). \
-            options(joinedload('versions.upcoming_bugs'))
-
-        if eager_load_features:
-            query = query.options(joinedload('versions.feature_values'))
-
-        if eager_load_ngrams or True:
-            query = query.options(joinedload('versions.ngram_vectors'))
-
-        query = query.filter(
-            text("file_1.language = 'JAVA'"),  # Pretty much faked this one, but hey it works.
-            text("version_1.deleted = 0"),
-            Commit.repository_id == repository.id,
-            Commit.timestamp >= start,
-            Commit.timestamp < end)
         logging.debug("Running query %s" % str(query))
         return query.all()
     except:
@@ -285,6 +1495,100 @@ def get_commits_in_range(session, repository, start, end, eager_load_features=Fa
         return None
 
 
+def _add_version_loader_options(query, load_strategy, eager_load_features, eager_load_ngrams, load_ngram_blob=False):
+    """ Adds the loader options for the relationships of versions to a query.
+
+    The deferred ngram_blob column of eagerly loaded ngram vectors is only loaded if load_ngram_blob is set.
+    """
+    load_strategy = (load_strategy or LOAD_STRATEGY_SELECTIN).upper()
+    if load_strategy == LOAD_STRATEGY_SELECTIN:
+        loader = selectinload
+    elif load_strategy == LOAD_STRATEGY_JOINED:
+        loader = joinedload
+    else:
+        raise ValueError("The load strategy %s is not supported." % load_strategy)
+
+    query = query.options(loader(Version.upcoming_bugs))
+    if eager_load_features:
+        query = query.options(loader(Version.feature_values))
+    if eager_load_ngrams:
+        ngram_loader = loader(Version.ngram_vectors)
+        if load_ngram_blob:
+            ngram_loader = ngram_loader.undefer(NGramVector.ngram_blob)
+        query = query.options(ngram_loader)
+    return query
+
+
+def count_versions_in_range(session, repository, start, end):
+    """ Counts the versions of a repository in a range.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository from which to count the versions.
+        start (datetime): The earliest commit to count.
+        end (datetime): The latest commit to count.
+
+    Returns:
+        int: The amount of versions.
+    """
+    query = select([func.count(Version.id)]). \
+        select_from(_join_versions_in_range(Version.__table__)). \
+        where(and_(*_get_version_range_filter(repository, start, end)))
+    return session.execute(query).scalar()
+
+
+def get_versions_in_range_chunked(session, repository, start, end, chunk_size, eager_load_features=False,
+                                  eager_load_ngrams=False, load_strategy=None):
+    """ Retrieves the versions in a range chunk by chunk, ordered by commit timestamp.
+
+    The version IDs are read through a server-side cursor (stream_results) on a separate connection. For each chunk
+    of IDs, the versions are loaded with their upcoming_bugs. After the caller has processed a chunk, all objects are
+    expunged from the session, so they can be garbage collected.
+
+    Args:
+        session (Session): The DB-Session to use.
+        repository (Repository): The repository from which to retrieve the versions.
+        start (datetime): The earliest commit to retrieve.
+        end (datetime): The latest commit to retrieve.
+        chunk_size (int): The amount of versions per chunk.
+        eager_load_features (bool): If feature values should be loaded eagerly.
+        eager_load_ngrams (bool): If ngram values should be loaded eagerly.
+        load_strategy (str): Optional. How the relationships are loaded. Use a LOAD_STRATEGY_X constant.
+
+    Returns:
+        Iterator[List[Version]]: The chunks of versions.
+    """
+    assert start < end, "The range start must be before the range end!"
+    assert chunk_size > 0, "The chunk size must be higher than 0!"
+    id_query = select([Version.id]). \
+        select_from(_join_versions_in_range(Version.__table__)). \
+        where(and_(*_get_version_range_filter(repository, start, end))). \
+        order_by(Commit.timestamp, Version.id)
+    logging.debug("Streaming version IDs with query %s" % str(id_query))
+
+    load_ngram_blob = eager_load_ngrams and has_ngram_blob_column(session.get_bind())
+    connection = session.get_bind().connect().execution_options(stream_results=True)
+    try:
+        result = connection.execute(id_query)
+        while True:
+            id_rows = result.fetchmany(chunk_size)
+            if not id_rows:
+                break
+            positions = {row[0]: position for position, row in enumerate(id_rows)}
+
+            query = session.query(Version). \
+                options(joinedload(Version.commit)). \
+                filter(Version.id.in_(positions.keys()))
+            query = _add_version_loader_options(query, load_strategy, eager_load_features, eager_load_ngrams,
+                                                load_ngram_blob)
+
+            yield sorted(query.all(), key=lambda version: positions[version.id])
+            session.expunge_all()
+        result.close()
+    finally:
+        connection.close()
+
+
 def _is_ngram_vector_relevant(ngram_vector, ngram_sizes, ngram_levels):
     return ngram_vector.ngram_size in ngram_sizes and ngram_vector.ngram_level in ngram_levels
 
@@ -305,82 +1609,335 @@ def get_ngram_vector_list(version, ngram_sizes, ngram_levels):
     )
 
 
-def hash_features(feature_list):
-    """ Computes a hash string from a list of feature-IDs. """
-    m = hashlib.md5()
-    for feature in feature_list:
-        m.update(feature.encode('utf8'))
-    return m.hexdigest()
+def get_ngram_vector_sizes(ngram_vectors):
+    """ Lists the ngram size, level and vector size of each ngram vector, as stored in Dataset.ngram_vector_sizes. """
+    return [(ngram_vector.ngram_size, ngram_vector.ngram_level, ngram_vector.vector_size)
+            for ngram_vector in ngram_vectors]
+
 
+def generate_cache_key_for_dataset(dataset, strftime_format="%Y_%m_%d"):
+    """ Generates the key to cache a dataset. """
+    return generate_cache_key(dataset.label, dataset.start, dataset.end, dataset.sparse, strftime_format,
+                              dataset.dtype, dataset.ngram_hash_size)
 
-def generate_filename_for_dataset(dataset, strftime_format="%Y_%m_%d"):
-    """ Generates the filename to cache a dataset. """
-    return generate_filename(dataset.label, dataset.feature_list, dataset.target_id, dataset.start, dataset.end,
-                             dataset.ngram_sizes, dataset.ngram_levels, dataset.sparse, strftime_format)
 
+def generate_cache_key(label, start, end, sparse, strftime_format="%Y_%m_%d", dtype=None, ngram_hash_size=None):
+    """ Generates the key to cache a dataset.
 
-def generate_filename(label, feature_list, target_id, start, end, ngram_sizes, ngram_levels, sparse,
-                      strftime_format="%Y_%m_%d"):
-    """ Generates the filename to cache a dataset. """
-    feature_hash = hash_features(feature_list)
+    The features, ngrams and target are not part of the key. The cached dataset holds all targets and the superset of
+    all features and ngrams requested for a key, see covers_columns and merge_columns.
+    """
     start_str = start.strftime(strftime_format)
     end_str = end.strftime(strftime_format)
-    if ngram_levels and ngram_sizes:
-        ngram_str = "ngrams_" + "-".join([str(x) for x in ngram_sizes]) + "_" + "-".join([str(x) for x in ngram_levels])
-    else:
-        ngram_str = "ngrams_no"
     sparse_str = "sparse" if sparse else "dense"
-    return "_".join(
-        [label, start_str, end_str, target_id, ngram_str, sparse_str, feature_hash]) + ".dataset"
+    key_parts = [label, start_str, end_str, sparse_str]
+    dtype = get_dtype(dtype)
+    if dtype != DATA_DTYPE:
+        key_parts.append(dtype.name)
+    if ngram_hash_size:
+        key_parts.append("hash%i" % ngram_hash_size)
+    return "_".join(key_parts)
+
 
+def covers_columns(columns, feature_list, ngram_sizes, ngram_levels):
+    """ Checks if a cached dataset contains all requested features and ngrams.
+
+    Args:
+        columns (dict): The metadata of the cached dataset, as returned by get_dataset_metadata.
+        feature_list (list[str]): The requested feature-IDs.
+        ngram_sizes (list[int]): Optional. The requested ngram-sizes.
+        ngram_levels (list[int]): Optional. The requested ngram-levels.
+
+    Returns:
+        bool: True if the requested columns can be selected from the cached dataset.
+    """
+    if not set(feature_list).issubset(columns['feature_list']):
+        return False
+    if not (ngram_sizes and ngram_levels):
+        return True
+    if columns.get('ngram_hash_size'):
+        # Hashed ngram vectors share their columns, so only the same ngram sizes and levels can be selected
+        return set(ngram_sizes) == set(columns['ngram_sizes'] or []) and \
+            set(ngram_levels) == set(columns['ngram_levels'] or [])
+    return set(ngram_sizes).issubset(columns['ngram_sizes'] or []) and \
+        set(ngram_levels).issubset(columns['ngram_levels'] or [])
 
-def get_file_header(dataset):
-    """ Generates the file header to be used in the cache file. """
-    return ",".join(dataset.feature_list)
 
+def merge_columns(columns, feature_list, ngram_sizes, ngram_levels):
+    """ Computes the union of the features and ngrams of a cached dataset and the requested ones.
 
-def save_dataset_file(dataset, directory):
+    Args:
+        columns (dict): The metadata of the cached dataset, as returned by get_dataset_metadata.
+        feature_list (list[str]): The requested feature-IDs.
+        ngram_sizes (list[int]): Optional. The requested ngram-sizes.
+        ngram_levels (list[int]): Optional. The requested ngram-levels.
+
+    Returns:
+        tuple(list[str], list[int], list[int]): The merged feature list, ngram sizes and ngram levels. The cached
+            features keep their order, new features are appended.
+    """
+    merged_feature_list = list(columns['feature_list'])
+    merged_feature_list += [feature_id for feature_id in feature_list if feature_id not in merged_feature_list]
+    if columns.get('ngram_hash_size'):
+        return merged_feature_list, ngram_sizes, ngram_levels
+    if columns['ngram_sizes'] and columns['ngram_levels']:
+        if not (ngram_sizes and ngram_levels):
+            return merged_feature_list, columns['ngram_sizes'], columns['ngram_levels']
+        return merged_feature_list, sorted(set(columns['ngram_sizes']) | set(ngram_sizes)), \
+            sorted(set(columns['ngram_levels']) | set(ngram_levels))
+    return merged_feature_list, ngram_sizes, ngram_levels
+
+
+def get_dataset_metadata(dataset):
+    """ Generates the metadata header to be saved along with a cached dataset. """
+    return {
+        'format_version': CACHE_FORMAT_VERSION,
+        'label': dataset.label,
+        'feature_list': dataset.feature_list,
+        'target_id': dataset.target_id,
+        'start': dataset.start.isoformat(),
+        'end': dataset.end.isoformat(),
+        'ngram_sizes': dataset.ngram_sizes,
+        'ngram_levels': dataset.ngram_levels,
+        'ngram_vector_sizes': [list(ngram_vector_size) for ngram_vector_size in dataset.ngram_vector_sizes],
+        'sparse': dataset.sparse,
+        'dtype': dataset.dtype.name,
+        'ngram_hash_size': dataset.ngram_hash_size,
+        'shape': list(dataset.data.shape),
+        'pruned': dataset.column_mask is not None,
+        'collapsed': dataset.sample_weight is not None,
+    }
+
+
+def save_dataset_file(dataset, dataset_cache):
     """ Cache a dataset into a file.
 
     Args:
         dataset (Dataset): The dataset to save.
-        directory (str): The directory to save it to.
+        dataset_cache (DatasetCache): The cache to save it to.
     """
-    filepath = os.path.join(directory, generate_filename_for_dataset(dataset))
-    header = get_file_header(dataset)
+    key = generate_cache_key_for_dataset(dataset)
+    logging.info("Saving dataset %s to path %s." % (dataset.label, dataset_cache.get_path(key)))
+    temp_filepath = dataset_cache.get_temp_path(key)
+    write_dataset_files(dataset, temp_filepath)
+    dataset_cache.add(key, info=get_dataset_metadata(dataset), temp_path=temp_filepath)
+    logging.debug("Saving successful")
+
 
-    logging.info("Saving dataset %s to path %s." % (dataset.label, filepath))
-    if dataset.sparse:
-        concatenated = hstack([dataset.data, dataset.target[np.newaxis].T])
-        save_sparse_matrix(concatenated, filepath)
+def write_dataset_files(dataset, filepath):
+    """ Writes a dataset into a cache directory in a binary format.
+
+    The directory contains the data, targets and timestamps as .npy files and a small JSON metadata header. Sparse data
+    is saved as its separate CSR component arrays. save_dataset_file writes the files into a temporary directory,
+    which the cache then moves into place, so concurrent runs never see a half written cache.
+
+    Args:
+        dataset (Dataset): The dataset to save.
+        filepath (str): The path of the cache directory.
+    """
+    if os.path.isdir(filepath):
+        shutil.rmtree(filepath)
+    os.makedirs(filepath)
+
+    save_matrix(dataset.data, filepath, 'data')
+    save_matrix(dataset.targets, filepath, 'targets')
+    save_matrix(dataset.timestamps, filepath, 'timestamps')
+    if dataset.column_mask is not None:
+        save_matrix(dataset.column_mask, filepath, 'column_mask')
+    if dataset.sample_weight is not None:
+        save_matrix(dataset.sample_weight, filepath, 'sample_weight')
+    with open(os.path.join(filepath, CACHE_METADATA_FILE), 'w') as f:
+        json.dump(get_dataset_metadata(dataset), f)
+
+
+def save_matrix(matrix, directory, name):
+    """ Saves a dense or CSR matrix into .npy files in a directory. """
+    if isinstance(matrix, csr_matrix):
+        np.save(os.path.join(directory, name + ".data.npy"), matrix.data)
+        np.save(os.path.join(directory, name + ".indices.npy"), matrix.indices)
+        np.save(os.path.join(directory, name + ".indptr.npy"), matrix.indptr)
     else:
-        concatenated = np.concatenate((dataset.data, dataset.target[np.newaxis].T), axis=1)
-        save_dense_matrix(concatenated, filepath, header)
-    logging.debug("Saving successful")
+        np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(matrix))
+
+
+def load_matrix(directory, name, shape=None, sparse=False, mmap_mode=CACHE_MMAP_MODE):
+    """ Loads a matrix saved by save_matrix.
+
+    The arrays are memory-mapped, so loading takes near-constant time and the pages are shared with concurrent runs.
+    With the default copy-on-write mode, the matrix can still be modified in memory without changing the cache.
+
+    Args:
+        directory (str): The directory containing the .npy files.
+        name (str): The name of the matrix.
+        shape (tuple(int, int)): The shape of the matrix. Only needed for sparse matrices.
+        sparse (bool): If the matrix was saved as CSR components.
+        mmap_mode (str): Optional. The numpy memory map mode. Use None to read the arrays into memory instead.
+
+    Returns:
+        ndarray|csr_matrix: The matrix.
+    """
+    if sparse:
+        data = np.load(os.path.join(directory, name + ".data.npy"), mmap_mode=mmap_mode)
+        indices = np.load(os.path.join(directory, name + ".indices.npy"), mmap_mode=mmap_mode)
+        indptr = np.load(os.path.join(directory, name + ".indptr.npy"), mmap_mode=mmap_mode)
+        return csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    return np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+
+
+def read_dataset_files(filepath):
+    """ Reads a dataset from a cache directory written by write_dataset_files.
+
+    Args:
+        filepath (str): The path of the cache directory.
+
+    Returns:
+        Dataset: The dataset, or None if the directory contains no readable cache.
+    """
+    metadata_filepath = os.path.join(filepath, CACHE_METADATA_FILE)
+    if not os.path.isfile(metadata_filepath):
+        return None
+    with open(metadata_filepath) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != CACHE_FORMAT_VERSION:
+        logging.debug("Cached dataset %s has an unsupported format version." % filepath)
+        return None
+
+    shape = tuple(metadata['shape'])
+    data = load_matrix(filepath, 'data', shape, metadata['sparse'])
+    targets = load_matrix(filepath, 'targets')
+    dataset = Dataset(shape[1], shape[0], metadata['feature_list'], metadata['target_id'],
+                      _parse_datetime(metadata['start']), _parse_datetime(metadata['end']), metadata['ngram_sizes'],
+                      metadata['ngram_levels'], metadata['label'], sparse=metadata['sparse'],
+                      dtype=metadata.get('dtype'), ngram_hash_size=metadata.get('ngram_hash_size'))
+    dataset.ngram_vector_sizes = [tuple(ngram_vector_size) for ngram_vector_size in metadata['ngram_vector_sizes']]
+    dataset.data = data
+    dataset.targets = targets
+    dataset.target = targets[:, get_target_index(dataset.target_id)]
+    dataset.timestamps = load_matrix(filepath, 'timestamps')
+    if metadata.get('pruned'):
+        dataset.column_mask = load_matrix(filepath, 'column_mask', mmap_mode=None)
+    if metadata.get('collapsed'):
+        dataset.sample_weight = load_matrix(filepath, 'sample_weight')
+    return dataset
+
+
+def _to_datetime(value):
+    """ Converts a date or datetime into a datetime. """
+    return _parse_datetime(value.isoformat())
+
+
+def _parse_datetime(string):
+    """ Parses a datetime or date string in ISO format, as written by isoformat(). """
+    for datetime_format in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(string, datetime_format)
+        except ValueError:
+            pass
+    raise ValueError("%s is not a valid ISO datetime." % string)
+
+
+def find_cached_prefix(dataset_cache, label, feature_list, start, end, ngram_sizes, ngram_levels, sparse, dtype=None,
+                       ngram_hash_size=None):
+    """ Finds the cached dataset which covers the longest prefix of a range.
+
+    The cached dataset must have the same parameters and start as the requested one, but end before it. It must
+    contain at least the requested features and ngrams.
+
+    Args:
+        dataset_cache (DatasetCache): The cache to search.
+        label (str): The label for the dataset.
+        feature_list (list[str]): The list of feature-IDs the dataset should contain.
+        start (datetime): The start of the range the dataset should contain.
+        end (datetime): The end of the range the dataset should contain.
+        ngram_sizes (list[int]): Optional. The ngram-sizes in this dataset (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels in this dataset.
+        sparse (bool): If the data and target matrices should be sparse.
+        dtype: Optional. The dtype of the data and target matrices.
+        ngram_hash_size (int): Optional. The amount of columns the ngram vectors are hashed into.
 
+    Returns:
+        str: The cache key of the dataset, or None if there is none.
+    """
+    start = _to_datetime(start)
+    end = _to_datetime(end)
+    dtype_name = get_dtype(dtype).name
+
+    def is_prefix(info):
+        return info.get('format_version') == CACHE_FORMAT_VERSION and \
+               info['label'] == label and \
+               info['sparse'] == sparse and \
+               info.get('dtype', np.dtype(DATA_DTYPE).name) == dtype_name and \
+               not info.get('pruned') and \
+               info.get('ngram_hash_size') == ngram_hash_size and \
+               covers_columns(info, feature_list, ngram_sizes, ngram_levels) and \
+               _parse_datetime(info['start']) == start and \
+               start < _parse_datetime(info['end']) < end
+
+    keys = dataset_cache.find(is_prefix)
+    if not keys:
+        return None
+    return max(keys, key=lambda key: _parse_datetime(dataset_cache.get_info(key)['end']))
 
-def save_dense_matrix(data, filepath, header=""):
-    np.savetxt(filepath, data, header=header)
 
+def refresh_cached_dataset(dataset_cache, repository, start, end, feature_list, target_id, ngram_sizes=None,
+                           ngram_levels=None, label="", sparse=False, dtype=None, ngram_hash_size=None, **kwargs):
+    """ Extends a cached dataset, which covers a prefix of the requested range, with the missing data from the DB.
 
-def load_dense_matrix(filepath):
-    return np.loadtxt(filepath)
+    Only the commits between the end of the cached dataset and the requested end are queried. Their rows are appended
+    to the cached data and target, and the extended dataset replaces the old one in the cache. All features and ngrams
+    of the cached dataset are kept, the requested ones are selected from it.
 
+    Args:
+        dataset_cache (DatasetCache): The cache to use.
+        repository (Repository): The repository to query. Can also be its name as a string
+        start (datetime): The start range for the dataset
+        end (datetime): The end range for the dataset
+        feature_list (list[str]): A list of the feature-IDs to be read into the dataset.
+        target_id (str): The ID of the target. Use a TARGET_X constant from UpcomingBugsForVersion
+        ngram_sizes (list[int]): Optional. The ngram-sizes to be loaded in the set (e.g. [1, 2] for 1-grams and 2-grams)
+        ngram_levels (list[int]): Optional. The ngram-levels to be loaded in the dataset.
+        label (str): The label to be assigned to the dataset.
+        sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        dtype: Optional. The float dtype of the data and target matrices.
+        ngram_hash_size (int): Optional. The amount of columns the ngram vectors are hashed into.
+        **kwargs: Further arguments for get_dataset_from_db.
 
-def save_sparse_matrix(data, filepath):
-    joblib.dump(data, filepath)
+    Returns:
+        Dataset: The extended dataset, or None if no prefix of the range is cached.
+    """
+    prefix_key = find_cached_prefix(dataset_cache, label, feature_list, start, end, ngram_sizes, ngram_levels,
+                                    sparse, dtype, ngram_hash_size)
+    if prefix_key is None:
+        return None
+    dataset = read_dataset_files(dataset_cache.lookup(prefix_key))
+    if dataset is None:
+        dataset_cache.remove(prefix_key)
+        return None
 
+    logging.info("Found cached dataset until %s. Reading the remaining range until %s from DB." % (dataset.end, end))
+    delta = get_dataset_from_db(repository, dataset.end, end, dataset.feature_list, target_id, dataset.ngram_sizes,
+                                dataset.ngram_levels, label=label, sparse=sparse, dtype=dtype,
+                                ngram_hash_size=ngram_hash_size, **kwargs)
+    if delta is not None:
+        delta.to_csr()
+        dataset.append(delta)
+    dataset.start = start
+    dataset.end = end
 
-def load_sparse_matrix(filepath):
-    return joblib.load(filepath)
+    save_dataset_file(dataset, dataset_cache)
+    dataset_cache.remove(prefix_key)
+    return dataset.select_columns(feature_list, ngram_sizes, ngram_levels).select_target(target_id)
 
 
-def load_dataset_file(directory, label, feature_list, target_id, start, end, ngram_sizes, ngram_levels,
-                      strftime_format="%Y_%m_%d", sparse=False):
+def load_dataset_file(dataset_cache, label, feature_list, target_id, start, end, ngram_sizes, ngram_levels,
+                      strftime_format="%Y_%m_%d", sparse=False, dtype=None, ngram_hash_size=None):
     """ Load a dataset from a cache file.
 
+    The requested features and ngrams are selected from the cached dataset. If it doesn't contain all of them, None
+    is returned.
+
     Args:
-        directory (str): The directory in which the file should be located.
+        dataset_cache (DatasetCache): The cache in which the file should be located.
         label (str): The label for the dataset.
         feature_list (list[str]): The list of feature-IDs the dataset should contain.
         target_id (str): The ID of the target the dataset should contain.
@@ -390,33 +1947,30 @@ def load_dataset_file(directory, label, feature_list, target_id, start, end, ngr
         ngram_levels (list[int]): Optional. The ngram-levels in this dataset.
         strftime_format (str): Optional. The datetime string format.
         sparse (bool): If the data and target matrices should be sparse. Recommended in combination with ngrams.
+        dtype: Optional. The float dtype of the data and target matrices.
+        ngram_hash_size (int): Optional. The amount of columns the ngram vectors are hashed into.
 
     Returns:
         Dataset: The dataset, if one was retrieved. Otherwise None.
     """
-    filename = generate_filename(label, feature_list, target_id, start, end, ngram_sizes, ngram_levels, sparse,
-                                 strftime_format)
-    filepath = os.path.join(directory, filename)
-    logging.debug("Attempting to load cached dataset from %s" % filepath)
-    if os.path.isfile(filepath):
-
-        if sparse:
-            concatenated = load_sparse_matrix(filepath)
-            if type(concatenated) == coo_matrix:
-                concatenated = concatenated.tocsr()
-            data, target = concatenated[:, :-1], concatenated[:, -1]
-            target = target.todense()
+    key = generate_cache_key(label, start, end, sparse, strftime_format, dtype, ngram_hash_size)
+    logging.debug("Attempting to load cached dataset %s" % key)
+    info = dataset_cache.get_info(key)
+    if info is not None and not covers_columns(info, feature_list, ngram_sizes, ngram_levels):
+        logging.debug("Cached dataset %s doesn't contain all requested features and ngrams." % key)
+        return None
+    filepath = dataset_cache.lookup(key)
+    if filepath is not None:
+        dataset = read_dataset_files(filepath)
+        if dataset is None:
+            logging.warning("Cached dataset %s is unreadable. Removing it from the cache." % key)
+            dataset_cache.remove(key)
         else:
-            concatenated = load_dense_matrix(filepath)
-            data, target = np.hsplit(concatenated, [-1])
-        target = np.squeeze(np.asarray(target))
-
-        logging.debug(
-            "Successfully retrieved data %s and target %s from cache file." % (str(data.shape), str(target.shape)))
-        dataset = Dataset(data.shape[1], data.shape[0], feature_list, target_id, start, end, ngram_sizes, ngram_levels,
-                          label, sparse=sparse)
-        dataset.data = data
-        dataset.target = target
-        return dataset
+            dataset.start = start
+            dataset.end = end
+            dataset = dataset.select_columns(feature_list, ngram_sizes, ngram_levels).select_target(target_id)
+            logging.debug("Successfully retrieved data %s and target %s from cache file." % (
+                str(dataset.data.shape), str(dataset.target.shape)))
+            return dataset
     logging.debug("Cached dataset not found.")
     return None
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# coding=utf-8
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'manifest.lock'
+FILE_EXTENSION = '.dataset'
+
+
+class DatasetCache:
+    def __init__(self, directory, size_budget=None):
+        """ Initialize a dataset cache in a directory.
+
+        The cache keeps a manifest index, which maps every cache key to its file, size, creation time and last access
+        time. Lookups only need the manifest, so no files have to be probed.
+        If a size budget is given, the least recently used files are evicted whenever the cache grows beyond it.
+
+        Args:
+            directory (str): The cache directory. Will be created if it doesn't exist.
+            size_budget (int): Optional. The maximum total size of the cache in bytes. If None, it is unlimited.
+        """
+        self.directory = directory
+        self.size_budget = size_budget
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        os.makedirs(directory, exist_ok=True)
+
+    def lookup(self, key):
+        """ Looks up the file path of a cache key and marks it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The path of the cached file, or None if the key is not cached.
+        """
+        with self._lock():
+            manifest = self._read_manifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+            entry['last_access'] = time.time()
+            self._write_manifest(manifest)
+        return os.path.join(self.directory, entry['file'])
+
+    def get_info(self, key):
+        """ Returns the info dict which was stored along with a cache key, or None if the key is not cached. """
+        entry = self._read_manifest().get(key)
+        return entry.get('info') if entry is not None else None
+
+    def find(self, predicate):
+        """ Finds the keys of all entries whose info dict matches a predicate.
+
+        Args:
+            predicate (callable): A function which receives the info dict of an entry and returns a bool.
+
+        Returns:
+            list[str]: The matching keys, most recently used first.
+        """
+        manifest = self._read_manifest()
+        matches = [key for key, entry in manifest.items() if predicate(entry.get('info') or {})]
+        return sorted(matches, key=lambda key: manifest[key]['last_access'], reverse=True)
+
+    def get_path(self, key):
+        """ Returns the path at which the file for a cache key is to be written. """
+        return os.path.join(self.directory, hashlib.md5(key.encode('utf8')).hexdigest() + FILE_EXTENSION)
+
+    def get_temp_path(self, key):
+        """ Returns a path at which the file for a cache key can be written before it is added, unique per thread. """
+        return "%s.%i.%i.tmp" % (self.get_path(key), os.getpid(), threading.get_ident())
+
+    def add(self, key, info=None, temp_path=None):
+        """ Registers the file written to get_path(key) in the manifest and evicts old files if needed.
+
+        Args:
+            key (str): The cache key.
+            info (dict): Optional. Arbitrary JSON serializable information to store along with the key.
+            temp_path (str): Optional. If set, the file is moved from this path to get_path(key) first, replacing an
+                existing file. As this happens under the manifest lock, concurrent writers of a key don't interfere.
+        """
+        path = self.get_path(key)
+        now = time.time()
+        with self._lock():
+            if temp_path is not None:
+                _delete(path)
+                os.rename(temp_path, path)
+            manifest = self._read_manifest()
+            manifest[key] = {
+                'file': os.path.basename(path),
+                'size': _get_size(path),
+                'created': now,
+                'last_access': now,
+                'info': info,
+            }
+            self._evict(manifest, keep=key)
+            self._write_manifest(manifest)
+
+    def remove(self, key):
+        """ Removes a key and its file from the cache. """
+        with self._lock():
+            manifest = self._read_manifest()
+            entry = manifest.pop(key, None)
+            if entry is not None:
+                _delete(os.path.join(self.directory, entry['file']))
+                self._write_manifest(manifest)
+
+    def get_total_size(self):
+        """ Returns the total size of all cached files in bytes. """
+        return sum(entry['size'] for entry in self._read_manifest().values())
+
+    def _evict(self, manifest, keep=None):
+        """ Removes the least recently used entries from the manifest until the size budget is met. """
+        if self.size_budget is None:
+            return
+        total_size = sum(entry['size'] for entry in manifest.values())
+        for key in sorted(manifest.keys(), key=lambda k: manifest[k]['last_access']):
+            if total_size <= self.size_budget:
+                break
+            if key == keep:
+                continue
+            entry = manifest.pop(key)
+            logging.debug("Evicting cached dataset %s" % key)
+            _delete(os.path.join(self.directory, entry['file']))
+            total_size -= entry['size']
+        if total_size > self.size_budget:
+            logging.warning("Dataset cache exceeds its size budget of %i bytes." % self.size_budget)
+
+    def _read_manifest(self):
+        if not os.path.isfile(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning("Dataset cache manifest %s is corrupt. Starting with an empty cache." % self.manifest_path)
+            return {}
+
+    def _write_manifest(self, manifest):
+        temp_path = "%s.%i.tmp" % (self.manifest_path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def _lock(self):
+        return _ManifestLock(self.lock_path)
+
+
+class _ManifestLock:
+    """ Exclusive lock on the manifest, so concurrent runs can share a cache directory. No-op without fcntl. """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, 'w')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+def _get_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, filename)) for filename in files)
+    return size
+
+
+def _delete(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.isfile(path):
+        os.remove(path)
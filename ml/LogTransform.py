@@ -25,7 +25,7 @@ def log_transform(x, base='n', plusone=True):
             x = np.log(x) / np.log(base)
     else:
         raise ValueError("'%s' is not a valid base for log transform!")
-    x[x < 0] = np.finfo(np.float64).min  # Remove -inf from array, replace with best possible approximation.
+    x[x < 0] = np.finfo(x.dtype).min  # Remove -inf from array, replace with best possible approximation.
     return x
 
 
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# coding=utf-8
+import numpy as np
+from scipy.sparse.coo import coo_matrix
+
+INITIAL_CAPACITY = 4096
+INDEX_DTYPE = np.int32
+
+
+class MatrixBuilder:
+    def __init__(self, shape, capacity=INITIAL_CAPACITY, dtype=np.float64):
+        """ Initialize an empty matrix builder.
+
+        The builder collects the nonzero entries of a matrix as (row, column, value) triplets in preallocated arrays,
+        which grow by doubling when they are full. The matrix is assembled at once in the end. This is a lot faster
+        than writing single elements into a DOK or CSR matrix.
+        Entries which are added more than once for the same cell are summed up.
+
+        Args:
+            shape (tuple(int, int)): The shape of the matrix. The row count may still be changed before assembling.
+            capacity (int): Optional. The amount of entries for which memory is allocated initially.
+            dtype: Optional. The dtype of the matrix values.
+        """
+        self.shape = shape
+        self.dtype = dtype
+        self.size = 0
+        self.rows = np.empty(capacity, dtype=INDEX_DTYPE)
+        self.columns = np.empty(capacity, dtype=INDEX_DTYPE)
+        self.values = np.empty(capacity, dtype=dtype)
+
+    def _reserve(self, count):
+        """ Makes sure there is space for count more entries. """
+        required = self.size + count
+        capacity = len(self.values)
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity = max(capacity * 2, 1)
+        self.rows = _grow(self.rows, capacity, self.size)
+        self.columns = _grow(self.columns, capacity, self.size)
+        self.values = _grow(self.values, capacity, self.size)
+
+    def add(self, row, column, value):
+        """ Adds a single entry. Zero values are skipped. """
+        if value == 0:
+            return
+        self._reserve(1)
+        self.rows[self.size] = row
+        self.columns[self.size] = column
+        self.values[self.size] = value
+        self.size += 1
+
+    def add_row(self, row, columns, values):
+        """ Adds multiple entries to one row.
+
+        Args:
+            row (int): The row index.
+            columns (array-like): The column indices.
+            values (array-like): The values. Must have the same length as columns.
+        """
+        count = len(columns)
+        self._reserve(count)
+        self.rows[self.size:self.size + count] = row
+        self.columns[self.size:self.size + count] = columns
+        self.values[self.size:self.size + count] = values
+        self.size += count
+
+    def add_entries(self, rows, columns, values):
+        """ Adds multiple entries.
+
+        Args:
+            rows (array-like): The row indices.
+            columns (array-like): The column indices.
+            values (array-like): The values. All three arrays must have the same length.
+        """
+        count = len(values)
+        self._reserve(count)
+        self.rows[self.size:self.size + count] = rows
+        self.columns[self.size:self.size + count] = columns
+        self.values[self.size:self.size + count] = values
+        self.size += count
+
+    def to_coo(self):
+        """ Assembles the collected entries into a COO matrix. """
+        return coo_matrix(
+            (self.values[:self.size], (self.rows[:self.size], self.columns[:self.size])),
+            shape=self.shape,
+            dtype=self.dtype)
+
+    def to_csr(self):
+        """ Assembles the collected entries into a CSR matrix. """
+        return self.to_coo().tocsr()
+
+    def to_dense(self):
+        """ Assembles the collected entries into a dense ndarray. """
+        return self.to_coo().toarray()
+
+    def to_matrix(self, sparse):
+        """ Assembles the collected entries into a CSR matrix if sparse is True, otherwise into a dense ndarray. """
+        if sparse:
+            return self.to_csr()
+        return self.to_dense()
+
+
+def _grow(array, capacity, size):
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
@@ -1,13 +1,19 @@
 #!/usr/bin/python
 # coding=utf-8
+import copy
 import logging
 
+import numpy as np
 from sklearn import linear_model
 from sklearn import svm
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed
 from sklearn.grid_search import GridSearchCV
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing.data import PolynomialFeatures, StandardScaler
+from sklearn.utils.validation import has_fit_parameter
 
+from ml.Dataset import get_target_index
 from ml.SparseScaler import SparseScaler
 
 MODEL_TYPE_LINREG = 'LINEAR_REGRESSION'
@@ -19,6 +25,9 @@ KERNEL_POLYNOMIAL = 'poly'
 KERNEL_RBF = 'rbf'
 KERNEL_SIGMOID = 'sigmoid'
 
+# Estimators which fit all columns of a target matrix at once. Linear models solve all targets with one factorization.
+MULTI_OUTPUT_ESTIMATORS = (linear_model.LinearRegression, linear_model.Ridge)
+
 
 # noinspection PyPep8Naming
 def create_model(model_type, feature_scaling=False, polynomial_degree=1, cross_validation=False, alpha=1.0, C=None,
@@ -163,6 +172,8 @@ def create_linear_regression_model():
 def train_model(model, train_dataset):
     """ Trains a model.
 
+    If the dataset has sample weights, e.g. because its duplicate rows were collapsed, they are passed to the estimator.
+
     Args:
         model (sklearn.pipeline.Pipeline): The model or pipeline to train.
         train_dataset (Dataset): The dataset to train the model with.
@@ -171,5 +182,85 @@ def train_model(model, train_dataset):
         (sklearn.pipeline.Pipeline) The trained estimator model.
     """
     logging.debug("Fitting training set to model")
-    model.fit(train_dataset.data, train_dataset.target)
+    estimator_name, estimator = model.steps[-1]
+    estimator, fit_params = _prepare_sample_weight(estimator, train_dataset.sample_weight)
+    model.steps[-1] = (estimator_name, estimator)
+    model.fit(train_dataset.data, train_dataset.target,
+              **{estimator_name + '__' + name: value for name, value in fit_params.items()})
     return model
+
+
+def train_multi_target_model(model, train_dataset, target_ids, n_jobs=-1):
+    """ Trains a model for multiple targets of a dataset at once.
+
+    The preprocessing steps of the pipeline, e.g. scaling, are fitted once and shared by all targets. If the estimator
+    supports multiple outputs, e.g. linear and ridge regression, all targets are fitted with a single fit on the target
+    matrix. Otherwise the estimator is fitted for each target in parallel on the transformed data.
+
+    Args:
+        model (sklearn.pipeline.Pipeline): The model or pipeline to train. It is not modified.
+        train_dataset (Dataset): The dataset to train the model with. Must contain the targets matrix.
+        target_ids (list[str]): The IDs of the targets. Use TARGET_X constants from UpcomingBugsForVersion
+        n_jobs (int): Optional. The amount of parallel fits. -1 uses all CPUs.
+
+    Returns:
+        dict: The trained pipeline for each target ID. The pipelines share their fitted preprocessing steps.
+    """
+    target_indices = [get_target_index(target_id) for target_id in target_ids]
+    targets = train_dataset.targets[:, target_indices]
+    estimator_name, estimator = model.steps[-1]
+    estimator, fit_params = _prepare_sample_weight(estimator, train_dataset.sample_weight)
+    preprocessing = clone(Pipeline(model.steps[:-1])) if len(model.steps) > 1 else None
+
+    logging.debug("Fitting preprocessing steps of the training set")
+    data = train_dataset.data
+    if preprocessing is not None:
+        data = preprocessing.fit_transform(data)
+
+    if isinstance(estimator, MULTI_OUTPUT_ESTIMATORS):
+        logging.debug("Fitting %i targets with a single multi-output fit" % len(target_ids))
+        multi_output_estimator = clone(estimator).fit(data, targets, **fit_params)
+        estimators = [_get_single_output_estimator(multi_output_estimator, i) for i in range(len(target_ids))]
+    else:
+        logging.debug("Fitting %i targets in parallel" % len(target_ids))
+        estimators = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(_fit_estimator)(clone(estimator), data, targets[:, i], fit_params) for i in range(len(target_ids)))
+
+    preprocessing_steps = preprocessing.steps if preprocessing is not None else []
+    return {target_id: Pipeline(preprocessing_steps + [(estimator_name, estimators[i])])
+            for i, target_id in enumerate(target_ids)}
+
+
+def _fit_estimator(estimator, data, target, fit_params):
+    return estimator.fit(data, target, **fit_params)
+
+
+def _prepare_sample_weight(estimator, sample_weight):
+    """ Prepares an estimator to be fitted with sample weights.
+
+    Args:
+        estimator: The unfitted estimator.
+        sample_weight (ndarray): The weight of each sample, or None.
+
+    Returns:
+        tuple: The estimator and the keyword arguments for its fit method. A grid search takes the fit parameters of
+            its estimator in its constructor, so a clone of it with the sample weights is returned instead. It splits
+            them along the cross validation folds.
+    """
+    if sample_weight is None:
+        return estimator, {}
+    if isinstance(estimator, GridSearchCV) and has_fit_parameter(estimator.estimator, 'sample_weight'):
+        fit_params = dict(estimator.fit_params or {}, sample_weight=sample_weight)
+        return clone(estimator).set_params(fit_params=fit_params), {}
+    if has_fit_parameter(estimator, 'sample_weight'):
+        return estimator, {'sample_weight': sample_weight}
+    logging.warning("%s doesn't support sample weights. All rows are weighted equally." % type(estimator).__name__)
+    return estimator, {}
+
+
+def _get_single_output_estimator(estimator, i):
+    """ Extracts the linear model of the i-th target from a fitted multi-output linear model. """
+    single_output_estimator = copy.copy(estimator)
+    single_output_estimator.coef_ = np.asarray(estimator.coef_)[i]
+    single_output_estimator.intercept_ = np.asarray(estimator.intercept_)[i]
+    return single_output_estimator
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# coding=utf-8
+import struct
+
+import numpy as np
+
+TEXT_SEPARATOR = ','
+
+# Binary encodings. A blob consists of a header (encoding, vector size) followed by the little-endian payload.
+ENCODING_DENSE_UINT16 = 1  # All values as uint16
+ENCODING_DENSE_UINT32 = 2  # All values as uint32
+ENCODING_SPARSE = 3  # The uint32 indices of all nonzero values, followed by the uint32 nonzero values
+BLOB_HEADER = struct.Struct('<BxxxI')
+UINT16_MAX = np.iinfo(np.uint16).max
+UINT32_MAX = np.iinfo(np.uint32).max
+
+
+def decode_text(ngram_values, dtype=np.int64):
+    """ Decodes a single comma-separated ngram vector string into an array. """
+    return np.fromstring(ngram_values, dtype=dtype, sep=TEXT_SEPARATOR)
+
+
+def decode_text_batch(ngram_values_list, dtype=np.int64):
+    """ Decodes a batch of comma-separated ngram vector strings at once.
+
+    All strings are joined into one buffer, which is parsed by numpy in C. This is a lot faster than splitting the
+    strings and converting every single token in Python.
+
+    Args:
+        ngram_values_list (list[str]): The ngram vector strings.
+        dtype: Optional. The dtype of the decoded values.
+
+    Returns:
+        tuple(ndarray, ndarray): The concatenated values of all vectors and the offsets of each vector within them.
+            Vector i is values[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.array([ngram_values.count(TEXT_SEPARATOR) + 1 if ngram_values else 0
+                        for ngram_values in ngram_values_list], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    values = np.fromstring(TEXT_SEPARATOR.join(v for v in ngram_values_list if v), dtype=dtype, sep=TEXT_SEPARATOR)
+    if len(values) != offsets[-1]:
+        raise ValueError("Ngram vectors could not be decoded. Expected %i values, got %i." % (offsets[-1], len(values)))
+    return values, offsets
+
+
+def get_nonzero_entries(values, offsets):
+    """ Extracts the nonzero entries of a batch of decoded ngram vectors.
+
+    Args:
+        values (ndarray): The concatenated values of all vectors, as returned by decode_text_batch.
+        offsets (ndarray): The offsets of each vector within the values, as returned by decode_text_batch.
+
+    Returns:
+        tuple(ndarray, ndarray, ndarray): For each nonzero entry: the index of its vector, its position within the
+            vector and its value.
+    """
+    nonzero = np.flatnonzero(values)
+    vector_indices = np.searchsorted(offsets, nonzero, side='right') - 1
+    positions = nonzero - offsets[vector_indices]
+    return vector_indices, positions, values[nonzero]
+
+
+def decode_text_batch_nonzero(ngram_values_list, dtype=np.int64):
+    """ Decodes a batch of comma-separated ngram vector strings and returns only their nonzero entries.
+
+    See decode_text_batch and get_nonzero_entries.
+    """
+    return get_nonzero_entries(*decode_text_batch(ngram_values_list, dtype))
+
+
+def encode_blob(ngram_vector):
+    """ Encodes an ngram vector into its compact binary representation.
+
+    The smallest of the encodings is chosen: Dense uint16 or uint32 values, or sparse index/value pairs for vectors
+    which are mostly zero.
+
+    Args:
+        ngram_vector (array-like): The ngram vector. Must contain non-negative integers only.
+
+    Returns:
+        bytes: The encoded vector.
+    """
+    ngram_vector = np.asarray(ngram_vector, dtype=np.int64)
+    max_value = ngram_vector.max() if len(ngram_vector) else 0
+    if (len(ngram_vector) and ngram_vector.min() < 0) or max_value > UINT32_MAX:
+        raise ValueError("Ngram vectors can only contain values between 0 and %i." % UINT32_MAX)
+
+    if max_value <= UINT16_MAX:
+        encoding, dense_dtype = ENCODING_DENSE_UINT16, '<u2'
+    else:
+        encoding, dense_dtype = ENCODING_DENSE_UINT32, '<u4'
+    nonzero = np.flatnonzero(ngram_vector)
+    if len(nonzero) * 8 < len(ngram_vector) * np.dtype(dense_dtype).itemsize:
+        encoding = ENCODING_SPARSE
+        payload = nonzero.astype('<u4').tobytes() + ngram_vector[nonzero].astype('<u4').tobytes()
+    else:
+        payload = ngram_vector.astype(dense_dtype).tobytes()
+    return BLOB_HEADER.pack(encoding, len(ngram_vector)) + payload
+
+
+def decode_blob_nonzero(ngram_blob, dtype=np.int64):
+    """ Decodes the nonzero entries of a binary encoded ngram vector.
+
+    Args:
+        ngram_blob (bytes): The encoded vector, as returned by encode_blob.
+        dtype: Optional. The dtype of the decoded values.
+
+    Returns:
+        tuple(ndarray, ndarray): The positions of the nonzero entries within the vector and their values.
+    """
+    encoding, vector_size = BLOB_HEADER.unpack_from(ngram_blob)
+    if encoding == ENCODING_SPARSE:
+        pairs = np.frombuffer(ngram_blob, dtype='<u4', offset=BLOB_HEADER.size)
+        count = len(pairs) // 2
+        return pairs[:count].astype(np.int64), pairs[count:].astype(dtype)
+    ngram_vector = decode_blob(ngram_blob, dtype)
+    nonzero = np.flatnonzero(ngram_vector)
+    return nonzero, ngram_vector[nonzero]
+
+
+def decode_blob(ngram_blob, dtype=np.int64):
+    """ Decodes a binary encoded ngram vector into a dense array.
+
+    Args:
+        ngram_blob (bytes): The encoded vector, as returned by encode_blob.
+        dtype: Optional. The dtype of the decoded values.
+
+    Returns:
+        ndarray: The ngram vector.
+    """
+    encoding, vector_size = BLOB_HEADER.unpack_from(ngram_blob)
+    if encoding == ENCODING_DENSE_UINT16:
+        return np.frombuffer(ngram_blob, dtype='<u2', offset=BLOB_HEADER.size).astype(dtype)
+    elif encoding == ENCODING_DENSE_UINT32:
+        return np.frombuffer(ngram_blob, dtype='<u4', offset=BLOB_HEADER.size).astype(dtype)
+    elif encoding == ENCODING_SPARSE:
+        positions, values = decode_blob_nonzero(ngram_blob, dtype)
+        ngram_vector = np.zeros(vector_size, dtype=dtype)
+        ngram_vector[positions] = values
+        return ngram_vector
+    else:
+        raise ValueError("Unknown ngram vector encoding %i." % encoding)
+
+
+def decode_batch_nonzero(ngram_values_list, ngram_blob_list=None, dtype=np.int64):
+    """ Decodes the nonzero entries of a batch of ngram vectors, which may be stored as text or as blobs.
+
+    For each vector, the blob is used if it is not None. Otherwise the text is decoded.
+
+    Args:
+        ngram_values_list (list[str]): The comma-separated ngram vector strings.
+        ngram_blob_list (list[bytes]): Optional. The binary encoded ngram vectors. Same length as ngram_values_list.
+        dtype: Optional. The dtype of the decoded values.
+
+    Returns:
+        tuple(ndarray, ndarray, ndarray): For each nonzero entry: the index of its vector, its position within the
+            vector and its value.
+    """
+    if ngram_blob_list is None or all(ngram_blob is None for ngram_blob in ngram_blob_list):
+        return decode_text_batch_nonzero(ngram_values_list, dtype)
+
+    text_indices = [i for i, ngram_blob in enumerate(ngram_blob_list) if ngram_blob is None]
+    vector_indices, positions, values = [], [], []
+    if text_indices:
+        text_vector_indices, text_positions, text_values = decode_text_batch_nonzero(
+            [ngram_values_list[i] for i in text_indices], dtype)
+        vector_indices.append(np.array(text_indices, dtype=np.int64)[text_vector_indices])
+        positions.append(text_positions)
+        values.append(text_values)
+    for i, ngram_blob in enumerate(ngram_blob_list):
+        if ngram_blob is not None:
+            blob_positions, blob_values = decode_blob_nonzero(ngram_blob, dtype)
+            vector_indices.append(np.full(len(blob_positions), i, dtype=np.int64))
+            positions.append(blob_positions)
+            values.append(blob_values)
+    return np.concatenate(vector_indices), np.concatenate(positions), np.concatenate(values)
@@ -4,24 +4,57 @@ import random
 
 import numpy as np
 
+from ml.Dataset import get_sample_weight
+
 
 def predict_mean(training_dataset, length):
-    mean = np.mean(training_dataset.target)
+    mean = np.average(training_dataset.target, weights=training_dataset.sample_weight)
     return np.array([mean] * length)
 
 
 def predict_median(training_dataset, length):
-    median = np.median(training_dataset.target)
+    if training_dataset.sample_weight is None:
+        median = np.median(training_dataset.target)
+    else:
+        median = weighted_median(training_dataset.target, training_dataset.sample_weight)
     return np.array([median] * length)
 
 
+def weighted_median(values, weights):
+    """ Returns the median of values whose weights may be fractional, e.g. after subsampling.
+
+    It is the first of the sorted values at which the cumulative weight reaches half of the total weight. If it
+    reaches exactly half, the mean of this and the next value is returned, so integer weights give the same median
+    as repeating each value weight times.
+
+    Args:
+        values (ndarray): The values.
+        weights (ndarray): The non-negative weight of each value.
+
+    Returns:
+        float: The weighted median.
+    """
+    order = np.argsort(values, kind='stable')
+    values = np.asarray(values)[order]
+    cumulative_weights = np.cumsum(np.asarray(weights, dtype=np.float64)[order])
+    half_weight = cumulative_weights[-1] / 2
+    i = np.searchsorted(cumulative_weights, half_weight)
+    if np.isclose(cumulative_weights[i], half_weight):
+        # The next value with a weight
+        j = np.searchsorted(cumulative_weights, cumulative_weights[i], side='right')
+        if j < len(values):
+            return (values[i] + values[j]) / 2
+    return values[i]
+
+
 def predict_weighted_random(training_dataset, length):
     weighted_values = {}
-    for target_value in training_dataset.target:
+    sample_weight = get_sample_weight(training_dataset)
+    for target_value, weight in zip(training_dataset.target, sample_weight):
 
         if type(target_value) == np.ndarray:
             target_value = target_value[0]
-        weighted_values[target_value] = weighted_values.get(target_value, 0) + 1
+        weighted_values[target_value] = weighted_values.get(target_value, 0) + weight
     prediction = np.zeros(length)
     for i in range(length):
         prediction[i] = weighted_choice(weighted_values)
@@ -256,7 +256,7 @@ def get_top_features_table(model, features, n):
 
     Args:
         model: A learned model.
-        features (list[str]): A list of feature IDs.
+        features (list[str]): The name of each data column, e.g. from Dataset.get_column_names.
         n (int): How many features should be displayed.
 
     Returns:
@@ -386,6 +386,53 @@ def get_config_table():
     return table
 
 
+def get_query_statistics_table(statistics):
+    """ Creates a table of the DB statements executed per pipeline stage.
+
+    Args:
+        statistics (QueryStatistics): The statistics recorded by DB.enable_instrumentation().
+
+    Returns:
+        Table: The table.
+    """
+    table_data = [["Stage", "Statements", "Rows", "Total time", "Mean time", "Max time"]]
+    for stage in statistics.stages.values():
+        row_count = str(stage.row_count)
+        if stage.unknown_row_count == stage.statement_count:
+            row_count = "n/a"
+        elif stage.unknown_row_count > 0:
+            row_count += "+"
+        table_data.append([stage.name, str(stage.statement_count), row_count, "%.3fs" % stage.duration,
+                           "%.4fs" % (stage.duration / stage.statement_count), "%.4fs" % stage.max_duration])
+    table = Table(table_data)
+    table.title = "DB Queries"
+    return table
+
+
+def get_n_plus_one_table(statistics, max_statement_length=100):
+    """ Creates a table of the statements flagged as N+1 pattern, or returns None if there are none.
+
+    Args:
+        statistics (QueryStatistics): The statistics recorded by DB.enable_instrumentation().
+        max_statement_length (int): Optional. Longer statements are truncated.
+
+    Returns:
+        Table: The table.
+    """
+    statements = statistics.get_n_plus_one_statements()
+    if not statements:
+        return None
+    table_data = [["Stage", "Executions", "Statement"]]
+    for stage_name, statement, count in statements:
+        statement = " ".join(statement.split())
+        if len(statement) > max_statement_length:
+            statement = statement[:max_statement_length - 3] + "..."
+        table_data.append([stage_name, str(count), statement])
+    table = Table(table_data)
+    table.title = "Possible N+1 Queries"
+    return table
+
+
 def plot_target_histogram(dataset, save=False, display=True, filename='target_histogram'):
     """ Plots a histogram of the datasets target vector and also displays a logarithmic curve of it.
 
@@ -8,6 +8,7 @@ from utils import Config
 SCOREBOARD_FILE = 'scores.scoreboard'
 SEPARATOR = ";"
 FEATURE_SEPARATOR = ","
+FEATURES_FIELD_INDEX = 17  # The features were the last field of the entries before the sampling fields were added
 
 entries = set()
 
@@ -16,7 +17,7 @@ class ScoreboardEntry:
     def __init__(self, label, evs, mse, mae, mde, r2s, repository_name, ml_model, ml_feature_scaling,
                  ml_polynomial_degree, dataset_ngram_sizes, dataset_ngram_levels, dataset_target, dataset_train_start,
                  dataset_train_end, dataset_test_start, dataset_test_end,
-                 dataset_features):
+                 dataset_features, dataset_zero_target_sample_rate=None, dataset_zero_target_sample_seed=None):
         self.label = label
         self.evs = float(evs)
         self.mse = float(mse)
@@ -35,6 +36,8 @@ class ScoreboardEntry:
         self.dataset_test_start = dataset_test_start
         self.dataset_test_end = dataset_test_end
         self.dataset_features = dataset_features
+        self.dataset_zero_target_sample_rate = dataset_zero_target_sample_rate
+        self.dataset_zero_target_sample_seed = dataset_zero_target_sample_seed
 
     def __hash__(self):
         fields = [attr for attr in dir(self) if not callable(attr) and not attr.startswith("__")]
@@ -46,11 +49,12 @@ class ScoreboardEntry:
         return hash(self) == hash(other)
 
 
-def create_entry_from_config(report):
+def create_entry_from_config(report, dataset_target=None):
     """ Creates a new ScoreboardEntry Object from a report and the current Config state.
 
     Args:
         report (Report): The report to get the label and ratings from.
+        dataset_target (str): Optional. The target of the report. If None, the configured target is used.
 
     Returns:
         ScoreboardEntry: A new ScoreboardEntry.
@@ -68,12 +72,14 @@ def create_entry_from_config(report):
         Config.ml_polynomial_degree,
         Config.dataset_ngram_sizes,
         Config.dataset_ngram_levels,
-        Config.dataset_target,
+        dataset_target or Config.dataset_target,
         Config.dataset_train_start,
         Config.dataset_train_end,
         Config.dataset_test_start,
         Config.dataset_test_end,
         Config.dataset_features,
+        Config.dataset_zero_target_sample_rate,
+        Config.dataset_zero_target_sample_seed,
     )
 
 
@@ -87,11 +93,11 @@ def parse_entry_from_string(string):
         ScoreboardEntry: A new ScoreboardEntry.
     """
     # find out how many arguments constructor needs, discard the rest
-    argcount = ScoreboardEntry.__init__.__code__.co_argcount
+    argcount = ScoreboardEntry.__init__.__code__.co_argcount - 1  # Without self
     args = [fragment.strip() for fragment in string.split(SEPARATOR)]
     if len(args) > argcount:
         args = args[:argcount]
-    args[-1] = args[-1].split(FEATURE_SEPARATOR)
+    args[FEATURES_FIELD_INDEX] = args[FEATURES_FIELD_INDEX].split(FEATURE_SEPARATOR)
     return ScoreboardEntry(*args)
 
 
@@ -122,7 +128,9 @@ def parse_entry_to_string(scoreboard_entry):
         str(scoreboard_entry.dataset_train_end),
         str(scoreboard_entry.dataset_test_start),
         str(scoreboard_entry.dataset_test_end),
-        FEATURE_SEPARATOR.join(scoreboard_entry.dataset_features)])
+        FEATURE_SEPARATOR.join(scoreboard_entry.dataset_features),
+        str(scoreboard_entry.dataset_zero_target_sample_rate),
+        str(scoreboard_entry.dataset_zero_target_sample_seed)])
 
 
 def read_entries():
@@ -96,11 +96,12 @@ class SparseScaler(StandardScaler):
         if not sparse.issparse(X):
             return super(SparseScaler, self).transform(X, y=y, copy=copy)
 
+        # Keep the dtype of X, e.g. float32 datasets are not upcast to float64
         if self.with_mean:
             # X -= self.mean_
-            sum(X, self.mean_ * -1)
+            sum(X, self.mean_.astype(X.dtype, copy=False) * -1)
         if self.with_std:
-            X /= self.scale_
+            X /= self.scale_.astype(X.dtype, copy=False)
         return X
 
     def inverse_transform(self, X, copy=None):
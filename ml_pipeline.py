@@ -5,6 +5,8 @@ import argparse
 import datetime
 import platform
 
+import numpy as np
+
 if platform.system() == 'Linux':
     import matplotlib
 
@@ -15,6 +17,7 @@ from ml import Dataset, Model, Predict, Scoreboard, LogTransform
 from ml import Reporting
 from model import DB
 from model.DB import DBError
+from model.objects.UpcomingBugsForVersion import TARGETS
 from utils import Config
 from utils.Config import ConfigError
 
@@ -34,44 +37,52 @@ def main():
         DB.init_db()
     except DBError:
         die("DB Model could not be created!")
-
-    logging.info("Reading training dataset")
-    train_dataset = Dataset.get_dataset(
-        Config.repository_name,
-        Config.dataset_train_start,
-        Config.dataset_train_end,
-        Config.dataset_features,
-        Config.dataset_target,
+    if Config.database_instrumentation:
+        DB.enable_instrumentation()
+
+    logging.info("Reading training and test dataset")
+    dataset_args = dict(
+        repository=Config.repository_name,
+        feature_list=Config.dataset_features,
+        target_id=Config.dataset_target,
         ngram_sizes=Config.dataset_ngram_sizes,
         ngram_levels=Config.dataset_ngram_levels,
-        label="Training",
+        ngram_hash_size=Config.dataset_ngram_hash_size,
         cache=Config.dataset_cache,
+        cache_directory=Config.dataset_cache_dir,
+        cache_size_budget=get_cache_size_budget(),
+        tile_months=Config.dataset_cache_tile_months,
         eager_load=Config.database_eager_load,
-        sparse=Config.dataset_sparse
+        bulk_load=Config.database_bulk_load,
+        chunk_size=Config.database_stream_chunk_size,
+        processes=Config.database_processes,
+        load_strategy=Config.database_load_strategy,
+        sparse=Config.dataset_sparse,
+        dtype=Config.dataset_dtype
     )
+    train_future, test_future = Dataset.get_datasets_async([
+        dict(dataset_args, start=Config.dataset_train_start, end=Config.dataset_train_end, label="Training"),
+        dict(dataset_args, start=Config.dataset_test_start, end=Config.dataset_test_end, label="Test"),
+    ])
+
+    train_dataset = train_future.result()
     if train_dataset is None:
         die("Training Dataset could not be created!")
+    if Config.dataset_prune_columns:
+        train_dataset = train_dataset.prune_columns()
     if Config.ml_log_transform_target:
-        train_dataset.target = LogTransform.log_transform(train_dataset.target, base=Config.ml_log_transform_base)
-
-    logging.info("Reading test dataset")
-    test_dataset = Dataset.get_dataset(
-        Config.repository_name,
-        Config.dataset_test_start,
-        Config.dataset_test_end,
-        Config.dataset_features,
-        Config.dataset_target,
-        ngram_sizes=Config.dataset_ngram_sizes,
-        ngram_levels=Config.dataset_ngram_levels,
-        label="Test",
-        cache=Config.dataset_cache,
-        eager_load=Config.database_eager_load,
-        sparse=Config.dataset_sparse
-    )
+        train_dataset = log_transform_targets(train_dataset)
+    # The model is trained on the reduced rows, but evaluated on all training versions, see evaluate_model
+    evaluation_train_dataset = train_dataset
+    train_dataset = reduce_train_dataset(train_dataset)
+
+    test_dataset = test_future.result()
     if test_dataset is None:
         die("Test Dataset could not be created!")
+    if Config.dataset_prune_columns:
+        test_dataset = test_dataset.apply_column_mask(train_dataset.column_mask)
     if Config.ml_log_transform_target:
-        test_dataset.target = LogTransform.log_transform(test_dataset.target, base=Config.ml_log_transform_base)
+        test_dataset = log_transform_targets(test_dataset)
 
     logging.info("Creating and training model with training dataset")
     model = Model.create_model(
@@ -89,12 +100,61 @@ def main():
         sparse=Config.dataset_sparse
     )
 
-    Model.train_model(
-        model,
-        train_dataset
-    )
+    if Config.reporting_display or Config.reporting_save:
+        config_table = Reporting.get_config_table()
+        add_to_report(config_table.table)
+        if Config.database_instrumentation:
+            add_query_statistics_to_report(DB.get_query_statistics())
+
+    if Config.ml_multi_target:
+        models = Model.train_multi_target_model(
+            model,
+            train_dataset,
+            TARGETS
+        )
+        logging.info("Models for all targets successfully trained.")
+
+        for target_id in TARGETS:
+            evaluate_model(
+                models[target_id],
+                evaluation_train_dataset.select_target(target_id),
+                test_dataset.select_target(target_id),
+                target_label=target_id
+            )
+    else:
+        Model.train_model(
+            model,
+            train_dataset
+        )
+        logging.info("Model successfully trained.")
+
+        evaluate_model(model, evaluation_train_dataset, test_dataset)
+
+    if Config.reporting_display:
+        print(report_str)
+
+    if Config.reporting_save:
+        Reporting.save_report_file(report_str, filename=Config.reporting_file)
+
+    logging.info("All done. Exiting ML Pipeline")
 
-    logging.info("Model successfully trained.")
+
+def evaluate_model(model, train_dataset, test_dataset, target_label=None):
+    """ Creates predictions with a trained model, adds them to the scoreboard and reports them.
+
+    The training metrics, baselines and curves are computed from train_dataset without any sample weights. If the
+    model was trained on weighted rows, pass the dataset before reduce_train_dataset, so they reflect all training
+    versions.
+
+    Args:
+        model (sklearn.pipeline.Pipeline): The trained model.
+        train_dataset (Dataset): The dataset the model was trained with, before it was reduced.
+        test_dataset (Dataset): The dataset to test the model with.
+        target_label (str): Optional. If set, it is appended to the report labels and chart filenames. Used to tell
+            the targets apart when multiple targets are trained.
+    """
+    label_suffix = " (%s)" % target_label if target_label else ""
+    filename_suffix = "_" + target_label.lower() if target_label else ""
 
     logging.debug("Creating predictions...")
     baseline_mean_prediction = Predict.predict_mean(train_dataset, test_dataset.target.shape[0])
@@ -120,14 +180,15 @@ def main():
         baseline_med_prediction = LogTransform.exp_transform(baseline_med_prediction, Config.ml_log_transform_base)
         baseline_wr_prediction = LogTransform.exp_transform(baseline_wr_prediction, Config.ml_log_transform_base)
 
-    baseline_mean_report = Reporting.Report(test_target, baseline_mean_prediction, "Mean Baseline")
-    baseline_med_report = Reporting.Report(test_target, baseline_med_prediction, "Median Baseline")
-    baseline_wr_report = Reporting.Report(test_target, baseline_wr_prediction, "Weighted Random Baseline")
-    training_report = Reporting.Report(train_target, training_prediction, "Training")
-    test_report = Reporting.Report(test_target, test_prediction, "Test")
+    baseline_mean_report = Reporting.Report(test_target, baseline_mean_prediction, "Mean Baseline" + label_suffix)
+    baseline_med_report = Reporting.Report(test_target, baseline_med_prediction, "Median Baseline" + label_suffix)
+    baseline_wr_report = Reporting.Report(test_target, baseline_wr_prediction,
+                                          "Weighted Random Baseline" + label_suffix)
+    training_report = Reporting.Report(train_target, training_prediction, "Training" + label_suffix)
+    test_report = Reporting.Report(test_target, test_prediction, "Test" + label_suffix)
 
-    base_entry = Scoreboard.create_entry_from_config(baseline_wr_report)
-    test_entry = Scoreboard.create_entry_from_config(test_report)
+    base_entry = Scoreboard.create_entry_from_config(baseline_wr_report, dataset_target=train_dataset.target_id)
+    test_entry = Scoreboard.create_entry_from_config(test_report, dataset_target=train_dataset.target_id)
     Scoreboard.add_entry(base_entry)
     Scoreboard.add_entry(test_entry)
     Scoreboard.write_entries()
@@ -135,9 +196,6 @@ def main():
     test_ranking = Scoreboard.get_ranking(test_entry, Scoreboard.RATING_ATTRIBUTE_R2S)
 
     if Config.reporting_display or Config.reporting_save:
-        config_table = Reporting.get_config_table()
-        add_to_report(config_table.table)
-
         add_to_report(baseline_mean_report)
         add_to_report(baseline_med_report)
         add_to_report(baseline_wr_report)
@@ -150,25 +208,25 @@ def main():
         add_to_report(comparisation_table.table)
 
         category_table = Reporting.get_category_table(
-            train_target, training_prediction, label="Training prediction")
+            train_target, training_prediction, label="Training prediction" + label_suffix)
         add_to_report(category_table.table)
 
         category_table = Reporting.get_category_table(
-            test_target, test_prediction, label="Test prediction")
+            test_target, test_prediction, label="Test prediction" + label_suffix)
         add_to_report(category_table.table)
 
-        confusion_matrix_table, classification_report = Reporting.get_confusion_matrix(train_target, training_prediction,
-                                                                                       label="Training prediction")
+        confusion_matrix_table, classification_report = Reporting.get_confusion_matrix(
+            train_target, training_prediction, label="Training prediction" + label_suffix)
         add_to_report(confusion_matrix_table.table)
         add_to_report(classification_report)
-        confusion_matrix_table, classification_report = Reporting.get_confusion_matrix(test_target, test_prediction,
-                                                                                       label="Test prediction")
+        confusion_matrix_table, classification_report = Reporting.get_confusion_matrix(
+            test_target, test_prediction, label="Test prediction" + label_suffix)
         add_to_report(confusion_matrix_table.table)
         add_to_report(classification_report)
 
         if Config.ml_polynomial_degree == 1:
             # Determining top features only makes sense without polynomial features.
-            top_features_table = Reporting.get_top_features_table(model, train_dataset.feature_list, 10)
+            top_features_table = Reporting.get_top_features_table(model, train_dataset.get_column_names(), 10)
             if top_features_table is not None:
                 add_to_report(top_features_table.table)
 
@@ -181,17 +239,12 @@ def main():
         else:
             add_to_report("Do you even learn?")
 
-        if Config.reporting_display:
-            print(report_str)
-
-        if Config.reporting_save:
-            Reporting.save_report_file(report_str, filename=Config.reporting_file)
-
         if Config.reporting_target_histogram:
             Reporting.plot_target_histogram(
                 train_dataset,
                 display=Config.reporting_display_charts,
                 save=Config.reporting_save_charts,
+                filename="target_histogram" + filename_suffix
             )
 
         if Config.reporting_validation_curve and Config.ml_cross_validation:
@@ -209,7 +262,8 @@ def main():
                 svr_coef0=Config.ml_svr_coef0,
                 sparse=Config.dataset_sparse,
                 display=Config.reporting_display_charts,
-                save=Config.reporting_save_charts
+                save=Config.reporting_save_charts,
+                filename="validation_curve" + filename_suffix
             )
 
         if Config.reporting_learning_curve:
@@ -217,26 +271,72 @@ def main():
                 train_dataset=train_dataset,
                 estimator=model,
                 display=Config.reporting_display_charts,
-                save=Config.reporting_save_charts
+                save=Config.reporting_save_charts,
+                filename="learning_curve" + filename_suffix
             )
 
         if Config.reporting_confusion_matrix_chart:
             Reporting.plot_confusion_matrix(
                 ground_truth=train_target,
                 predicted=training_prediction,
-                label="Training",
+                label="Training" + label_suffix,
                 display=Config.reporting_display_charts,
-                save=Config.reporting_save_charts
+                save=Config.reporting_save_charts,
+                filename="confusion_matrix" + filename_suffix
             )
             Reporting.plot_confusion_matrix(
                 ground_truth=test_target,
                 predicted=test_prediction,
-                label="Test",
+                label="Test" + label_suffix,
                 display=Config.reporting_display_charts,
-                save=Config.reporting_save_charts
+                save=Config.reporting_save_charts,
+                filename="confusion_matrix" + filename_suffix
             )
 
-    logging.info("All done. Exiting ML Pipeline")
+
+def reduce_train_dataset(train_dataset):
+    """ Collapses the duplicate rows and subsamples the zero targets of the training dataset, as configured.
+
+    The rows of the reduced dataset are weighted, so a model trained on them fits the distribution of all rows. The
+    given dataset is not changed.
+
+    Args:
+        train_dataset (Dataset): The training dataset.
+
+    Returns:
+        Dataset: The reduced dataset, or train_dataset itself if neither is configured.
+    """
+    if Config.dataset_collapse_duplicates:
+        train_dataset = train_dataset.collapse_duplicates()
+    if Config.dataset_zero_target_sample_rate:
+        if Config.dataset_zero_target_sample_seed is None:
+            # The drawn seed is part of the config, so it is recorded in the report and scoreboard
+            Config.dataset_zero_target_sample_seed = int(np.random.randint(np.iinfo(np.int32).max))
+        train_dataset = train_dataset.subsample_zero_targets(Config.dataset_zero_target_sample_rate,
+                                                             Config.dataset_zero_target_sample_seed)
+    return train_dataset
+
+
+def log_transform_targets(dataset):
+    """ Log transforms all targets of a dataset and returns the dataset with the transformed targets. """
+    dataset.targets = LogTransform.log_transform(np.array(dataset.targets, dtype=dataset.dtype),
+                                                 base=Config.ml_log_transform_base)
+    return dataset.select_target(dataset.target_id)
+
+
+def add_query_statistics_to_report(statistics):
+    """ Adds the statements executed per stage and the flagged N+1 statements to the report. """
+    add_to_report(Reporting.get_query_statistics_table(statistics).table)
+    n_plus_one_table = Reporting.get_n_plus_one_table(statistics)
+    if n_plus_one_table is not None:
+        add_to_report(n_plus_one_table.table)
+
+
+def get_cache_size_budget():
+    """ Returns the configured dataset cache size budget in bytes, or None if it is unlimited. """
+    if Config.dataset_cache_size_budget_mb is None:
+        return None
+    return Config.dataset_cache_size_budget_mb * 1024 * 1024
 
 
 def add_to_report(string, line_breaks=2):
@@ -1,18 +1,33 @@
 # coding=utf-8
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 from model.objects.Base import Base
 from utils import Config
 
 __engine = None
+__engine_pid = None
 __Session = None
+__lock = threading.RLock()
+__session_scopes = threading.local()
+__statistics = None
+__stage = threading.local()
+
+DEFAULT_STAGE = 'other'
+N_PLUS_ONE_THRESHOLD = 50  # Executions of the same statement in a stage, from which on it is flagged as N+1 pattern
+N_PLUS_ONE_MAX_PARAMETERS = 3  # Statements with more parameters, e.g. batched IN selects, are no N+1 pattern
 
 
 def __get_engine():
     global __engine
+    global __engine_pid
+    global __Session
 
     db_dialect = Config.database_dialect
     db_name = Config.database_name
@@ -31,44 +46,100 @@ def __get_engine():
     if port:
         port_string += ':' + str(port)
 
-    if __engine is None:
-        logging.debug("Creating %s engine" % db_dialect.upper())
-        if db_dialect.upper() == 'SQLITE':
-            __engine = create_engine('sqlite:///{0}.db'.format(db_name))
-        elif db_dialect.upper() == 'MYSQL':
-            url = r'mysql+pymysql://{auth_string}{host}{port_string}/{db_name}?charset=utf8'.format(
-                auth_string=auth_string,
-                host=host,
-                port_string=port_string,
-                db_name=db_name
-            )
-            __engine = create_engine(url, pool_recycle=3600)
-        elif db_dialect.upper() == 'POSTGRES':
-            url = r'postgresql+pg8000://{auth_string}{host}{port_string}/{db_name}'.format(
-                auth_string=auth_string,
-                host=host,
-                port_string=port_string,
-                db_name=db_name
-            )
-            __engine = create_engine(url, client_encoding='utf8')
-        else:
-            logging.critical("SQL Dialect " + db_dialect + " is not supported.")
-            return None
+    with __lock:
+        if __engine is not None and __engine_pid != os.getpid():
+            # Inherited from the parent process. Its connections belong to the parent, so a new engine is needed.
+            __engine = None
+            __Session = None
+        if __engine is None:
+            logging.debug("Creating %s engine" % db_dialect.upper())
+            if db_dialect.upper() == 'SQLITE':
+                engine = create_engine('sqlite:///{0}.db'.format(db_name), **__get_pool_options(pool_size=False))
+            elif db_dialect.upper() == 'MYSQL':
+                url = r'mysql+pymysql://{auth_string}{host}{port_string}/{db_name}?charset=utf8'.format(
+                    auth_string=auth_string,
+                    host=host,
+                    port_string=port_string,
+                    db_name=db_name
+                )
+                engine = create_engine(url, **__get_pool_options(default_recycle=3600))
+            elif db_dialect.upper() == 'POSTGRES':
+                url = r'postgresql+pg8000://{auth_string}{host}{port_string}/{db_name}'.format(
+                    auth_string=auth_string,
+                    host=host,
+                    port_string=port_string,
+                    db_name=db_name
+                )
+                engine = create_engine(url, client_encoding='utf8', **__get_pool_options())
+            else:
+                logging.critical("SQL Dialect " + db_dialect + " is not supported.")
+                return None
+            __guard_pool_against_forks(engine)
+            __engine = engine
+            __engine_pid = os.getpid()
     return __engine
 
 
+def __get_pool_options(pool_size=True, default_recycle=None):
+    """ Returns the connection pool arguments of create_engine as set in the config.
+
+    Args:
+        pool_size (bool): Optional. If the pool size and overflow can be set. Not supported by the SQLite pool.
+        default_recycle (int): Optional. The recycle time in seconds, if it is not set in the config.
+    """
+    options = {'pool_pre_ping': Config.database_pool_pre_ping}
+    pool_recycle = Config.database_pool_recycle or default_recycle
+    if pool_recycle:
+        options['pool_recycle'] = pool_recycle
+    if pool_size and Config.database_pool_size is not None:
+        options['pool_size'] = Config.database_pool_size
+    if pool_size and Config.database_max_overflow is not None:
+        options['max_overflow'] = Config.database_max_overflow
+    return options
+
+
+def __guard_pool_against_forks(engine):
+    """ Makes sure pooled connections are never used by another process than the one which opened them.
+
+    A forked process inherits the pool of its parent. Using the same connection in both processes corrupts it, so a
+    connection checked out in another process is invalidated and replaced by a new one.
+    """
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                "Connection record belongs to pid %s, attempting to check out in pid %s" %
+                (connection_record.info['pid'], pid))
+
+
 def __get_session(engine):
     global __Session
-    if __Session is None:
-        session_factory = sessionmaker(bind=engine)
-        __Session = scoped_session(session_factory)
+    with __lock:
+        if __Session is None:
+            session_factory = sessionmaker(bind=engine)
+            __Session = scoped_session(session_factory)
     return __Session
 
 
-# noinspection PyUnresolvedReferences
 def init_db():
     logging.debug("Initializing DB")
-    # Import all ORM objects to register them in SQLAlchemy Base
+    register_objects()
+    engine = __get_engine()
+    if engine is None:
+        raise DBError("Engine could not be created.")
+    else:
+        Base().base.metadata.create_all(engine)
+
+
+# noinspection PyUnresolvedReferences
+def register_objects():
+    """ Imports all ORM objects to register them in SQLAlchemy Base. Unlike init_db(), no tables are created. """
     from model.objects.IssueTracking import IssueTracking
     from model.objects.Repository import Repository
     from model.objects.Commit import Commit
@@ -79,12 +150,134 @@ def init_db():
     from model.objects.FeatureValue import FeatureValue
     from model.objects.NGramVector import NGramVector
     from model.objects.UpcomingBugsForVersion import UpcomingBugsForVersion
+    from model.objects.VersionFeatureVector import VersionFeatureVector, FeatureVectorColumn
+
+
+def get_engine():
+    """ Returns the DB engine. It is created on first use. """
+    return __get_engine()
+
 
+def enable_instrumentation():
+    """ Starts recording the count, fetched rows and duration of all statements executed by the engine.
+
+    The statements are grouped by the pipeline stage set with stage(). Statements which are executed over and over
+    within a stage with just a few parameters, like the lazy loading of a relationship for every single object, are
+    flagged as N+1 pattern.
+
+    Returns:
+        QueryStatistics: The recorded statistics.
+    """
+    global __statistics
     engine = __get_engine()
-    if engine is None:
-        raise DBError("Engine could not be created.")
-    else:
-        Base().base.metadata.create_all(engine)
+    if __statistics is None:
+        __statistics = QueryStatistics()
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    return __statistics
+
+
+def get_query_statistics():
+    """ Returns the statistics recorded since enable_instrumentation() was called, or None if it wasn't. """
+    return __statistics
+
+
+@contextmanager
+def stage(name):
+    """ Context manager which assigns all statements executed by the current thread to a pipeline stage. """
+    previous_name = get_stage()
+    __stage.name = name
+    try:
+        yield
+    finally:
+        __stage.name = previous_name
+
+
+def get_stage():
+    """ Returns the pipeline stage of the current thread. """
+    return getattr(__stage, 'name', None) or DEFAULT_STAGE
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('query_start_times', []).append(time.time())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    duration = time.time() - connection.info['query_start_times'].pop()
+    if __statistics is not None:
+        __statistics.record(get_stage(), statement, parameters, executemany, cursor.rowcount, duration)
+
+
+class QueryStatistics:
+    """ The count, fetched rows and duration of the executed statements, per pipeline stage. Thread-safe. """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage_name, statement, parameters, executemany, row_count, duration):
+        """ Records a single statement execution.
+
+        Args:
+            stage_name (str): The pipeline stage.
+            statement (str): The SQL of the statement.
+            parameters: The parameters of the statement, as passed to the DB driver.
+            executemany (bool): If the statement was executed with a list of parameter sets.
+            row_count (int): The row count reported by the DB driver. Negative, if the driver doesn't know it.
+            duration (float): The execution time in seconds.
+        """
+        with self.lock:
+            stage_statistics = self.stages.get(stage_name)
+            if stage_statistics is None:
+                stage_statistics = self.stages[stage_name] = StageStatistics(stage_name)
+            stage_statistics.statement_count += 1
+            stage_statistics.duration += duration
+            stage_statistics.max_duration = max(stage_statistics.max_duration, duration)
+            if 0 <= row_count < 2 ** 63:
+                stage_statistics.row_count += row_count
+            else:
+                stage_statistics.unknown_row_count += 1
+
+            if executemany or len(parameters or ()) > N_PLUS_ONE_MAX_PARAMETERS:
+                return
+            count = stage_statistics.repeated_statements.get(statement, 0) + 1
+            stage_statistics.repeated_statements[statement] = count
+            if count == N_PLUS_ONE_THRESHOLD:
+                logging.warning("Statement executed %i times in stage %s. Possible N+1 lazy loading: %s" % (
+                    count, stage_name, statement))
+
+    def get_n_plus_one_statements(self):
+        """ Returns the statements flagged as N+1 pattern.
+
+        Returns:
+            list[tuple(str, str, int)]: Tuples of stage name, statement and execution count.
+        """
+        with self.lock:
+            return [(stage_statistics.name, statement, count)
+                    for stage_statistics in self.stages.values()
+                    for statement, count in stage_statistics.repeated_statements.items()
+                    if count >= N_PLUS_ONE_THRESHOLD]
+
+
+class StageStatistics:
+    def __init__(self, name):
+        self.name = name
+        self.statement_count = 0
+        self.row_count = 0
+        self.unknown_row_count = 0  # Statements for which the driver doesn't report the row count
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.repeated_statements = {}  # Execution count by statement
+
+
+def reset():
+    """ Forgets the engine and session registry, so new ones are created on next use. """
+    global __engine
+    global __Session
+    with __lock:
+        __engine = None
+        __Session = None
 
 
 def create_session():
@@ -101,6 +294,30 @@ def create_session():
     return new_session
 
 
+@contextmanager
+def session_scope():
+    """ Context manager providing the session of the current thread for a task, e.g. loading a dataset.
+
+    Afterwards, the session is closed and removed from the registry, so its identity map with all loaded objects is
+    released and its connection is returned to the pool. Uncommitted changes are rolled back on errors. Nested scopes
+    share the session, which is only removed by the outermost one.
+    """
+    session = create_session()
+    if session is None:
+        raise DBError("Session could not be created.")
+    nested = getattr(__session_scopes, 'depth', 0)
+    __session_scopes.depth = nested + 1
+    try:
+        yield session
+    except:
+        session.rollback()
+        raise
+    finally:
+        __session_scopes.depth = nested
+        if nested == 0:
+            session.remove()
+
+
 class DBError(Exception):
     def __init__(self, value):
         self.value = value
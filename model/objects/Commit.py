@@ -1,5 +1,5 @@
 # coding=utf-8
-from sqlalchemy import Column, String, Integer, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 
@@ -14,6 +14,10 @@ MAX_AUTHOR_LENGTH = 100
 # noinspection PyClassHasNoInit
 class Commit(Base):
     __tablename__ = 'commit'
+    __table_args__ = (
+        # Range queries filter by repository and timestamp
+        Index('ix_commit_repository_timestamp', 'repository_id', 'timestamp', 'id'),
+    )
 
     id = Column(String(40), primary_key=True)
     repository_id = Column(Integer, ForeignKey('repository.id'))
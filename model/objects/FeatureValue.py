@@ -1,6 +1,6 @@
 #!/usr/bin/python
 # coding=utf-8
-from sqlalchemy import Column, String, Float
+from sqlalchemy import Column, String, Float, Index
 from sqlalchemy.sql.schema import ForeignKey
 
 from model.objects.Base import Base
@@ -11,6 +11,10 @@ Base = Base().base
 # noinspection PyClassHasNoInit
 class FeatureValue(Base):
     __tablename__ = 'feature_value'
+    __table_args__ = (
+        # The primary key starts with the feature, but feature values are joined on their version
+        Index('ix_feature_value_version', 'version_id', 'feature_id', 'value'),
+    )
 
     feature_id = Column(String(36), primary_key=True)
     version_id = Column(String(36), ForeignKey('version.id'), primary_key=True)
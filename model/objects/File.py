@@ -1,5 +1,5 @@
 # coding=utf-8
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 
@@ -11,6 +11,10 @@ Base = Base().base
 # noinspection PyClassHasNoInit
 class File(Base):
     __tablename__ = 'file'
+    __table_args__ = (
+        # Files are joined on their ID and filtered by language
+        Index('ix_file_language', 'language', 'id'),
+    )
 
     id = Column(String(36), primary_key=True)
     repository_id = Column(Integer, ForeignKey("repository.id"))
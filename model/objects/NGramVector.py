@@ -1,19 +1,26 @@
 #!/usr/bin/python
 # coding=utf-8
-from sqlalchemy import Column, String, Integer
+from sqlalchemy import Column, String, Integer, LargeBinary
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql.schema import ForeignKey
 
 from model.objects.Base import Base
 
 Base = Base().base
 
+MAX_BLOB_LENGTH = 2 ** 32 - 1
+
 
 # noinspection PyClassHasNoInit
 class NGramVector(Base):
     __tablename__ = 'ngram_vector'
+    # No secondary index needed: The primary key starts with the version, on which ngram vectors are joined
 
     version_id = Column(String(36), ForeignKey('version.id'), primary_key=True)
     ngram_size = Column(Integer, primary_key=True)
     ngram_level = Column(Integer, primary_key=True)
     vector_size = Column(Integer)
     ngram_values = Column(String)
+    # Compact binary encoding, see ml.NGramCodec. Preferred if set. The column is only added to existing DBs by
+    # db_tools.py migrate-ngrams, so it is deferred and just loaded if it exists, see ml.Dataset.has_ngram_blob_column
+    ngram_blob = deferred(Column(LargeBinary(MAX_BLOB_LENGTH)))
@@ -1,6 +1,6 @@
 #!/usr/bin/python
 # coding=utf-8
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, Index
 from sqlalchemy.sql.schema import ForeignKey
 
 from model.objects.Base import Base
@@ -10,10 +10,15 @@ Base = Base().base
 TARGET_BUGS_MONTH = 'MONTH'
 TARGET_BUGS_SIXMONTHS = 'SIXMONTHS'
 TARGET_BUGS_YEAR = 'YEAR'
+TARGETS = [TARGET_BUGS_MONTH, TARGET_BUGS_SIXMONTHS, TARGET_BUGS_YEAR]
 
 
 class UpcomingBugsForVersion(Base):
     __tablename__ = 'upcoming_bugs_for_versions_mv'
+    __table_args__ = (
+        # Covers reading all targets of the joined versions
+        Index('ix_upcoming_bugs_targets', 'version_id', 'month_bugs', 'sixmonth_bugs', 'year_bugs'),
+    )
 
     version_id = Column(String(36), ForeignKey('version.id'), primary_key=True, nullable=False)
     language = Column(String(20))
@@ -34,3 +39,24 @@ class UpcomingBugsForVersion(Base):
             return self.year_bugs
         else:
             return None
+
+
+def get_target_column(target):
+    """ Returns the table column holding a target, e.g. for use in SQLAlchemy Core queries.
+
+    Args:
+        target (str): The ID of the target. Use a TARGET_X constant.
+
+    Returns:
+        Column: The column of the target, or None if the target is unknown.
+    """
+    target = target.upper()
+    table = UpcomingBugsForVersion.__table__
+    if target == TARGET_BUGS_MONTH:
+        return table.c.month_bugs
+    elif target == TARGET_BUGS_SIXMONTHS:
+        return table.c.sixmonth_bugs
+    elif target == TARGET_BUGS_YEAR:
+        return table.c.year_bugs
+    else:
+        return None
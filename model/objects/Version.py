@@ -1,5 +1,5 @@
 # coding=utf-8
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 
@@ -13,6 +13,11 @@ MAX_PATH_LENGTH = 500
 # noinspection PyClassHasNoInit
 class Version(Base):
     __tablename__ = 'version'
+    __table_args__ = (
+        # Versions are joined on their commit and filtered by deletion and file, covering the version ID
+        Index('ix_version_commit', 'commit_id', 'deleted', 'file_id', 'id'),
+        Index('ix_version_file', 'file_id'),
+    )
 
     id = Column(String(36), primary_key=True)
     file_id = Column(String(36), ForeignKey('file.id'))
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# coding=utf-8
+import numpy as np
+from sqlalchemy import Column, String, Integer, LargeBinary
+from sqlalchemy.sql.schema import ForeignKey
+
+from model.objects.Base import Base
+
+Base = Base().base
+
+MAX_BLOB_LENGTH = 2 ** 32 - 1
+FEATURE_VECTOR_DTYPE = '<f8'
+
+
+# noinspection PyClassHasNoInit
+class VersionFeatureVector(Base):
+    """ All feature values of a version packed into one row. Derived from feature_value, see db_tools.py. """
+    __tablename__ = 'version_feature_vector'
+
+    version_id = Column(String(36), ForeignKey('version.id'), primary_key=True)
+    feature_vector = Column(LargeBinary(MAX_BLOB_LENGTH), nullable=False)  # See encode_feature_vector
+
+
+# noinspection PyClassHasNoInit
+class FeatureVectorColumn(Base):
+    """ The dictionary of the features in the packed feature vectors, mapping each feature to its position. """
+    __tablename__ = 'feature_vector_column'
+
+    feature_id = Column(String(36), primary_key=True)
+    position = Column(Integer, nullable=False, unique=True)
+
+
+def encode_feature_vector(feature_values):
+    """ Packs the feature values of a version into their binary representation.
+
+    Args:
+        feature_values (array-like): The feature values, ordered by their position. NaN marks missing values.
+
+    Returns:
+        bytes: The packed vector of little-endian doubles.
+    """
+    return np.asarray(feature_values, dtype=FEATURE_VECTOR_DTYPE).tobytes()
+
+
+def decode_feature_vector(feature_vector):
+    """ Unpacks a binary feature vector. Features added to the dictionary after it was packed are not included.
+
+    Args:
+        feature_vector (bytes): The packed vector, as returned by encode_feature_vector.
+
+    Returns:
+        ndarray: The feature values, ordered by their position. NaN marks missing values.
+    """
+    return np.frombuffer(feature_vector, dtype=FEATURE_VECTOR_DTYPE)
@@ -0,0 +1,169 @@
+import datetime
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from ml import Dataset
+from ml.DatasetCache import DatasetCache
+from ml.MatrixBuilder import MatrixBuilder
+
+
+def get_cached_dataset(sparse, dtype, sample_weight=None):
+    dataset = Dataset.Dataset(7, 2, ["F1", "F2", "F3"], "MONTH", datetime.datetime(2015, 1, 1),
+                              datetime.datetime(2015, 2, 1), ngram_sizes=[1, 2], ngram_levels=[1], label="Test",
+                              sparse=sparse, dtype=dtype)
+    dataset.ngram_vector_sizes = [(1, 1, 3), (2, 1, 1)]
+    builder = MatrixBuilder(dataset.data.shape, dtype=dataset.dtype)
+    builder.add_entries([0, 0, 1, 1, 1], [0, 4, 1, 2, 6], [1.5, 2.0, 3.0, 4.0, 5.0])
+    dataset.data = builder.to_matrix(sparse)
+    dataset.targets = np.array([[1.0, 3.0, 5.0], [2.0, 4.0, 6.0]], dtype=dataset.dtype)
+    dataset.target = dataset.targets[:, 0]
+    dataset.timestamps = np.array(['2015-01-05', '2015-01-12'], dtype=Dataset.TIMESTAMP_DTYPE)
+    dataset.sample_weight = sample_weight
+    return dataset
+
+
+def to_array(matrix):
+    return matrix.toarray() if hasattr(matrix, 'toarray') else np.asarray(matrix)
+
+
+class DatasetCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Every call returns a later time, so the access order is unambiguous
+        patcher = mock.patch('ml.DatasetCache.time.time', side_effect=itertools.count(1).__next__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_file(self, cache, key, size, info=None):
+        temp_path = cache.get_temp_path(key)
+        with open(temp_path, 'wb') as f:
+            f.write(b'x' * size)
+        cache.add(key, info, temp_path=temp_path)
+
+    def test_lookup(self):
+        cache = DatasetCache(self.directory)
+        self.assertIsNone(cache.lookup("a"))
+        self.add_file(cache, "a", 10, {"label": "A"})
+        self.assertEqual(cache.lookup("a"), cache.get_path("a"))
+        self.assertTrue(os.path.isfile(cache.get_path("a")))
+        self.assertEqual(cache.get_info("a"), {"label": "A"})
+        self.assertEqual(cache.get_total_size(), 10)
+
+    def test_evict_least_recently_used(self):
+        cache = DatasetCache(self.directory, size_budget=30)
+        for key in ("a", "b", "c"):
+            self.add_file(cache, key, 10)
+        self.add_file(cache, "d", 10)
+        self.assertIsNone(cache.lookup("a"))
+        self.assertFalse(os.path.exists(cache.get_path("a")))
+        self.assertEqual(cache.get_total_size(), 30)
+
+        # A file larger than the budget evicts all others, but is kept itself
+        self.add_file(cache, "e", 40)
+        self.assertEqual(cache.find(lambda info: True), ["e"])
+
+    def test_lookup_marks_as_recently_used(self):
+        cache = DatasetCache(self.directory, size_budget=30)
+        for key in ("a", "b", "c"):
+            self.add_file(cache, key, 10)
+        self.assertEqual(cache.find(lambda info: True), ["c", "b", "a"])
+        cache.lookup("a")
+        self.assertEqual(cache.find(lambda info: True), ["a", "c", "b"])
+
+        self.add_file(cache, "d", 10)
+        self.assertIsNone(cache.lookup("b"))
+        self.assertIsNotNone(cache.lookup("a"))
+
+    def test_remove(self):
+        cache = DatasetCache(self.directory)
+        self.add_file(cache, "a", 10)
+        self.add_file(cache, "b", 20)
+        cache.remove("a")
+        cache.remove("missing")
+        self.assertIsNone(cache.lookup("a"))
+        self.assertFalse(os.path.exists(cache.get_path("a")))
+        self.assertEqual(cache.get_total_size(), 20)
+
+    def test_manifest_is_shared(self):
+        self.add_file(DatasetCache(self.directory), "a", 10, {"label": "A"})
+        cache = DatasetCache(self.directory)
+        self.assertEqual(cache.find(lambda info: info.get("label") == "A"), ["a"])
+        self.assertEqual(cache.find(lambda info: info.get("label") == "B"), [])
+
+
+class DatasetFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertDatasetEqual(self, dataset, expected):
+        self.assertEqual(dataset.sparse, expected.sparse)
+        self.assertEqual(dataset.data.dtype, expected.dtype)
+        self.assertEqual(dataset.dtype, expected.dtype)
+        self.assertTrue(np.array_equal(to_array(dataset.data), to_array(expected.data)))
+        self.assertTrue(np.array_equal(dataset.targets, expected.targets))
+        self.assertTrue(np.array_equal(dataset.target, expected.target))
+        self.assertTrue(np.array_equal(dataset.timestamps, expected.timestamps))
+        self.assertEqual(dataset.feature_list, expected.feature_list)
+        self.assertEqual(dataset.target_id, expected.target_id)
+        self.assertEqual(dataset.ngram_vector_sizes, expected.ngram_vector_sizes)
+        if expected.sample_weight is None:
+            self.assertIsNone(dataset.sample_weight)
+        else:
+            self.assertTrue(np.array_equal(dataset.sample_weight, expected.sample_weight))
+
+    def test_write_and_read_files(self):
+        for sparse in (False, True):
+            for dtype in ('float64', 'float32'):
+                for sample_weight in (None, np.array([2.0, 0.5])):
+                    dataset = get_cached_dataset(sparse, dtype, sample_weight)
+                    filepath = os.path.join(self.directory, "dataset")
+                    Dataset.write_dataset_files(dataset, filepath)
+                    self.assertDatasetEqual(Dataset.read_dataset_files(filepath), dataset)
+
+    def test_read_files_is_memory_mapped(self):
+        filepath = os.path.join(self.directory, "dataset")
+        Dataset.write_dataset_files(get_cached_dataset(False, 'float32'), filepath)
+        dataset = Dataset.read_dataset_files(filepath)
+        self.assertIsInstance(dataset.data, np.memmap)
+        # Copy-on-write, so the cache stays unchanged
+        dataset.data[0, 0] = 100
+        self.assertEqual(Dataset.read_dataset_files(filepath).data[0, 0], 1.5)
+
+    def test_read_files_of_other_format_version(self):
+        filepath = os.path.join(self.directory, "dataset")
+        Dataset.write_dataset_files(get_cached_dataset(False, 'float64'), filepath)
+        with mock.patch.object(Dataset, 'CACHE_FORMAT_VERSION', Dataset.CACHE_FORMAT_VERSION + 1):
+            self.assertIsNone(Dataset.read_dataset_files(filepath))
+
+    def test_save_and_load_dataset_file(self):
+        cache = DatasetCache(self.directory)
+        for sparse in (False, True):
+            for dtype in ('float64', 'float32'):
+                dataset = get_cached_dataset(sparse, dtype, np.array([2.0, 0.5]))
+                Dataset.save_dataset_file(dataset, cache)
+                loaded = Dataset.load_dataset_file(cache, "Test", ["F3", "F1"], "YEAR", dataset.start, dataset.end,
+                                                   [2], [1], sparse=sparse, dtype=dtype)
+                self.assertDatasetEqual(loaded, dataset.select_columns(["F3", "F1"], [2], [1]).select_target("YEAR"))
+
+        # Other features, sparsity or dtypes are not served from the cache
+        dataset = get_cached_dataset(False, 'float64')
+        self.assertIsNone(Dataset.load_dataset_file(cache, "Test", ["F4"], "MONTH", dataset.start, dataset.end,
+                                                    None, None))
+        self.assertIsNone(Dataset.load_dataset_file(cache, "Test", ["F1"], "MONTH", dataset.start, dataset.end,
+                                                    None, None, dtype='float16'))
+
+
+if __name__ == '__main__':
+    unittest.main()
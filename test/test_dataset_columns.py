@@ -0,0 +1,141 @@
+import datetime
+import unittest
+
+import numpy as np
+from scipy.sparse.csr import csr_matrix
+
+from ml.Dataset import Dataset, TIMESTAMP_DTYPE, covers_columns, merge_columns, hash_ngram_positions
+
+
+def get_superset_dataset(sparse=False):
+    dataset = Dataset(7, 2, ["F1", "F2", "F3"], "MONTH", datetime.datetime(2015, 1, 1),
+                      datetime.datetime(2015, 2, 1), ngram_sizes=[1, 2], ngram_levels=[1], sparse=sparse)
+    dataset.ngram_vector_sizes = [(1, 1, 3), (2, 1, 1)]
+    data = np.arange(14, dtype=np.float64).reshape((2, 7))
+    dataset.data = csr_matrix(data) if sparse else data
+    dataset.targets = np.array([[1.0, 3.0, 5.0], [2.0, 4.0, 6.0]])
+    dataset.target = dataset.targets[:, 0]
+    return dataset
+
+
+class DatasetColumnsTestCase(unittest.TestCase):
+    def test_select_columns(self):
+        for sparse in (False, True):
+            dataset = get_superset_dataset(sparse).select_columns(["F3", "F1"], [2], [1])
+            data = dataset.data.toarray() if sparse else dataset.data
+            self.assertTrue(np.array_equal(data, [[2, 0, 6], [9, 7, 13]]))
+            self.assertEqual(dataset.ngram_vector_sizes, [(2, 1, 1)])
+
+    def test_select_contiguous_columns_is_view(self):
+        dataset = get_superset_dataset()
+        selected = dataset.select_columns(["F3"], [1], [1])
+        self.assertTrue(np.array_equal(selected.data, dataset.data[:, 2:6]))
+        self.assertTrue(np.shares_memory(selected.data, dataset.data))
+
+    def test_select_missing_feature(self):
+        with self.assertRaises(ValueError):
+            get_superset_dataset().select_columns(["F4"])
+
+    def test_select_target(self):
+        dataset = get_superset_dataset().select_target("YEAR")
+        self.assertEqual(dataset.target_id, "YEAR")
+        self.assertTrue(np.array_equal(dataset.target, [5.0, 6.0]))
+        with self.assertRaises(ValueError):
+            dataset.select_target("DECADE")
+
+    def test_dtype_is_kept(self):
+        for sparse in (False, True):
+            dataset = Dataset(7, 2, ["F1", "F2", "F3"], "MONTH", datetime.datetime(2015, 1, 1),
+                              datetime.datetime(2015, 2, 1), sparse=sparse, dtype='float32')
+            selected = dataset.select_columns(["F2"]).slice_range(datetime.datetime(2015, 1, 1),
+                                                                  datetime.datetime(2015, 2, 1))
+            self.assertEqual(selected.dtype, np.float32)
+            self.assertEqual(selected.data.dtype, np.float32)
+            self.assertEqual(selected.targets.dtype, np.float32)
+        with self.assertRaises(ValueError):
+            Dataset(1, 1, ["F1"], "MONTH", None, None, dtype='int32')
+
+    def test_prune_columns(self):
+        for sparse in (False, True):
+            dataset = get_superset_dataset(sparse)
+            data = np.array([[0, 1, 5, 0, 2, 7, 0], [0, 1, 3, 0, 0, 7, 4]], dtype=np.float64)
+            dataset.data = csr_matrix(data) if sparse else data
+            pruned = dataset.prune_columns()
+            pruned_data = pruned.data.toarray() if sparse else pruned.data
+            self.assertTrue(np.array_equal(pruned_data, [[5, 2, 0], [3, 0, 4]]))
+            self.assertEqual(pruned.get_column_names(), ["F3", "1-gram L1 #1", "2-gram L1 #0"])
+
+            selected = pruned.select_columns(["F3"], [2], [1])
+            selected_data = selected.data.toarray() if sparse else selected.data
+            self.assertTrue(np.array_equal(selected_data, [[5, 0], [3, 4]]))
+
+            projected = get_superset_dataset(sparse).apply_column_mask(pruned.column_mask)
+            self.assertEqual(projected.get_column_names(), pruned.get_column_names())
+            with self.assertRaises(ValueError):
+                pruned.apply_column_mask(np.ones(7, dtype=bool))
+
+    def test_hash_ngram_positions(self):
+        columns = hash_ngram_positions([1] * 1000, [2] * 1000, np.arange(1000), 16)
+        self.assertTrue(np.all((columns >= 0) & (columns < 16)))
+        self.assertEqual(len(np.unique(columns)), 16)
+        self.assertTrue(np.array_equal(columns, hash_ngram_positions([1] * 1000, [2] * 1000, np.arange(1000), 16)))
+        self.assertFalse(np.array_equal(columns, hash_ngram_positions([2] * 1000, [2] * 1000, np.arange(1000), 16)))
+
+    def test_select_hashed_ngrams(self):
+        dataset = Dataset(5, 2, ["F1", "F2", "F3"], "MONTH", datetime.datetime(2015, 1, 1),
+                          datetime.datetime(2015, 2, 1), ngram_sizes=[1, 2], ngram_levels=[1], ngram_hash_size=2)
+        dataset.data = np.arange(10, dtype=np.float64).reshape((2, 5))
+        selected = dataset.select_columns(["F2"], [2, 1], [1])
+        self.assertTrue(np.array_equal(selected.data, [[1, 3, 4], [6, 8, 9]]))
+        self.assertEqual(selected.get_column_names(), ["F2", "ngram hash #0", "ngram hash #1"])
+        self.assertIsNone(dataset.select_columns(["F2"]).ngram_hash_size)
+        with self.assertRaises(ValueError):
+            dataset.select_columns(["F2"], [1], [1])
+        hashed_columns = {'feature_list': ["F1"], 'ngram_sizes': [1, 2], 'ngram_levels': [1], 'ngram_hash_size': 2}
+        self.assertFalse(covers_columns(hashed_columns, ["F1"], [1], [1]))
+        self.assertEqual(merge_columns(hashed_columns, ["F2"], [1], [1]), (["F1", "F2"], [1], [1]))
+
+    def test_collapse_duplicates(self):
+        for sparse in (False, True):
+            dataset = get_superset_dataset(sparse)
+            data = np.array([[1, 0, 2], [1, 0, 2], [0, 3, 0], [1, 0, 2], [0, 3, 0]], dtype=np.float64)
+            dataset.data = csr_matrix(data) if sparse else data
+            dataset.targets = np.array([[1, 1, 1], [1, 1, 1], [2, 2, 2], [1, 1, 2], [2, 2, 2]], dtype=np.float64)
+            dataset.target = dataset.targets[:, 0]
+            dataset.timestamps = np.arange(5).astype(TIMESTAMP_DTYPE)
+            collapsed = dataset.collapse_duplicates()
+            collapsed_data = collapsed.data.toarray() if sparse else collapsed.data
+            self.assertTrue(np.array_equal(collapsed_data, data[[0, 2, 3]]))
+            self.assertTrue(np.array_equal(collapsed.timestamps, dataset.timestamps[[0, 2, 3]]))
+            self.assertTrue(np.array_equal(collapsed.sample_weight, [2, 2, 1]))
+            self.assertTrue(np.array_equal(collapsed.collapse_duplicates().sample_weight, [2, 2, 1]))
+            self.assertTrue(np.array_equal(collapsed.select_target("YEAR").target, [1, 2, 2]))
+
+    def test_subsample_zero_targets(self):
+        for sparse in (False, True):
+            dataset = get_superset_dataset(sparse)
+            data = np.arange(30, dtype=np.float64).reshape((10, 3))
+            dataset.data = csr_matrix(data) if sparse else data
+            dataset.targets = np.zeros((10, 3))
+            dataset.targets[[2, 7], 0] = [1, 4]
+            dataset.target = dataset.targets[:, 0]
+            dataset.timestamps = np.arange(10).astype(TIMESTAMP_DTYPE)
+            sampled = dataset.subsample_zero_targets(0.5, seed=42)
+            self.assertEqual(sampled.sparse, sparse)
+            self.assertEqual(sampled.data.shape[0], 6)
+            self.assertTrue(np.all(np.diff(sampled.timestamps) > np.timedelta64(0)))
+            self.assertTrue(np.array_equal(sampled.target[sampled.target != 0], [1, 4]))
+            self.assertTrue(np.array_equal(sampled.sample_weight, np.where(sampled.target != 0, 1, 2)))
+            self.assertTrue(np.array_equal(dataset.subsample_zero_targets(0.5, seed=42).timestamps, sampled.timestamps))
+        with self.assertRaises(ValueError):
+            get_superset_dataset().subsample_zero_targets(0)
+
+    def test_covers_and_merge_columns(self):
+        columns = {'feature_list': ["F1", "F2"], 'ngram_sizes': [1], 'ngram_levels': [1]}
+        self.assertTrue(covers_columns(columns, ["F2"], None, None))
+        self.assertFalse(covers_columns(columns, ["F2"], [2], [1]))
+        self.assertEqual(merge_columns(columns, ["F3", "F1"], [2], [1]), (["F1", "F2", "F3"], [1, 2], [1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
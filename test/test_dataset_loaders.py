@@ -0,0 +1,273 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ml import Dataset
+from model import DB
+from utils import Config
+
+START = datetime.datetime(2015, 1, 1)
+END = datetime.datetime(2015, 4, 1)
+COMMIT_TIMESTAMPS = [datetime.datetime(2015, 1, 5), datetime.datetime(2015, 1, 12), datetime.datetime(2015, 2, 2),
+                     datetime.datetime(2015, 3, 2)]
+MISSING_FEATURE = ('v3', 'F4')  # Feature value which doesn't exist in the DB
+NULL_FEATURE = ('v5', 'F3')  # Feature value which is NULL in the DB
+
+temp_directory = None
+
+
+def get_feature_value(version_number, feature_number):
+    return feature_number * 100.0 + version_number
+
+
+def populate_database():
+    """ Creates a repository with two versions per commit. Each version has the features F1 to F4 and ngram
+    vectors of size 1 and level 1, except for MISSING_FEATURE. The value of NULL_FEATURE is NULL. The feature values
+    are added in reverse order. """
+    from model.objects.Repository import Repository
+    from model.objects.Commit import Commit
+    from model.objects.File import File
+    from model.objects.Version import Version
+    from model.objects.FeatureValue import FeatureValue
+    from model.objects.NGramVector import NGramVector
+    from model.objects.UpcomingBugsForVersion import UpcomingBugsForVersion
+
+    with DB.session_scope() as session:
+        session.add(Repository(id=1, name='repo'))
+        session.add_all([File(id='f%i' % i, repository_id=1, language='JAVA') for i in range(2)])
+        version_number = 0
+        for c, timestamp in enumerate(COMMIT_TIMESTAMPS):
+            session.add(Commit(id='c%i' % c, repository_id=1, timestamp=timestamp))
+            for f in range(2):
+                version_number += 1
+                version_id = 'v%i' % version_number
+                session.add(Version(id=version_id, file_id='f%i' % f, commit_id='c%i' % c, deleted=False))
+                session.add(UpcomingBugsForVersion(version_id=version_id, commit_id='c%i' % c,
+                                                   month_bugs=version_number % 2, sixmonth_bugs=version_number,
+                                                   year_bugs=2 * version_number))
+                for feature_number in (4, 3, 2, 1):
+                    feature_id = 'F%i' % feature_number
+                    if (version_id, feature_id) == NULL_FEATURE:
+                        session.add(FeatureValue(feature_id=feature_id, version_id=version_id, value=None))
+                    elif (version_id, feature_id) != MISSING_FEATURE:
+                        session.add(FeatureValue(feature_id=feature_id, version_id=version_id,
+                                                 value=get_feature_value(version_number, feature_number)))
+                session.add(NGramVector(version_id=version_id, ngram_size=1, ngram_level=1, vector_size=3,
+                                        ngram_values="%i,0,%i" % (version_number, f)))
+        session.commit()
+
+
+def setUpModule():
+    global temp_directory
+    temp_directory = tempfile.mkdtemp()
+    Config.database_dialect = 'sqlite'
+    Config.database_name = os.path.join(temp_directory, 'test')
+    DB.reset()
+    DB.init_db()
+    populate_database()
+
+
+def tearDownModule():
+    DB.reset()
+    shutil.rmtree(temp_directory)
+
+
+def copy_database(name):
+    """ Copies the DB and uses the copy from now on. Returns the name of the original DB. """
+    original_name = Config.database_name
+    Config.database_name = os.path.join(temp_directory, name)
+    shutil.copy(original_name + '.db', Config.database_name + '.db')
+    DB.reset()
+    return original_name
+
+
+def get_rows(dataset):
+    data = dataset.data.toarray() if dataset.sparse else dataset.data
+    return data.tolist()
+
+
+class DatasetLoadersTestCase(unittest.TestCase):
+    def test_features_are_placed_by_feature_id(self):
+        expected = [[0.0 if ('v%i' % v, 'F%i' % f) == MISSING_FEATURE else get_feature_value(v, f) for f in (4, 1)]
+                    for v in range(1, 9)]
+        for loader_args in ({}, {'bulk_load': True}, {'chunk_size': 3}):
+            dataset = Dataset.get_dataset_from_db('repo', START, END, ['F4', 'F1'], 'MONTH', **loader_args)
+            self.assertEqual(get_rows(dataset), expected)
+
+    def test_null_values_are_zero(self):
+        expected = [[0.0 if ('v%i' % v, 'F%i' % f) == NULL_FEATURE else get_feature_value(v, f) for f in (3, 2)]
+                    for v in range(1, 9)]
+        for loader_args in ({}, {'bulk_load': True}, {'chunk_size': 3}):
+            dataset = Dataset.get_dataset_from_db('repo', START, END, ['F3', 'F2'], 'MONTH', **loader_args)
+            self.assertEqual(get_rows(dataset), expected)
+
+    def test_chunked_load_equals_unchunked_load(self):
+        # The range starts exactly at a commit and the chunks end exactly at commits
+        start = COMMIT_TIMESTAMPS[1]
+        expected = Dataset.get_dataset_from_db('repo', start, END, ['F1', 'F4'], 'MONTH', [1], [1])
+        self.assertEqual(expected.data.shape, (6, 5))
+        for chunk_size in (1, 2, 4, 6, 10):
+            chunked = Dataset.get_dataset_from_db('repo', start, END, ['F1', 'F4'], 'MONTH', [1], [1],
+                                                  chunk_size=chunk_size)
+            self.assertEqual(get_rows(chunked), get_rows(expected))
+            self.assertEqual(chunked.target.tolist(), expected.target.tolist())
+            self.assertEqual(chunked.timestamps.tolist(), expected.timestamps.tolist())
+
+    def test_range_partitions(self):
+        with DB.session_scope() as session:
+            repository = Dataset.get_repository_by_name(session, 'repo')
+            self.assertEqual(Dataset.get_range_partitions(session, repository, START, END, 2),
+                             [(START, COMMIT_TIMESTAMPS[2]), (COMMIT_TIMESTAMPS[2], END)])
+            self.assertEqual(Dataset.get_range_partitions(session, repository, START, END, 4),
+                             [(START, COMMIT_TIMESTAMPS[1]), (COMMIT_TIMESTAMPS[1], COMMIT_TIMESTAMPS[2]),
+                              (COMMIT_TIMESTAMPS[2], COMMIT_TIMESTAMPS[3]), (COMMIT_TIMESTAMPS[3], END)])
+            # The versions of a commit can't be split, so there are fewer sub-ranges than requested
+            self.assertEqual(len(Dataset.get_range_partitions(session, repository, START, END, 8)), 5)
+            self.assertEqual(Dataset.get_range_partitions(session, repository, END, END + datetime.timedelta(1), 2),
+                             [])
+
+    def test_parallel_load_equals_serial_load(self):
+        expected = Dataset.get_dataset_from_db('repo', START, END, ['F1', 'F4'], 'MONTH', [1], [1])
+        dataset = Dataset.get_dataset_from_db('repo', START, END, ['F1', 'F4'], 'MONTH', [1], [1], processes=3)
+        self.assertEqual(get_rows(dataset), get_rows(expected))
+        self.assertEqual(dataset.timestamps.tolist(), expected.timestamps.tolist())
+
+    def test_cached_superset_equals_direct_load(self):
+        cache_directory = tempfile.mkdtemp()
+        try:
+            Dataset.get_dataset('repo', START, END, ['F2'], 'MONTH', cache=True, cache_directory=cache_directory)
+            for feature_list in (['F1', 'F2'], ['F3', 'F1'], ['F4', 'F2']):
+                cached = Dataset.get_dataset('repo', START, END, feature_list, 'MONTH', cache=True,
+                                             cache_directory=cache_directory)
+                direct = Dataset.get_dataset_from_db('repo', START, END, feature_list, 'MONTH')
+                self.assertEqual(get_rows(cached), get_rows(direct))
+        finally:
+            shutil.rmtree(cache_directory)
+
+    def test_refreshed_cache_equals_direct_load(self):
+        cache_directory = tempfile.mkdtemp()
+        try:
+            Dataset.get_dataset('repo', START, datetime.datetime(2015, 2, 1), ['F4', 'F2'], 'MONTH', cache=True,
+                                cache_directory=cache_directory)
+            cached = Dataset.get_dataset('repo', START, END, ['F2', 'F4'], 'MONTH', cache=True,
+                                         cache_directory=cache_directory)
+            direct = Dataset.get_dataset_from_db('repo', START, END, ['F2', 'F4'], 'MONTH')
+            self.assertEqual(get_rows(cached), get_rows(direct))
+        finally:
+            shutil.rmtree(cache_directory)
+
+
+class UnmigratedDatabaseTestCase(unittest.TestCase):
+    """ Loads from a copy of the DB, in which the ngram vectors were not migrated by db_tools.py migrate-ngrams. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.original_database_name = copy_database('unmigrated')
+        connection = sqlite3.connect(Config.database_name + '.db')
+        connection.execute("ALTER TABLE ngram_vector DROP COLUMN ngram_blob")
+        connection.commit()
+        connection.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        Config.database_name = cls.original_database_name
+        DB.reset()
+
+    def test_loaders_read_text_encoded_ngram_vectors(self):
+        self.assertFalse(Dataset.has_ngram_blob_column(DB.get_engine()))
+        expected = [[get_feature_value(v, 1), v, 0.0, (v - 1) % 2] for v in range(1, 9)]
+        for loader_args in ({}, {'eager_load': True}, {'bulk_load': True}, {'chunk_size': 3}):
+            dataset = Dataset.get_dataset_from_db('repo', START, END, ['F1'], 'MONTH', [1], [1], **loader_args)
+            self.assertEqual(get_rows(dataset), expected)
+
+
+class PackedFeatureVectorsTestCase(unittest.TestCase):
+    """ Loads from a copy of the DB with packed feature vectors, to which feature values were added afterwards. """
+
+    @classmethod
+    def setUpClass(cls):
+        import db_tools
+        from model.objects.FeatureValue import FeatureValue
+        from model.objects.VersionFeatureVector import FeatureVectorColumn
+
+        cls.original_database_name = copy_database('packed')
+        with DB.session_scope() as session:
+            feature_positions, new_feature_ids = db_tools.update_feature_vector_columns(session)
+            version_ids = db_tools.get_outdated_feature_vector_versions(session, new_feature_ids)
+            db_tools.pack_feature_vectors(session, version_ids, feature_positions)
+            # A value of a packed feature, which was missing when the vectors were packed
+            session.add(FeatureValue(feature_id=MISSING_FEATURE[1], version_id=MISSING_FEATURE[0], value=-1.0))
+            # A feature which was added to the dictionary after the vectors were packed
+            session.add(FeatureVectorColumn(feature_id='F5', position=len(feature_positions)))
+            session.add(FeatureValue(feature_id='F5', version_id='v2', value=-2.0))
+            session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        Config.database_name = cls.original_database_name
+        DB.reset()
+
+    def test_bulk_load_reads_values_added_after_packing(self):
+        expected = Dataset.get_dataset_from_db('repo', START, END, ['F5', 'F4', 'F1'], 'MONTH')
+        self.assertEqual(get_rows(expected)[2][1], -1.0)
+        self.assertEqual(get_rows(expected)[1][0], -2.0)
+        with self.assertLogs(level='WARNING'):
+            dataset = Dataset.get_dataset_from_db('repo', START, END, ['F5', 'F4', 'F1'], 'MONTH', bulk_load=True)
+        self.assertEqual(get_rows(dataset), get_rows(expected))
+
+
+class VersionAddedWhileLoadingTestCase(unittest.TestCase):
+    """ Adds a version to a copy of the DB right after the bulk loader read the versions of the dataset. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.original_database_name = copy_database('added')
+
+    @classmethod
+    def tearDownClass(cls):
+        Config.database_name = cls.original_database_name
+        DB.reset()
+
+    def add_version(self):
+        from model.objects.Commit import Commit
+        from model.objects.Version import Version
+        from model.objects.FeatureValue import FeatureValue
+        from model.objects.NGramVector import NGramVector
+        from model.objects.UpcomingBugsForVersion import UpcomingBugsForVersion
+
+        # A session of its own, which commits while the loader is running
+        session = Session(bind=create_engine('sqlite:///%s.db' % Config.database_name))
+        session.add(Commit(id='c9', repository_id=1, timestamp=datetime.datetime(2015, 3, 3)))
+        session.add(Version(id='v9', file_id='f0', commit_id='c9', deleted=False))
+        session.add(UpcomingBugsForVersion(version_id='v9', commit_id='c9', month_bugs=0, sixmonth_bugs=0,
+                                           year_bugs=0))
+        session.add(FeatureValue(feature_id='F1', version_id='v9', value=1.0))
+        session.add(NGramVector(version_id='v9', ngram_size=1, ngram_level=1, vector_size=3, ngram_values="1,1,1"))
+        session.commit()
+        session.close()
+
+    def test_bulk_load_skips_added_version(self):
+        expected = Dataset.get_dataset_from_db('repo', START, END, ['F1', 'F2'], 'MONTH', [1], [1])
+        get_version_targets_bulk = Dataset.get_version_targets_bulk
+
+        def get_version_targets_and_add_version(*args):
+            result = get_version_targets_bulk(*args)
+            self.add_version()
+            return result
+
+        with mock.patch.object(Dataset, 'get_version_targets_bulk', side_effect=get_version_targets_and_add_version):
+            dataset = Dataset.get_dataset_from_db('repo', START, END, ['F1', 'F2'], 'MONTH', [1], [1],
+                                                  bulk_load=True)
+        self.assertEqual(get_rows(dataset), get_rows(expected))
+        self.assertEqual(Dataset.get_dataset_from_db('repo', START, END, ['F1'], 'MONTH').data.shape[0], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
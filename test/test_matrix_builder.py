@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+from scipy.sparse.csr import csr_matrix
+
+from ml.MatrixBuilder import MatrixBuilder
+
+
+class MatrixBuilderTestCase(unittest.TestCase):
+    def test_dense_and_sparse_are_equal(self):
+        builder = MatrixBuilder((3, 4), capacity=1)
+        builder.add(0, 1, 2.0)
+        builder.add(0, 2, 0)
+        builder.add_row(1, [0, 3], [1.0, 5.0])
+        builder.add_entries([2, 2], [1, 2], [7.0, 8.0])
+
+        expected = np.array([
+            [0.0, 2.0, 0.0, 0.0],
+            [1.0, 0.0, 0.0, 5.0],
+            [0.0, 7.0, 8.0, 0.0],
+        ])
+        sparse = builder.to_matrix(sparse=True)
+        self.assertEqual(type(sparse), csr_matrix)
+        self.assertTrue(np.array_equal(sparse.toarray(), expected))
+        self.assertTrue(np.array_equal(builder.to_matrix(sparse=False), expected))
+
+    def test_duplicate_entries_are_summed(self):
+        builder = MatrixBuilder((1, 2))
+        builder.add(0, 1, 2.0)
+        builder.add(0, 1, 3.0)
+        self.assertEqual(builder.to_csr()[0, 1], 5.0)
+        self.assertEqual(builder.to_dense()[0, 1], 5.0)
+
+    def test_growing(self):
+        builder = MatrixBuilder((1000, 1), capacity=2)
+        builder.add_entries(np.arange(1000), np.zeros(1000), np.ones(1000))
+        self.assertEqual(builder.size, 1000)
+        self.assertEqual(builder.to_dense().sum(), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -236,5 +236,38 @@ class TestRbfSVR(ModelTestCase):
 
         self._test_dataset(model, train_dataset, test_dataset, 0, title="SVR with RBF kernel, scaled CV on poly dataset")
 
+
+class TestMultiTarget(unittest.TestCase):
+    def test_multi_target_equals_single_targets(self):
+        target_ids = ["MONTH", "SIXMONTHS", "YEAR"]
+        for model_type in (Model.MODEL_TYPE_LINREG, Model.MODEL_TYPE_RIDREG):
+            train_dataset = test_datasets.get_simple_linear_train_dataset()
+            train_dataset.target_id = "MONTH"
+            train_dataset.targets = np.column_stack(
+                [train_dataset.target, 2 * train_dataset.target, train_dataset.target + 1])
+
+            models = Model.train_multi_target_model(
+                Model.create_model(model_type, feature_scaling=True), train_dataset, target_ids)
+            for target_id in target_ids:
+                model = Model.train_model(
+                    Model.create_model(model_type, feature_scaling=True), train_dataset.select_target(target_id))
+                self.assertTrue(np.allclose(models[target_id].predict(train_dataset.data),
+                                            model.predict(train_dataset.data)))
+
+
+class TestSampleWeight(unittest.TestCase):
+    def test_collapsed_dataset_equals_full_dataset(self):
+        for model_type in (Model.MODEL_TYPE_LINREG, Model.MODEL_TYPE_RIDREG):
+            train_dataset = test_datasets.get_simple_linear_train_dataset()
+            train_dataset.target_id = "MONTH"
+            train_dataset.targets = np.column_stack([train_dataset.target] * 3)
+            collapsed_dataset = train_dataset.collapse_duplicates()
+            self.assertEqual(collapsed_dataset.data.shape[0], 4)
+
+            model = Model.train_model(Model.create_model(model_type), train_dataset)
+            collapsed_model = Model.train_model(Model.create_model(model_type), collapsed_dataset)
+            self.assertTrue(np.allclose(model.predict(train_dataset.data), collapsed_model.predict(train_dataset.data)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from ml import NGramCodec
+
+
+class NGramCodecTestCase(unittest.TestCase):
+    def test_decode_text_batch(self):
+        values, offsets = NGramCodec.decode_text_batch(["1,0,3", "", "0,0", "12"])
+        self.assertTrue(np.array_equal(values, [1, 0, 3, 0, 0, 12]))
+        self.assertTrue(np.array_equal(offsets, [0, 3, 3, 5, 6]))
+
+    def test_decode_text_batch_nonzero(self):
+        vector_indices, positions, values = NGramCodec.decode_text_batch_nonzero(["1,0,3", "0,0", "0,7"])
+        self.assertTrue(np.array_equal(vector_indices, [0, 0, 2]))
+        self.assertTrue(np.array_equal(positions, [0, 2, 1]))
+        self.assertTrue(np.array_equal(values, [1, 3, 7]))
+
+    def test_decode_text_batch_invalid(self):
+        with self.assertRaises(ValueError):
+            NGramCodec.decode_text_batch(["1,a,3"])
+
+    def test_blob_round_trip(self):
+        mostly_zero = np.zeros(1000, dtype=np.int64)
+        mostly_zero[[3, 500]] = [2, 70000]
+        for ngram_vector, encoding in ((np.arange(10), NGramCodec.ENCODING_DENSE_UINT16),
+                                       (np.arange(10) * 10000, NGramCodec.ENCODING_DENSE_UINT32),
+                                       (mostly_zero, NGramCodec.ENCODING_SPARSE)):
+            ngram_blob = NGramCodec.encode_blob(ngram_vector)
+            self.assertEqual(ngram_blob[0], encoding)
+            self.assertTrue(np.array_equal(NGramCodec.decode_blob(ngram_blob), ngram_vector))
+
+    def test_decode_batch_nonzero_mixed(self):
+        vector_indices, positions, values = NGramCodec.decode_batch_nonzero(
+            ["1,0,3", None, "0,7"],
+            [None, NGramCodec.encode_blob([0, 5]), None])
+        entries = sorted(zip(vector_indices, positions, values))
+        self.assertEqual(entries, [(0, 0, 1), (0, 2, 3), (1, 1, 5), (2, 1, 7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
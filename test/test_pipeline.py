@@ -0,0 +1,74 @@
+import unittest
+from unittest import mock
+
+import test_datasets
+import numpy as np
+
+import ml_pipeline
+from ml import Model, Reporting
+from utils import Config
+
+
+def get_train_dataset():
+    dataset = test_datasets.get_simple_linear_train_dataset()
+    dataset.target_id = "MONTH"
+    dataset.targets = np.column_stack([dataset.target] * 3)
+    return dataset
+
+
+class TestTrainingReport(unittest.TestCase):
+    CONFIG_NAMES = ['dataset_collapse_duplicates', 'dataset_zero_target_sample_rate',
+                    'dataset_zero_target_sample_seed', 'ml_log_transform_target', 'reporting_display',
+                    'reporting_save']
+
+    def setUp(self):
+        self.config = {name: getattr(Config, name) for name in self.CONFIG_NAMES}
+        Config.ml_log_transform_target = False
+        Config.reporting_display = False
+        Config.reporting_save = False
+
+    def tearDown(self):
+        for name, value in self.config.items():
+            setattr(Config, name, value)
+
+    def get_training_report(self, model, train_dataset):
+        """ Evaluates a model and returns the arguments of its training report. """
+        with mock.patch.object(ml_pipeline, 'Scoreboard'), \
+                mock.patch.object(Reporting, 'Report', wraps=Reporting.Report) as report:
+            ml_pipeline.evaluate_model(model, train_dataset, test_datasets.get_simple_linear_test_dataset())
+        training_calls = [call for call in report.call_args_list if call[0][2] == "Training"]
+        self.assertEqual(len(training_calls), 1)
+        return training_calls[0][0]
+
+    def test_training_report_of_collapsed_dataset_uses_weights(self):
+        Config.dataset_collapse_duplicates = True
+        Config.dataset_zero_target_sample_rate = None
+        train_dataset = get_train_dataset()
+        reduced_dataset = ml_pipeline.reduce_train_dataset(train_dataset)
+        self.assertEqual(reduced_dataset.data.shape[0], 4)
+        model = Model.train_model(Model.create_model(Model.MODEL_TYPE_LINREG), reduced_dataset)
+
+        ground_truth, predicted, _ = self.get_training_report(model, train_dataset)
+        self.assertEqual(len(ground_truth), 10)
+        weighted_squared_error = np.average((model.predict(reduced_dataset.data) - reduced_dataset.target) ** 2,
+                                            weights=reduced_dataset.sample_weight)
+        self.assertAlmostEqual(Reporting.get_mean_squared_error(ground_truth, predicted), weighted_squared_error)
+
+    def test_training_report_of_subsampled_dataset_uses_all_versions(self):
+        Config.dataset_collapse_duplicates = False
+        Config.dataset_zero_target_sample_rate = 0.4
+        Config.dataset_zero_target_sample_seed = 1
+        train_dataset = get_train_dataset()
+        reduced_dataset = ml_pipeline.reduce_train_dataset(train_dataset)
+        self.assertEqual(reduced_dataset.data.shape[0], 7)
+        self.assertEqual(reduced_dataset.sample_weight.tolist(), [2.5, 2.5, 1, 1, 1, 1, 1])
+        self.assertEqual(train_dataset.data.shape[0], 10)
+        model = Model.train_model(Model.create_model(Model.MODEL_TYPE_LINREG), reduced_dataset)
+
+        ground_truth, predicted, _ = self.get_training_report(model, train_dataset)
+        self.assertTrue(np.array_equal(ground_truth, train_dataset.target))
+        self.assertTrue(np.allclose(predicted, model.predict(train_dataset.data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from ml import Predict
+from ml.Dataset import Dataset
+
+
+def get_dataset(target, sample_weight=None):
+    dataset = Dataset(1, len(target), ["F1"], "MONTH", datetime.datetime(2015, 1, 1), datetime.datetime(2015, 2, 1))
+    dataset.target = np.array(target, dtype=np.float64)
+    dataset.sample_weight = None if sample_weight is None else np.array(sample_weight, dtype=np.float64)
+    return dataset
+
+
+class PredictTestCase(unittest.TestCase):
+    def test_median_of_integer_weights_equals_repeated_median(self):
+        target = [5.0, 1.0, 3.0, 2.0]
+        for sample_weight in ([1, 1, 1, 1], [2, 1, 1, 3], [1, 4, 2, 1], [0, 2, 1, 1]):
+            prediction = Predict.predict_median(get_dataset(target, sample_weight), 2)
+            self.assertEqual(prediction.tolist(), [np.median(np.repeat(target, sample_weight))] * 2)
+
+    def test_median_of_fractional_weights(self):
+        target = [5.0, 1.0, 3.0, 2.0]
+        # The weights of subsampled rows are fractional. Truncating them would drop the second row.
+        self.assertEqual(Predict.predict_median(get_dataset(target, [1.5, 0.5, 2.5, 1.5]), 1).tolist(), [3.0])
+        self.assertEqual(Predict.predict_median(get_dataset(target, [0.4, 2.5, 0.6, 1.5]), 1).tolist(), [1.5])
+        self.assertEqual(Predict.predict_median(get_dataset(target, [0.1, 0.1, 0.1, 0.1]), 1).tolist(), [2.5])
+
+    def test_median_without_weights(self):
+        self.assertEqual(Predict.predict_median(get_dataset([5.0, 1.0, 3.0, 2.0]), 1).tolist(), [2.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,6 +11,15 @@ database_user_password = None
 database_host = 'localhost'
 database_port = None
 database_eager_load = False
+database_bulk_load = False
+database_stream_chunk_size = None
+database_processes = None
+database_load_strategy = None
+database_instrumentation = False
+database_pool_size = None
+database_max_overflow = None
+database_pool_pre_ping = False
+database_pool_recycle = None
 
 # Logging options
 logging_level = 'DEBUG'
@@ -36,7 +45,14 @@ repository_name = None
 # Dataset options
 dataset_cache = False
 dataset_sparse = False
+dataset_dtype = None
+dataset_prune_columns = False
+dataset_collapse_duplicates = False
+dataset_zero_target_sample_rate = None
+dataset_zero_target_sample_seed = None
 dataset_cache_dir = None
+dataset_cache_size_budget_mb = None
+dataset_cache_tile_months = None
 dataset_target = None
 dataset_train_start = None
 dataset_train_end = None
@@ -44,6 +60,7 @@ dataset_test_start = None
 dataset_test_end = None
 dataset_ngram_sizes = None
 dataset_ngram_levels = None
+dataset_ngram_hash_size = None
 dataset_features = None
 
 # Machine learning options
@@ -51,6 +68,7 @@ ml_model = None
 ml_feature_scaling = False
 ml_polynomial_degree = 1
 ml_log_transform_target = False
+ml_multi_target = False
 ml_log_transform_base = 'n'
 ml_alpha = None
 ml_C = None
@@ -80,6 +98,15 @@ def read_config(config_file):
     _read_option(config, database_section, 'host')
     _read_option(config, database_section, 'port')
     _read_option(config, database_section, 'eager_load', value_type=TYPE_BOOLEAN)
+    _read_option(config, database_section, 'bulk_load', value_type=TYPE_BOOLEAN)
+    _read_option(config, database_section, 'stream_chunk_size', value_type=TYPE_INT)
+    _read_option(config, database_section, 'processes', value_type=TYPE_INT)
+    _read_option(config, database_section, 'load_strategy')
+    _read_option(config, database_section, 'instrumentation', value_type=TYPE_BOOLEAN)
+    _read_option(config, database_section, 'pool_size', value_type=TYPE_INT)
+    _read_option(config, database_section, 'max_overflow', value_type=TYPE_INT)
+    _read_option(config, database_section, 'pool_pre_ping', value_type=TYPE_BOOLEAN)
+    _read_option(config, database_section, 'pool_recycle', value_type=TYPE_INT)
 
     logging_section = 'LOGGING'
     _read_option(config, logging_section, 'level')
@@ -105,7 +132,14 @@ def read_config(config_file):
     dataset_section = 'DATASET'
     _read_option(config, dataset_section, 'cache', value_type=TYPE_BOOLEAN)
     _read_option(config, dataset_section, 'sparse', value_type=TYPE_BOOLEAN)
-    _read_option(config, dataset_section, 'cache_dir', value_type=TYPE_BOOLEAN)
+    _read_option(config, dataset_section, 'dtype')
+    _read_option(config, dataset_section, 'prune_columns', value_type=TYPE_BOOLEAN)
+    _read_option(config, dataset_section, 'collapse_duplicates', value_type=TYPE_BOOLEAN)
+    _read_option(config, dataset_section, 'zero_target_sample_rate', value_type=TYPE_FLOAT)
+    _read_option(config, dataset_section, 'zero_target_sample_seed', value_type=TYPE_INT)
+    _read_option(config, dataset_section, 'cache_dir')
+    _read_option(config, dataset_section, 'cache_size_budget_mb', value_type=TYPE_INT)
+    _read_option(config, dataset_section, 'cache_tile_months', value_type=TYPE_INT)
     _read_option(config, dataset_section, 'target', optional=False)
     _read_option(config, dataset_section, 'train_start', optional=False, value_type=TYPE_DATE)
     _read_option(config, dataset_section, 'train_end', optional=False, value_type=TYPE_DATE)
@@ -113,6 +147,7 @@ def read_config(config_file):
     _read_option(config, dataset_section, 'test_end', optional=False, value_type=TYPE_DATE)
     _read_option(config, dataset_section, 'ngram_sizes', value_type=TYPE_INT_LIST)
     _read_option(config, dataset_section, 'ngram_levels', value_type=TYPE_INT_LIST)
+    _read_option(config, dataset_section, 'ngram_hash_size', value_type=TYPE_INT)
     _read_option(config, dataset_section, 'features', optional=False, value_type=TYPE_STR_LIST)
 
     ml_section = "ML"
@@ -121,6 +156,7 @@ def read_config(config_file):
     _read_option(config, ml_section, 'feature_scaling', value_type=TYPE_BOOLEAN)
     _read_option(config, ml_section, 'log_transform_target', value_type=TYPE_BOOLEAN)
     _read_option(config, ml_section, 'log_transform_base', value_type=TYPE_STR)
+    _read_option(config, ml_section, 'multi_target', value_type=TYPE_BOOLEAN)
     _read_option(config, ml_section, 'alpha', value_type=TYPE_FLOAT_LIST)
     _read_option(config, ml_section, 'C', target='ml_C', value_type=TYPE_FLOAT_LIST)
     _read_option(config, ml_section, 'cross_validation', value_type=TYPE_BOOLEAN)